@@ -0,0 +1,252 @@
+"""Time each stage of the ETL against synthetic master sheets, and record
+the results as JSON, so that runs can be compared between commits:
+
+    python -m benchmarks.run_benchmarks --rows 1000 10000 --output benchmark-results.json
+
+The OptOut and Loader stages need a PostgreSQL database (e.g., the
+container that the tests use), which they reach via `--database-uri`. They
+write to a `benchmark_pathways_program` table, which gets dropped at the
+end of the run, and never to `pathways_program`.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import time
+from datetime import datetime
+
+from sqlalchemy import Column, MetaData, Table, create_engine
+from sqlalchemy.dialects.postgresql.json import JSONB
+from sqlalchemy.types import TIMESTAMP, String
+
+from benchmarks.sheet_generator import generate_sheet
+from etl.loader import Loader
+from etl.parsed_sheet import ParsedSheet
+from etl.pathways_opt_out import OptOut
+from etl.transformers.dataframe_transformer import DataframeTransformer
+from etl.transformers.pathways_transformer import ConversionPool, PathwaysTransformer
+from etl.utils import json_codec
+from etl.utils.utils import make_dataframe_with_headers
+
+
+class FirstRunDataframeTransformer(DataframeTransformer):
+    """A DataframeTransformer that does not query the database, i.e., it
+    keeps all rows, as it does the first time the ETL runs."""
+
+    def _get_last_updated(self):
+        return None
+
+
+def time_stage(function, repeat, setup=None):
+    """Run `function` `repeat` times (after `setup`, if given), and return
+    the run times in seconds, along with the last return value."""
+    run_times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+
+        start = time.perf_counter()
+        result = function()
+        run_times.append(time.perf_counter() - start)
+
+    return run_times, result
+
+
+def get_json_codecs():
+    """Return the JSON codecs to compare: the standard library, and orjson
+    if it is installed."""
+    codecs = [json_codec.get_codec(json_codec.StdlibCodec.name)]
+    try:
+        codecs.append(json_codec.get_codec(json_codec.OrjsonCodec.name))
+    except ImportError:
+        pass
+
+    return codecs
+
+
+def get_commit():
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_benchmark_table(engine):
+    table = Table(
+        "benchmark_pathways_program",
+        MetaData(),
+        Column("id", String, primary_key=True),
+        Column("updated_at", TIMESTAMP),
+        Column("pathways_program", JSONB),
+    )
+    table.drop(bind=engine, checkfirst=True)
+    table.create(bind=engine)
+
+    return table
+
+
+def run_benchmarks(row_counts, repeat=3, workers=None, engine=None):
+    results = []
+
+    def record(row_count, stage, run_times, rows_out):
+        results.append(
+            {
+                "rows": row_count,
+                "stage": stage,
+                "best_seconds": min(run_times),
+                "run_seconds": run_times,
+                "rows_out": rows_out,
+            }
+        )
+        print(f"{row_count:>9} rows  {stage:<40} {min(run_times):10.3f}s")
+
+    table = make_benchmark_table(engine) if engine is not None else None
+    # Like the runner, start the conversion processes once, rather than in every timed run.
+    pool = ConversionPool(workers) if workers and workers > 1 else None
+
+    for row_count in row_counts:
+        sheet = generate_sheet(row_count)
+
+        run_times, df = time_stage(lambda: make_dataframe_with_headers(sheet), repeat)
+        record(row_count, "make_dataframe_with_headers", run_times, len(df))
+
+        parsed_sheet = ParsedSheet.from_list(sheet)
+        run_times, df = time_stage(
+            lambda: FirstRunDataframeTransformer(
+                sheet=parsed_sheet, engine=engine
+            ).transform(),
+            repeat,
+        )
+        record(row_count, "DataframeTransformer.transform", run_times, len(df))
+
+        run_times, pathways_df = time_stage(
+            lambda: PathwaysTransformer(dataframe=df).pathways_transform(pool=pool),
+            repeat,
+        )
+        record(
+            row_count,
+            "PathwaysTransformer.pathways_transform",
+            run_times,
+            len(pathways_df),
+        )
+
+        documents = pathways_df["pathways_program"].tolist()
+        for codec in get_json_codecs():
+            run_times, texts = time_stage(
+                lambda: [
+                    codec.dumps(document, canonical=True) for document in documents
+                ],
+                repeat,
+            )
+            record(row_count, f"json_codec.dumps ({codec.name})", run_times, len(texts))
+
+            run_times, loaded = time_stage(
+                lambda: [codec.loads(text) for text in texts], repeat
+            )
+            record(
+                row_count, f"json_codec.loads ({codec.name})", run_times, len(loaded)
+            )
+
+        if table is None:
+            continue
+
+        def truncate():
+            with engine.begin() as connection:
+                connection.execute(table.delete())
+
+        loader = Loader(engine=engine)
+        run_times, loaded_ids = time_stage(
+            lambda: loader.load_data(
+                dataframe=pathways_df, metadata_table=table, primary_key="id"
+            ),
+            repeat,
+            setup=truncate,
+        )
+        record(row_count, "Loader.load_data", run_times, len(loaded_ids))
+
+        # Drop 5% of the rows from the sheet, so that OptOut has programs to delete.
+        kept_sheet = ParsedSheet.from_list(sheet[: len(sheet) - len(sheet) // 20])
+
+        def reload():
+            loader.load_data(
+                dataframe=pathways_df, metadata_table=table, primary_key="id"
+            )
+
+        def opt_out():
+            opt_out = OptOut(
+                google_sheet_as_list=kept_sheet, programs_table=table, engine=engine
+            )
+            deleted_ids = opt_out.remove_deleted_programs()
+            return deleted_ids + opt_out.remove_programs_not_marked_for_pathways()
+
+        run_times, removed_ids = time_stage(opt_out, repeat, setup=reload)
+        record(row_count, "OptOut", run_times, len(removed_ids))
+
+    if table is not None:
+        table.drop(bind=engine)
+    if pool is not None:
+        pool.close()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the stages of the ETL.")
+    parser.add_argument(
+        "--rows",
+        type=int,
+        nargs="+",
+        default=[1000, 10000],
+        help="the sizes of the synthetic sheets, e.g., 1000 10000 100000 1000000",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="the number of runs per stage"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="the number of processes that convert programs to Pathways JSON-LD",
+    )
+    parser.add_argument(
+        "--database-uri",
+        help="a PostgreSQL database for the OptOut and Loader stages (skipped without it)",
+    )
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    engine = (
+        create_engine(
+            args.database_uri,
+            json_serializer=json_codec.dumps,
+            json_deserializer=json_codec.loads,
+        )
+        if args.database_uri
+        else None
+    )
+    results = run_benchmarks(
+        args.rows, repeat=args.repeat, workers=args.workers, engine=engine
+    )
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(
+                {
+                    "commit": get_commit(),
+                    "created_at": datetime.utcnow().isoformat(),
+                    "python": platform.python_version(),
+                    "workers": args.workers,
+                    "results": results,
+                },
+                output_file,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
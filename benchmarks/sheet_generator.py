@@ -0,0 +1,177 @@
+import random
+import uuid
+from datetime import datetime, timedelta
+
+# The headers of the master sheet (see `google_sheet_data` in tests/conftest.py).
+HEADERS = [
+    "Timestamp",
+    "Your email address",
+    "Goodwill Member Name",
+    "Organization URL",
+    "Organization Address",
+    "Program Name",
+    "Program description",
+    "Program ID",
+    "Program Status",
+    "Program Category",
+    "Population(s) Targeted",
+    "Goal/Outcome",
+    "Time Investment",
+    "Should this program be available in Google Pathways?",
+    "URL of Program",
+    "Program Address (if different from organization address)",
+    "Contact phone number for program",
+    "CIP Code",
+    "Application Deadline",
+    "Total cost of the program (in dollars)",
+    "Duration / Time to complete",
+    "Total Units",
+    "Unit Cost (not required if total cost is given)",
+    "Format",
+    "Timing",
+    "Start date(s)",
+    "End Date(s)",
+    "Credential level earned",
+    "Accreditation body name",
+    "What certification (exam), license, or certificate (if any) does this program prepare you for or give you?",
+    "What occupations/jobs does the training prepare you for?",
+    "Apprenticeship or Paid Training Available",
+    "If yes, average hourly wage paid to student",
+    "Incentives",
+    "Average ANNUAL salary post-graduation",
+    "Average HOURLY wage post-graduation",
+    "Eligible groups",
+    "Maximum yearly household income to be eligible",
+    "HS diploma required?",
+    "Other prerequisites",
+    "Anything else to add about the program?",
+    "Maximum Enrollment",
+    "Row Identifier (DO NOT EDIT)",
+]
+
+CITIES = [
+    ("Springfield", "MA", "01101"),
+    ("Shelbyville", "KY", "40065"),
+    ("Portland", "OR", "97201"),
+    ("Austin", "TX", "73301"),
+    ("Rockville", "MD", "20850"),
+    ("Denver", "CO", "80202"),
+    ("Tampa", "FL", "33601"),
+    ("Boise", "ID", "83702"),
+]
+STREETS = [
+    "Main Street",
+    "Grickle Grass Lane",
+    "Oak Avenue",
+    "Market Street",
+    "2nd Ave",
+]
+PROGRAMS = [
+    ("Youth Employment", "Job Skills Training", "Youth"),
+    ("Customer Service Academy", "Job Skills Training", "Adults"),
+    ("Forklift Certification", "Certificate/Credential", "Adults"),
+    ("Digital Skills", "Education", "Seniors"),
+    ("Medical Billing", "Certificate/Credential", "Adults"),
+    ("Reentry Pathways", "Job Skills Training", "Justice-involved individuals"),
+]
+DURATIONS = ["5 days", "6 weeks", "12 weeks", "3 months", "9 months", "160 hours", ""]
+ELIGIBLE_GROUPS = ["Youth", "Veterans", "Adults, Seniors", "Youth, Veterans", ""]
+
+
+def _make_address(rng):
+    city, state, zip_code = rng.choice(CITIES)
+    return f"{rng.randint(1, 400)} {rng.choice(STREETS)} {city}, {state} {zip_code}"
+
+
+def _make_dates(rng, start):
+    if rng.random() < 0.1:
+        return "Open Enrollment"
+
+    dates = [
+        (start + timedelta(days=rng.randint(0, 365))).strftime("%m/%d/%Y")
+        for _ in range(rng.randint(1, 3))
+    ]
+    return "; ".join(dates)
+
+
+def generate_row(rng, member_names, addresses, first_timestamp):
+    """Return one form response, as the Sheets API returns it: a list of
+    strings, without the trailing empty cells."""
+    timestamp = first_timestamp + timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+    program_name, program_category, population = rng.choice(PROGRAMS)
+    is_paid_training = rng.random() < 0.4
+    program_address_count = rng.choice([0, 0, 0, 1, 2])
+
+    row = [
+        timestamp.strftime("%m/%d/%Y %H:%M:%S"),
+        f"staff{rng.randint(1, 500)}@goodwill.test",
+        rng.choice(member_names),
+        "http://www.goodwill.test/",
+        rng.choice(addresses),
+        program_name,
+        f"{program_name} for {population.lower()}, with hands-on practice.",
+        str(rng.randint(1000, 9999)),
+        "Open",
+        program_category,
+        population,
+        "Employment, Career Advancement, Certificate/Credential/Degree",
+        f"{rng.randint(10, 400)} hours",
+        "Yes" if rng.random() < 0.9 else "No",
+        "http://www.goodwill.test/programs-and-services/",
+        " | ".join(rng.choice(addresses) for _ in range(program_address_count)),
+        f"{rng.randint(200, 999)}-555-{rng.randint(1000, 9999)}",
+        f"{rng.randint(10, 52)}.{rng.randint(1000, 9999)}",
+        (timestamp + timedelta(days=rng.randint(10, 90))).strftime("%m/%d/%Y"),
+        str(rng.choice([0, 0, 250, 1200, 4500])),
+        rng.choice(DURATIONS),
+        "",
+        "",
+        rng.choice(["In person", "Online", "Hybrid"]),
+        rng.choice(["Evenings, Weekends, Full-time", "Part-time", "Full-time"]),
+        _make_dates(rng, timestamp),
+        _make_dates(rng, timestamp + timedelta(days=60)),
+        "",
+        "",
+        "",
+        "N/A",
+        "Yes" if is_paid_training else "No",
+        str(rng.randint(9, 20)) if is_paid_training else "",
+        "",
+        str(rng.randint(22000, 60000)) if rng.random() < 0.5 else "",
+        "",
+        rng.choice(ELIGIBLE_GROUPS),
+        "",
+        rng.choice(["Yes", "No"]),
+        "",
+        "",
+        str(rng.randint(5, 60)) if rng.random() < 0.7 else "",
+        str(uuid.UUID(int=rng.getrandbits(128))),
+    ]
+
+    # A new response has no Row Identifier until a script assigns one, and the Sheets API drops trailing empty cells.
+    if rng.random() < 0.02:
+        row[-1] = ""
+        while row and row[-1] == "":
+            row.pop()
+
+    return row
+
+
+def generate_sheet(row_count, member_count=150, address_count=2000, seed=0):
+    """This function returns a synthetic master sheet as a list of lists
+    (i.e., the return value of `get_sheet_as_list` in Extractor), with
+    `row_count` rows after the headers.
+
+    The sheet mixes work-based and educational programs, multiple start
+    and end dates, pipe-separated program addresses, and ragged rows. The
+    same `seed` always gives the same sheet.
+    """
+    rng = random.Random(seed)
+    member_names = [f"Goodwill of Member {number}" for number in range(member_count)]
+    addresses = [_make_address(rng) for _ in range(address_count)]
+    first_timestamp = datetime(2020, 1, 1)
+
+    return [list(HEADERS)] + [
+        generate_row(rng, member_names, addresses, first_timestamp)
+        for _ in range(row_count)
+    ]
@@ -0,0 +1,115 @@
+from sqlalchemy import null
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql import select
+
+from etl.utils.utils import hash_pathways_program
+
+
+class ChangeDetector:
+    """This class enables skipping programs whose Pathways JSON-LD has not
+    changed since the last load.
+
+    The ETL stores a content hash of every program it loads in a side table
+    (`etl_program_hash`, one of the tables of the EtlState), which leaves the
+    `pathways_program` table (owned by the Google Pathways API) untouched.
+    The hashes of all programs in the database are read in one query, when
+    the class is instantiated.
+
+    Attributes:
+        engine: a SQLAlchemy engine
+        programs_table: a SQLAlchemy Table object that reflects the `pathways_program` table in the API database
+        state: the EtlState, which creates the `etl_program_hash` table (unless it is the state of a dry run)
+        hashes_table: a SQLAlchemy Table object for the `etl_program_hash` table
+        existing_hashes: a dict of {program id: content hash} for all programs in the database (the hash is None when unknown)
+        pending_hashes: a dict of {program id: content hash} for changed programs, which have yet to be loaded
+        unchanged_ids: a list of program ids, which `filter_unchanged` skipped (over all calls, e.g., one per chunk)
+    """
+
+    def __init__(self, engine, programs_table, state):
+        self.engine = engine
+        self.programs_table = programs_table
+        self.state = state
+        self.hashes_table = state.hashes_table
+        self.existing_hashes = self._load_existing_hashes()
+        self.pending_hashes = {}
+        self.unchanged_ids = []
+
+    def _load_existing_hashes(self):
+        """Get the content hash of every program in the database.
+
+        The query starts from `pathways_program`, so a hash left behind by
+        a deleted program never hides the program when it comes back.
+        """
+        join = self.programs_table.outerjoin(
+            self.hashes_table, self.programs_table.c.id == self.hashes_table.c.id
+        )
+        select_hashes = select(
+            [self.programs_table.c.id, self.hashes_table.c.content_hash]
+        ).select_from(join)
+
+        with self.engine.connect() as connection:
+            if not self.state.create_tables and not self.engine.dialect.has_table(
+                connection, self.hashes_table.name
+            ):
+                # No hashes yet: every program in the database counts as changed.
+                select_hashes = select([self.programs_table.c.id, null()])
+
+            return {
+                program_id: content_hash
+                for program_id, content_hash in connection.execute(select_hashes)
+            }
+
+    def filter_unchanged(self, dataframe):
+        """Filter out programs that would not change the database.
+
+        This function takes the return value of `pathways_transform`, and
+        returns only the rows that are new, or whose `pathways_program`
+        document differs from the loaded version.
+        """
+        content_hashes = dataframe["pathways_program"].map(hash_pathways_program)
+        unchanged = dataframe["id"].map(self.existing_hashes.get) == content_hashes
+
+        self.unchanged_ids += dataframe["id"][unchanged].tolist()
+        self.pending_hashes.update(
+            zip(dataframe["id"][~unchanged], content_hashes[~unchanged])
+        )
+
+        return dataframe[~unchanged]
+
+    def record_hashes(self, loaded_ids):
+        """Store the content hashes of programs that were loaded, i.e., the
+        return value of `Loader.load_data`, with one upsert."""
+        loaded_hashes = {
+            program_id: self.pending_hashes[program_id]
+            for program_id in loaded_ids
+            if program_id in self.pending_hashes
+        }
+        if not loaded_hashes:
+            return
+
+        sql_insert = postgresql.insert(self.hashes_table).values(
+            [
+                {"id": program_id, "content_hash": content_hash}
+                for program_id, content_hash in loaded_hashes.items()
+            ]
+        )
+        sql_upsert = sql_insert.on_conflict_do_update(
+            index_elements=["id"],
+            set_={"content_hash": sql_insert.excluded.content_hash},
+        )
+
+        with self.engine.begin() as connection:
+            connection.execute(sql_upsert)
+
+    def summarize(self, loaded_ids):
+        """Count the programs that were inserted, updated, and left
+        unchanged."""
+        updated_count = sum(
+            1 for program_id in loaded_ids if program_id in self.existing_hashes
+        )
+
+        return {
+            "inserted": len(loaded_ids) - updated_count,
+            "updated": updated_count,
+            "unchanged": len(self.unchanged_ids),
+        }
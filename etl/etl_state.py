@@ -0,0 +1,456 @@
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, MetaData, Table, func
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql import select
+from sqlalchemy.types import TIMESTAMP, Integer, String, Text
+
+from etl.utils import json_codec
+
+# The key of the watermark for all local Goodwills, which applies to rows without a "Goodwill Member Name".
+GLOBAL_WATERMARK = "*"
+
+# The key of the advisory lock that `EtlState.setup_tables` takes: any 64-bit key that no other lock uses (the shard locks use two 32-bit keys, which is another key space).
+SETUP_TABLES_LOCK_KEY = 0x657443
+
+# The status of a run in the `etl_run` table.
+RUN_RUNNING = "running"
+RUN_FINISHED = "finished"
+RUN_ABANDONED = "abandoned"
+
+
+class EtlState:
+    """This class persists the state of the ETL between runs, in tables of its
+    own in the Pathways database.
+
+    A watermark is the latest form "Timestamp" that the ETL has loaded,
+    for each local Goodwill ("Goodwill Member Name") and overall. Rows
+    with a Timestamp at or before the watermark have already been loaded.
+
+    Attributes:
+        engine: a SQLAlchemy engine
+        create_tables: whether `setup_tables` creates the state tables; a dry run does not, and reads around missing tables
+        watermarks_table: a SQLAlchemy Table object for the `etl_watermark` table
+        hashes_table: a SQLAlchemy Table object for the `etl_program_hash` table of the ChangeDetector
+    """
+
+    def __init__(self, engine, create_tables=True):
+        self.engine = engine
+        self.create_tables = create_tables
+        self.metadata = MetaData()
+        self.watermarks_table = Table(
+            "etl_watermark",
+            self.metadata,
+            Column("member_name", String, primary_key=True),
+            Column("last_updated", TIMESTAMP, nullable=False),
+        )
+        self.runs_table = Table(
+            "etl_run",
+            self.metadata,
+            Column("run_id", String, primary_key=True),
+            Column("status", String, nullable=False),
+            Column("started_at", TIMESTAMP, nullable=False),
+            Column("finished_at", TIMESTAMP),
+            # The WatermarkBounds of the run, as JSON.
+            Column("watermark_bounds", Text, nullable=False),
+        )
+        self.batches_table = Table(
+            "etl_run_batch",
+            self.metadata,
+            Column("run_id", String, primary_key=True),
+            Column("batch_number", Integer, primary_key=True),
+            # The transformed rows of the batch, as JSON.
+            Column("rows", Text, nullable=False),
+            Column("committed_at", TIMESTAMP),
+            Column("loaded_ids", Text),
+        )
+        self.shards_table = Table(
+            "etl_shard_run",
+            self.metadata,
+            Column("run_id", String, primary_key=True),
+            Column("shard", Integer, primary_key=True),
+            Column("shard_count", Integer, nullable=False),
+            Column("finished_at", TIMESTAMP, nullable=False),
+            # The counts and WatermarkBounds of the shard, as JSON.
+            Column("summary", Text, nullable=False),
+        )
+        # The content hash of every loaded program, see ChangeDetector.
+        self.hashes_table = Table(
+            "etl_program_hash",
+            self.metadata,
+            Column("id", String, primary_key=True),
+            Column("content_hash", String(64), nullable=False),
+        )
+
+    def setup_tables(self):
+        """Create the state tables, if needed. A process calls this once, at
+        startup, before any run (or shard worker) uses them: the workers of
+        a sharded run start together, and concurrent `CREATE TABLE`
+        statements for the same table fail, so the processes take turns
+        under an advisory lock."""
+        if not self.create_tables:
+            return
+
+        with self.engine.begin() as connection:
+            connection.execute(
+                select([func.pg_advisory_xact_lock(SETUP_TABLES_LOCK_KEY)])
+            )
+            self.metadata.create_all(bind=connection)
+
+    def get_watermarks(self):
+        """Return a dict of {member name: watermark}, which includes the
+        GLOBAL_WATERMARK; the dict is empty before the first load."""
+        select_watermarks = select(
+            [self.watermarks_table.c.member_name, self.watermarks_table.c.last_updated]
+        )
+
+        with self.engine.connect() as connection:
+            if not self.create_tables and not self.engine.dialect.has_table(
+                connection, self.watermarks_table.name
+            ):
+                return {}
+
+            return dict(connection.execute(select_watermarks).fetchall())
+
+    def advance_watermarks(self, watermarks):
+        """Store new watermarks, e.g., after a successful load. A watermark
+        never moves back in time."""
+        if not watermarks:
+            return
+
+        sql_insert = postgresql.insert(self.watermarks_table).values(
+            [
+                {"member_name": member_name, "last_updated": last_updated}
+                for member_name, last_updated in watermarks.items()
+            ]
+        )
+        sql_upsert = sql_insert.on_conflict_do_update(
+            index_elements=["member_name"],
+            set_={
+                "last_updated": func.greatest(
+                    self.watermarks_table.c.last_updated,
+                    sql_insert.excluded.last_updated,
+                )
+            },
+        )
+
+        with self.engine.begin() as connection:
+            connection.execute(sql_upsert)
+
+    def start_run(self, watermark_bounds, batches=None):
+        """Record a new run, along with the WatermarkBounds of its rows (whose
+        pending rows are the rows it is about to load), and, to be able to
+        resume it, a copy of the `batches` that it is about to load (a dict
+        of {batch number: list of rows}, see `Loader.make_batches`). Return
+        the RunCheckpoint of the run.
+
+        A run that was interrupted before gets abandoned: this run has
+        extracted and transformed the sheet again, so it supersedes it.
+        """
+        checkpoint = RunCheckpoint(state=self, run_id=uuid.uuid4().hex)
+
+        with self.engine.begin() as connection:
+            interrupted_runs = self.runs_table.c.status == RUN_RUNNING
+            connection.execute(
+                self.batches_table.delete().where(
+                    self.batches_table.c.run_id.in_(
+                        select([self.runs_table.c.run_id]).where(interrupted_runs)
+                    )
+                )
+            )
+            connection.execute(
+                self.runs_table.update()
+                .where(interrupted_runs)
+                .values(status=RUN_ABANDONED)
+            )
+
+            connection.execute(
+                self.runs_table.insert().values(
+                    run_id=checkpoint.run_id,
+                    status=RUN_RUNNING,
+                    started_at=datetime.utcnow(),
+                    watermark_bounds=json_codec.dumps(watermark_bounds.to_dict()),
+                )
+            )
+            if batches:
+                connection.execute(
+                    self.batches_table.insert(),
+                    [
+                        {
+                            "run_id": checkpoint.run_id,
+                            "batch_number": batch_number,
+                            "rows": json_codec.dumps(rows),
+                        }
+                        for batch_number, rows in batches.items()
+                    ],
+                )
+
+        return checkpoint
+
+    def get_interrupted_run(self):
+        """Return the RunCheckpoint of the latest run that did not finish,
+        or None."""
+        select_run = (
+            select([self.runs_table.c.run_id])
+            .where(self.runs_table.c.status == RUN_RUNNING)
+            .order_by(self.runs_table.c.started_at.desc())
+            .limit(1)
+        )
+
+        with self.engine.connect() as connection:
+            if not self.create_tables and not self.engine.dialect.has_table(
+                connection, self.runs_table.name
+            ):
+                return None
+
+            run_id = connection.execute(select_run).scalar()
+
+        return RunCheckpoint(state=self, run_id=run_id) if run_id else None
+
+    def finish_shard(self, run_id, shard, shard_count, summary):
+        """Record that the shard `shard` (of `shard_count`) of the sharded run
+        `run_id` has been loaded, along with its `summary` (a dict)."""
+        sql_insert = self.shards_table.insert().values(
+            run_id=run_id,
+            shard=shard,
+            shard_count=shard_count,
+            finished_at=datetime.utcnow(),
+            summary=json_codec.dumps(summary),
+        )
+
+        with self.engine.begin() as connection:
+            connection.execute(sql_insert)
+
+    def get_finished_shards(self, run_id):
+        """Return a dict of {shard: summary} of the finished shards of the
+        sharded run `run_id`."""
+        select_shards = select(
+            [self.shards_table.c.shard, self.shards_table.c.summary]
+        ).where(self.shards_table.c.run_id == run_id)
+
+        with self.engine.connect() as connection:
+            return {
+                shard: json_codec.loads(summary)
+                for shard, summary in connection.execute(select_shards)
+            }
+
+
+class RunCheckpoint:
+    """This class tracks the load of one run, batch by batch.
+
+    The Loader marks a batch as committed in the same transaction that
+    writes it (see `mark_committed`). If the process dies partway through
+    the load, `get_batches(committed=False)` returns the batches that are
+    left, from the copy that `EtlState.start_run` saved (if any), so that a
+    resumed run does not have to extract and transform the sheet again.
+
+    Attributes:
+        state: the EtlState that stores the run
+        run_id: the id of the run
+    """
+
+    def __init__(self, state, run_id):
+        self.state = state
+        self.run_id = run_id
+
+    def mark_committed(self, connection, batch_number, loaded_ids):
+        """Record that a batch has been loaded, with the primary keys of the
+        rows written, on the `connection` (i.e., in the transaction) that
+        loaded it."""
+        batches_table = self.state.batches_table
+        connection.execute(
+            batches_table.update()
+            .where(batches_table.c.run_id == self.run_id)
+            .where(batches_table.c.batch_number == batch_number)
+            .values(
+                committed_at=datetime.utcnow(), loaded_ids=json_codec.dumps(loaded_ids)
+            )
+        )
+
+    def get_batches(self, committed=None):
+        """Return an OrderedDict of {batch number: list of rows} of the run:
+        all batches, or only the committed (or uncommitted) ones."""
+        batches_table = self.state.batches_table
+        select_batches = (
+            select([batches_table.c.batch_number, batches_table.c.rows])
+            .where(batches_table.c.run_id == self.run_id)
+            .order_by(batches_table.c.batch_number)
+        )
+        if committed is True:
+            select_batches = select_batches.where(
+                batches_table.c.committed_at.isnot(None)
+            )
+        elif committed is False:
+            select_batches = select_batches.where(
+                batches_table.c.committed_at.is_(None)
+            )
+
+        with self.state.engine.connect() as connection:
+            return OrderedDict(
+                (batch_number, json_codec.loads(rows))
+                for batch_number, rows in connection.execute(select_batches)
+            )
+
+    def get_loaded_ids(self):
+        """Return the primary keys of the rows in the committed batches."""
+        batches_table = self.state.batches_table
+        select_loaded_ids = (
+            select([batches_table.c.loaded_ids])
+            .where(batches_table.c.run_id == self.run_id)
+            .where(batches_table.c.committed_at.isnot(None))
+            .order_by(batches_table.c.batch_number)
+        )
+
+        with self.state.engine.connect() as connection:
+            return [
+                loaded_id
+                for (loaded_ids,) in connection.execute(select_loaded_ids)
+                for loaded_id in json_codec.loads(loaded_ids)
+            ]
+
+    def get_watermark_bounds(self):
+        runs_table = self.state.runs_table
+        select_bounds = select([runs_table.c.watermark_bounds]).where(
+            runs_table.c.run_id == self.run_id
+        )
+
+        with self.state.engine.connect() as connection:
+            return WatermarkBounds.from_dict(
+                json_codec.loads(connection.execute(select_bounds).scalar())
+            )
+
+    def finish(self, loaded_ids, watermark_bounds=None):
+        """Advance the watermarks of the run, given the primary keys of the
+        rows that it loaded, mark it as finished, and drop the copy of its
+        batches.
+
+        `watermark_bounds` adds the bounds of rows that the run did not know
+        of when it started, e.g., the chunks of a Pipeline.
+        """
+        run_watermark_bounds = self.get_watermark_bounds()
+        if watermark_bounds is not None:
+            run_watermark_bounds.update(watermark_bounds)
+        run_watermark_bounds.resolve(loaded_ids)
+        self.state.advance_watermarks(run_watermark_bounds.get_watermarks())
+
+        runs_table = self.state.runs_table
+        batches_table = self.state.batches_table
+        with self.state.engine.begin() as connection:
+            connection.execute(
+                batches_table.delete().where(batches_table.c.run_id == self.run_id)
+            )
+            connection.execute(
+                runs_table.update()
+                .where(runs_table.c.run_id == self.run_id)
+                .values(status=RUN_FINISHED, finished_at=datetime.utcnow())
+            )
+
+
+class WatermarkBounds:
+    """This class computes the watermarks that a run may advance to, from the
+    outcome of its rows, for each local Goodwill and overall (the
+    GLOBAL_WATERMARK).
+
+    A row is done once it has been loaded, or has nothing to load (e.g.,
+    its program is unchanged, or not marked for Pathways). A row failed if
+    it was rejected by the converters, or could not be loaded: the next run
+    must pick it up again, so no watermark may reach its "Timestamp", even
+    if later rows are done.
+
+    The bounds of several parts of a run (e.g., the chunks of a Pipeline, or
+    the shards of a sharded run) combine with `update`.
+
+    Attributes:
+        latest_done: a dict of {member name: the latest Timestamp of the rows that are done}
+        earliest_failed: a dict of {member name: the earliest Timestamp of the rows that failed}
+        pending: a list of [program id, member name, Timestamp] of the rows that are yet to be loaded (see `resolve`)
+    """
+
+    def __init__(self, latest_done=None, earliest_failed=None, pending=None):
+        self.latest_done = latest_done or {}
+        self.earliest_failed = earliest_failed or {}
+        self.pending = pending or []
+
+    def add(self, member_name, timestamp, done):
+        """Add the outcome of a row."""
+        member_names = [GLOBAL_WATERMARK]
+        if member_name is not None:
+            member_names.append(member_name)
+
+        for member_name in member_names:
+            if done:
+                self.latest_done[member_name] = max(
+                    timestamp, self.latest_done.get(member_name, timestamp)
+                )
+            else:
+                self.earliest_failed[member_name] = min(
+                    timestamp, self.earliest_failed.get(member_name, timestamp)
+                )
+
+    def update(self, other):
+        """Combine the bounds of `other` into these bounds."""
+        for member_name, timestamp in other.latest_done.items():
+            self.add(member_name, timestamp, done=True)
+        for member_name, timestamp in other.earliest_failed.items():
+            self.add(member_name, timestamp, done=False)
+        self.pending += other.pending
+
+    def resolve(self, loaded_ids):
+        """Settle the outcome of the pending rows, given the primary keys of
+        the rows that were loaded."""
+        loaded_ids = set(loaded_ids)
+        for program_id, member_name, timestamp in self.pending:
+            self.add(member_name, timestamp, done=program_id in loaded_ids)
+        self.pending = []
+
+    def get_watermarks(self):
+        """Return a dict of {member name: watermark}: the latest Timestamp of
+        the rows that are done, kept just before the earliest Timestamp of
+        the rows that failed."""
+        watermarks = {}
+        for member_name, latest_done in self.latest_done.items():
+            earliest_failed = self.earliest_failed.get(member_name)
+            if earliest_failed is not None:
+                latest_done = min(
+                    latest_done, earliest_failed - timedelta(microseconds=1)
+                )
+            watermarks[member_name] = latest_done
+
+        return watermarks
+
+    def to_dict(self):
+        """Return the bounds as a dict that serializes to JSON."""
+        return {
+            "latest_done": {
+                member_name: timestamp.isoformat()
+                for member_name, timestamp in self.latest_done.items()
+            },
+            "earliest_failed": {
+                member_name: timestamp.isoformat()
+                for member_name, timestamp in self.earliest_failed.items()
+            },
+            "pending": [
+                [program_id, member_name, timestamp.isoformat()]
+                for program_id, member_name, timestamp in self.pending
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, bounds):
+        """Return the WatermarkBounds of a dict made by `to_dict`."""
+        return cls(
+            latest_done={
+                member_name: datetime.fromisoformat(timestamp)
+                for member_name, timestamp in bounds["latest_done"].items()
+            },
+            earliest_failed={
+                member_name: datetime.fromisoformat(timestamp)
+                for member_name, timestamp in bounds["earliest_failed"].items()
+            },
+            pending=[
+                [program_id, member_name, datetime.fromisoformat(timestamp)]
+                for program_id, member_name, timestamp in bounds["pending"]
+            ],
+        )
@@ -1,10 +1,8 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict
 
-from google.oauth2.service_account import Credentials
-from googleapiclient import discovery
-from googleapiclient.discovery import Resource
-from googleapiclient.errors import HttpError
-
 
 class Extractor:
     scopes = [
@@ -12,23 +10,151 @@ class Extractor:
         "https://www.googleapis.com/auth/documents.readonly",
     ]
 
-    def __init__(self, google_account_info: Dict, spreadsheet_id):
+    def __init__(
+        self,
+        google_account_info: Dict,
+        spreadsheet_id,
+        metrics=None,
+        discovery_cache=None,
+    ):
         self.google_account_info = google_account_info
         self.spreadsheet_id = spreadsheet_id
+        # A FileDiscoveryCache (optional), which saves fetching the Sheets discovery document on every run.
+        self.discovery_cache = discovery_cache
+        # A RunMetrics (optional), which records the latency of every API call.
+        self.metrics = metrics
+        # googleapi Resources are not thread-safe: each thread builds (and then reuses) its own.
+        self._thread_local = threading.local()
 
     def _build_googleapi_resource(self):
         """This function builds a googleapiclient Resource, i.e., an object
         that can interact with an api, such as Google sheets ("sheets").
 
         https://github.com/googleapis/google-api-python-client/blob/5c11b0a1b2658b26fe41b13ebd2e9e7b53c1ab01/googleapiclient/discovery.py#L170
+
+        The Google client libraries get imported here, rather than when
+        this module is imported, since they are slow to import.
         """
+        from google.oauth2.service_account import Credentials
+        from googleapiclient import discovery
+
         credentials = Credentials.from_service_account_info(
             self.google_account_info, scopes=self.scopes
         )
 
         return discovery.build(
-            "sheets", "v4", credentials=credentials, cache_discovery=False
+            "sheets",
+            "v4",
+            credentials=credentials,
+            cache_discovery=self.discovery_cache is not None,
+            cache=self.discovery_cache,
+        )
+
+    def _get_googleapi_resource(self):
+        if getattr(self._thread_local, "discovery_resource", None) is None:
+            self._thread_local.discovery_resource = self._build_googleapi_resource()
+
+        return self._thread_local.discovery_resource
+
+    def _execute(self, request):
+        if self.metrics is None:
+            return request.execute()
+
+        start = time.perf_counter()
+        try:
+            return request.execute()
+        finally:
+            self.metrics.record_sheets_api_call(time.perf_counter() - start)
+
+    def _get_values(self, row_range, spreadsheet_id=None):
+        """This function returns the values in a range of rows (e.g., "2:1001")
+        as a list of lists.
+
+        The googleapi Resource gets built once (per thread), and then
+        reused for every page.
+        """
+        request = (
+            self._get_googleapi_resource()
+            .spreadsheets()
+            .values()
+            .get(spreadsheetId=spreadsheet_id or self.spreadsheet_id, range=row_range)
+        )
+        results = self._execute(request)
+
+        return results.get("values", [])
+
+    def _batch_get_values(self, row_ranges, spreadsheet_id):
+        """This function returns the values in several ranges of rows as a list
+        of lists of lists, i.e., with one API call."""
+        request = (
+            self._get_googleapi_resource()
+            .spreadsheets()
+            .values()
+            .batchGet(spreadsheetId=spreadsheet_id, ranges=row_ranges)
         )
+        results = self._execute(request)
+
+        return [
+            value_range.get("values", [])
+            for value_range in results.get("valueRanges", [])
+        ]
+
+    def get_ranges(self, row_ranges):
+        """This function returns the values in several ranges of the Google
+        sheet (e.g., "1:1" and "C2:C") as a list of lists of lists, i.e.,
+        with one API call."""
+        return self._batch_get_values(row_ranges, self.spreadsheet_id)
+
+    def _get_row_count(self, spreadsheet_id):
+        """This function returns the number of rows in the grid of the first
+        sheet (i.e., the sheet that ranges such as "2:5001" read), blank
+        rows included."""
+        request = (
+            self._get_googleapi_resource()
+            .spreadsheets()
+            .get(
+                spreadsheetId=spreadsheet_id,
+                fields="sheets.properties.gridProperties.rowCount",
+            )
+        )
+        results = self._execute(request)
+
+        return results["sheets"][0]["properties"]["gridProperties"]["rowCount"]
+
+    def iter_rows(self, page_size=5000):
+        """This function yields the Google sheet row by row: first the
+        headers, and then the data rows.
+
+        A short first call reads the headers. Then, the data rows get read
+        in pages of `page_size` rows, up to the last row of the grid. Each
+        page is yielded as soon as it arrives, so the caller can start work
+        before the whole sheet is downloaded, and only one page sits in
+        memory at a time.
+        """
+        headers = self._get_values("1:1")
+        if not headers:
+            return
+
+        yield headers[0]
+
+        yield from self._iter_pages(self.spreadsheet_id, 2, page_size)
+
+    def _iter_pages(self, spreadsheet_id, start_row, page_size, row_count=None):
+        """This function yields the rows of a sheet from `start_row` to the
+        end of its grid (`row_count` rows), a page of `page_size` rows at a
+        time.
+
+        The paging is bounded by the size of the grid, rather than by the
+        first empty page: the service returns nothing for a range of blank
+        rows, which may well sit in the middle of a sheet.
+        """
+        if row_count is None:
+            row_count = self._get_row_count(spreadsheet_id)
+
+        while start_row <= row_count:
+            end_row = min(start_row + page_size - 1, row_count)
+            yield from self._get_values(f"{start_row}:{end_row}", spreadsheet_id)
+            start_row += page_size
 
     def get_sheet_as_list(self):
         """This function returns the Google sheet as a list of lists.
@@ -38,13 +164,100 @@ class Extractor:
         rows have 40 or fewer values. This occurs because the service
         does not read empty cells *at the end of rows*.
         """
-        discovery_resource = self._build_googleapi_resource()
+        return list(self.iter_rows())
 
-        results = (
-            discovery_resource.spreadsheets()
-            .values()
-            .get(spreadsheetId=self.spreadsheet_id, range="1:1000000")
-            .execute()
+    def _get_member_sheet(self, member_sheet_id, page_size):
+        """This function returns a local Goodwill sheet as a list of lists.
+
+        One `batchGet` call reads the headers and the first page of rows,
+        which covers most local sheets; larger sheets (by the size of their
+        grid) continue page by page.
+        """
+        headers, first_page = self._batch_get_values(
+            ["1:1", f"2:{page_size + 1}"], member_sheet_id
         )
+        if not headers:
+            return []
 
-        return results.get("values", [])
+        member_sheet = headers[:1] + first_page
+        row_count = self._get_row_count(member_sheet_id)
+        if row_count > page_size + 1:
+            member_sheet += self._iter_pages(
+                member_sheet_id, page_size + 2, page_size, row_count
+            )
+
+        return member_sheet
+
+    def _align_to_headers(self, member_sheet, headers):
+        """This function reorders the values in the rows of a local Goodwill
+        sheet, so they line up with `headers` (the master sheet headers).
+
+        Columns missing from the local sheet become empty cells, and (as
+        in the master sheet) empty cells at the end of rows are dropped.
+        """
+        if not member_sheet:
+            return []
+
+        member_headers = member_sheet[0]
+        positions = [
+            member_headers.index(header) if header in member_headers else None
+            for header in headers
+        ]
+
+        aligned_rows = []
+        for row in member_sheet[1:]:
+            aligned_row = [
+                row[position] if position is not None and position < len(row) else ""
+                for position in positions
+            ]
+            while aligned_row and aligned_row[-1] == "":
+                aligned_row.pop()
+
+            if aligned_row:
+                aligned_rows.append(aligned_row)
+
+        return aligned_rows
+
+    def get_member_sheets_as_list(
+        self, member_mappings_sheet_id, max_workers=8, page_size=5000
+    ):
+        """This function returns the data in all local Goodwill sheets as a
+        list of lists, i.e., the same data `get_sheet_as_list` returns for
+        the master sheet, without waiting for `rewriteMasterSheet` to copy it.
+
+        It reads the headers of the master sheet and the "Spreadsheet ID"
+        column of the member mappings sheet (see `google-scripts/utils.js`).
+        Then, a pool of `max_workers` threads reads the local sheets
+        concurrently, so extraction takes about as long as reading the
+        slowest local sheet. The rows are combined in the order of the
+        mappings sheet.
+        """
+        headers = self._get_values("1:1")
+        if not headers:
+            return []
+
+        mappings = list(self._iter_pages(member_mappings_sheet_id, 1, page_size))
+        if not mappings:
+            return headers
+
+        spreadsheet_id_position = mappings[0].index("Spreadsheet ID")
+        member_sheet_ids = [
+            mapping[spreadsheet_id_position]
+            for mapping in mappings[1:]
+            if len(mapping) > spreadsheet_id_position
+            and mapping[spreadsheet_id_position]
+        ]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            member_sheets = executor.map(
+                lambda member_sheet_id: self._get_member_sheet(
+                    member_sheet_id, page_size
+                ),
+                member_sheet_ids,
+            )
+
+            sheet_as_list = headers[:1]
+            for member_sheet in member_sheets:
+                sheet_as_list += self._align_to_headers(member_sheet, headers[0])
+
+        return sheet_as_list
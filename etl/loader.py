@@ -1,42 +1,273 @@
+import csv
+import io
+from functools import partial
+
 from sqlalchemy.dialects import postgresql
 
-from etl.utils.logger import logger
+from etl.utils import json_codec
+from etl.utils.logger import log_row_error, logger
 
 
 class Loader:
-    def __init__(self, engine):
+    """Upserts transformed programs data into the Pathways database.
+
+    Attributes:
+        engine: a SQLAlchemy engine
+        batch_size: the number of rows written per multi-row INSERT statement
+        copy_threshold: the row count at (or above) which `load_data` bulk loads with COPY
+    """
+
+    def __init__(self, engine, batch_size=500, copy_threshold=5000):
         self.engine = engine
+        self.batch_size = batch_size
+        self.copy_threshold = copy_threshold
+
+    def _make_upsert(self, metadata_table, primary_key, rows):
+        """Build one multi-row `INSERT ... ON CONFLICT DO UPDATE` statement.
+
+        Conflicting rows are updated from `excluded`, i.e., the values
+        proposed for insertion, so the statement does not need a second
+        copy of every parameter for the UPDATE clause.
+        """
+        sql_insert = postgresql.insert(metadata_table).values(rows)
+        update_columns = {
+            column_name: sql_insert.excluded[column_name]
+            for column_name in rows[0]
+            if column_name != primary_key
+        }
+
+        return sql_insert.on_conflict_do_update(
+            index_elements=[primary_key], set_=update_columns
+        )
+
+    def _load_batch(self, rows, metadata_table, primary_key, on_commit=None):
+        """Write a batch in a single transaction, and return the primary keys
+        of the rows written.
+
+        If the batch fails, this function splits it in half and retries
+        each half, until it isolates the row(s) that cause the failure.
+        A bad row gets logged and skipped, and all other rows still get
+        loaded.
+
+        `on_commit(connection, loaded_ids)` runs in the transaction that
+        writes the batch, or, if the batch was split, in a transaction of
+        its own after the halves.
+        """
+        if not rows:
+            # e.g., a batch whose rows all lacked a primary key.
+            if on_commit is not None:
+                with self.engine.begin() as connection:
+                    on_commit(connection, loaded_ids=[])
+            return []
+
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(self._make_upsert(metadata_table, primary_key, rows))
+                loaded_ids = [row[primary_key] for row in rows]
+                if on_commit is not None:
+                    on_commit(connection, loaded_ids=loaded_ids)
+        except Exception as e:
+            if len(rows) == 1:
+                log_row_error(
+                    f"Could not load the row with {primary_key}: {rows[0][primary_key]}.",
+                    rows[0][primary_key],
+                    e,
+                )
+                loaded_ids = []
+            else:
+                middle = len(rows) // 2
+                loaded_ids = self._load_batch(
+                    rows[:middle], metadata_table, primary_key
+                ) + self._load_batch(rows[middle:], metadata_table, primary_key)
+
+            if on_commit is not None:
+                with self.engine.begin() as connection:
+                    on_commit(connection, loaded_ids=loaded_ids)
+
+        return loaded_ids
+
+    def _make_copy_buffer(self, rows, column_names):
+        """Write rows to an in-memory CSV buffer, which COPY reads as a file.
+
+        An unquoted empty field is NULL in the CSV format of COPY, and
+        that is how the `csv` module writes None. JSON values (e.g., the
+        `pathways_program` document) are serialized to text.
+        """
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        for row in rows:
+            writer.writerow(
+                [
+                    json_codec.dumps(row[column_name])
+                    if isinstance(row[column_name], (dict, list))
+                    else row[column_name]
+                    for column_name in column_names
+                ]
+            )
+
+        buffer.seek(0)
+        return buffer
+
+    def _copy_and_merge(self, rows, metadata_table, primary_key, on_commit=None):
+        """Bulk load rows in a single transaction, and return the primary keys
+        of the rows written.
+
+        This function streams the rows into a temporary staging table with
+        `COPY FROM STDIN`, and then merges the staging table into the
+        programs table with one `INSERT ... SELECT ... ON CONFLICT`
+        statement. The staging table is dropped at commit.
+
+        `on_commit(connection)` runs in the same transaction.
+        """
+        # ON CONFLICT cannot update the same row twice in one statement: keep the last version of each row.
+        rows = list({row[primary_key]: row for row in rows}.values())
+        column_names = list(rows[0])
+
+        with self.engine.begin() as connection:
+            quote = connection.dialect.identifier_preparer.quote
+            table_name = quote(metadata_table.name)
+            staging_table_name = quote(f"{metadata_table.name}_staging")
+            quoted_columns = [quote(column_name) for column_name in column_names]
+
+            connection.execute(
+                f"CREATE TEMPORARY TABLE {staging_table_name} "
+                f"(LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+
+            cursor = connection.connection.cursor()
+            cursor.copy_expert(
+                f"COPY {staging_table_name} ({', '.join(quoted_columns)}) "
+                "FROM STDIN WITH (FORMAT csv)",
+                self._make_copy_buffer(rows, column_names),
+            )
+
+            update_columns = ", ".join(
+                f"{quoted_column} = excluded.{quoted_column}"
+                for column_name, quoted_column in zip(column_names, quoted_columns)
+                if column_name != primary_key
+            )
+            connection.execute(
+                f"INSERT INTO {table_name} ({', '.join(quoted_columns)}) "
+                f"SELECT {', '.join(quoted_columns)} FROM {staging_table_name} "
+                f"ON CONFLICT ({quote(primary_key)}) DO UPDATE SET {update_columns}"
+            )
+
+            if on_commit is not None:
+                on_commit(connection)
 
-    def load_data(self, dataframe, metadata_table, primary_key):
+        return [row[primary_key] for row in rows]
+
+    def _drop_rows_without_key(self, rows, primary_key):
+        """Return the rows that have a primary key, and log the others, e.g.,
+        a new response that has no Row Identifier yet.
+
+        A row without a key can never be written, and a NULL key in the
+        staging table fails the whole COPY.
+        """
+        keyed_rows = []
+        for row in rows:
+            if row[primary_key] is None:
+                log_row_error(
+                    f"Could not load a row without a {primary_key}.",
+                    None,
+                    ValueError(f"The row has no {primary_key}."),
+                )
+            else:
+                keyed_rows.append(row)
+
+        return keyed_rows
+
+    def make_batches(self, dataframe):
+        """Split the rows of `dataframe` into batches of `batch_size` rows,
+        i.e., the units that `load_batches` writes (and checkpoints)."""
+        loadable_dict = dataframe.to_dict(orient="records")
+        rows = [
+            {
+                field_name: None if not value else value
+                for field_name, value in row.items()
+            }
+            for row in loadable_dict
+        ]
+
+        return [
+            rows[start : start + self.batch_size]
+            for start in range(0, len(rows), self.batch_size)
+        ]
+
+    def load_batches(self, batches, metadata_table, primary_key, checkpoint=None):
+        """Write a dict of {batch number: list of rows}, and return the
+        primary keys of all rows that were written.
+
+        With a `checkpoint` (see `EtlState.start_run`), each batch gets
+        marked as committed in the transaction that writes it, so that an
+        interrupted load can resume from the first uncommitted batch.
+
+        Rows without a primary key get logged and skipped.
+        """
+        batches = {
+            batch_number: self._drop_rows_without_key(batch_rows, primary_key)
+            for batch_number, batch_rows in batches.items()
+        }
+        rows = [row for batch_rows in batches.values() for row in batch_rows]
+
+        if rows and len(rows) >= self.copy_threshold:
+
+            def mark_all_committed(connection):
+                if checkpoint is not None:
+                    for batch_number, batch_rows in batches.items():
+                        checkpoint.mark_committed(
+                            connection,
+                            batch_number,
+                            [row[primary_key] for row in batch_rows],
+                        )
+
+            try:
+                return self._copy_and_merge(
+                    rows, metadata_table, primary_key, on_commit=mark_all_committed
+                )
+            except Exception as e:
+                logger.warning(
+                    f"----Bulk load with COPY failed, loading in batches instead. {e}"
+                )
+
+        loaded_ids = []
+        for batch_number, batch_rows in batches.items():
+            on_commit = None
+            if checkpoint is not None:
+                on_commit = partial(
+                    checkpoint.mark_committed, batch_number=batch_number
+                )
+            loaded_ids += self._load_batch(
+                batch_rows, metadata_table, primary_key, on_commit=on_commit
+            )
+
+        return loaded_ids
+
+    def load_data(self, dataframe, metadata_table, primary_key, checkpoint=None):
         """This function uses `on_conflict_do_update` from
         `sqlalchemy.dialects.postgresql`, which runs a query against the
-        programs table: it either INSERTS a new row, or it UPDATES existing
+        programs table: it either INSERTS new rows, or it UPDATES existing
         rows.
 
-        The query looks like this:
+        Rows are written `batch_size` at a time, with one connection and one
+        transaction per batch. The query looks like this:
         ```
         INSERT INTO programs (gs_row_identifier...)
-        VALUES (%(gs_row_identifier)s...)
+        VALUES (%(gs_row_identifier_m0)s...), (%(gs_row_identifier_m1)s...)
         ON CONFLICT (gs_row_identifier)
-        DO UPDATE SET gs_row_identifier = %(param_1)s...
+        DO UPDATE SET pathways_program = excluded.pathways_program...
         ```
-        """
-        loadable_dict = dataframe.to_dict(orient="records")
 
-        for row in loadable_dict:
-            row = {
-                field_name: None if not value else value
-                for field_name, value in row.items()
-            }
+        Large loads (e.g., the first load, or a full backfill) of at least
+        `copy_threshold` rows go through `_copy_and_merge` instead. If the
+        bulk load fails, the rows get loaded in batches, which isolates the
+        row(s) that caused the failure.
+
+        It returns the primary keys of all rows that were written.
+        """
+        batches = dict(enumerate(self.make_batches(dataframe)))
 
-            with self.engine.connect() as connection:
-                try:
-                    sql_insert = postgresql.insert(metadata_table).values(**row)
-                    sql_upsert = sql_insert.on_conflict_do_update(
-                        index_elements=[primary_key], set_=row
-                    )
-
-                    connection.execute(sql_upsert)
-                except Exception as e:
-                    logger.error(e)
-                    continue
+        return self.load_batches(
+            batches, metadata_table, primary_key, checkpoint=checkpoint
+        )
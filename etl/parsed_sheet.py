@@ -0,0 +1,65 @@
+import pandas as pd
+
+from etl.utils.utils import make_dataframe_with_headers
+
+ROW_IDENTIFIER_HEADER = "Row Identifier (DO NOT EDIT)"
+PATHWAYS_OPT_IN_HEADER = "Should this program be available in Google Pathways?"
+
+
+class ParsedSheet:
+    """The Google sheet, parsed into a Pandas dataframe once per run, and then
+    shared by OptOut and DataframeTransformer.
+
+    Attributes:
+        dataframe: the Google sheet data as a Pandas dataframe with headers
+        headers: a list of the Google sheet headers
+        header_index: a dict of {header: column position}
+    """
+
+    def __init__(self, dataframe):
+        self.dataframe = dataframe
+        self.headers = list(dataframe.columns)
+        self.header_index = {
+            header: position
+            for position, header in reversed(list(enumerate(self.headers)))
+        }
+        self._row_identifiers = None
+        self._pathways_mask = None
+
+    @classmethod
+    def from_list(cls, list_of_lists):
+        """Parse the return value of `get_sheet_as_list` in Extractor."""
+        return cls(make_dataframe_with_headers(list_of_lists, compact=True))
+
+    @classmethod
+    def from_sheet(cls, sheet):
+        """Return `sheet` if it is a ParsedSheet already, or else parse it
+        (i.e., a list of lists)."""
+        if isinstance(sheet, cls):
+            return sheet
+
+        return cls.from_list(sheet)
+
+    @property
+    def row_identifiers(self):
+        """A NumPy array of the "Row Identifier (DO NOT EDIT)" column, with
+        None for rows that do not have one."""
+        if self._row_identifiers is None:
+            row_identifiers = self.dataframe[ROW_IDENTIFIER_HEADER].to_numpy(
+                dtype=object
+            )
+            row_identifiers[pd.isna(row_identifiers)] = None
+            self._row_identifiers = row_identifiers
+
+        return self._row_identifiers
+
+    @property
+    def pathways_mask(self):
+        """A NumPy array of booleans, which is True for the programs that
+        should be available in Google Pathways."""
+        if self._pathways_mask is None:
+            self._pathways_mask = (
+                self.dataframe[PATHWAYS_OPT_IN_HEADER] == "Yes"
+            ).to_numpy()
+
+        return self._pathways_mask
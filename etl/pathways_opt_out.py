@@ -1,7 +1,8 @@
-from sqlalchemy import MetaData, Table
+from sqlalchemy import MetaData, Table, all_, any_, cast
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.sql import select
 
-from etl.utils.utils import make_dataframe_with_headers
+from etl.parsed_sheet import ParsedSheet
 
 
 class OptOut:
@@ -9,29 +10,55 @@ class OptOut:
     Brighthive Google Pathways API.
 
     Attributes:
-        google_sheet_as_list: all Google sheet data; return value of `get_sheet_as_list` function in Extractor
+        google_sheet_as_list: all Google sheet data; return value of `get_sheet_as_list` function in Extractor, or a ParsedSheet
         programs_table: a SQLAlchemy Table object that reflects the `pathways_program` table in the API database
         engine: a SQLAlchemy engine
+        shard: a Shard, which limits the deletes to the programs in that shard, in a sharded run (optional)
+        parsed_sheet: the Google sheet data as a ParsedSheet
     """
 
-    def __init__(self, google_sheet_as_list, programs_table, engine):
+    def __init__(self, google_sheet_as_list, programs_table, engine, shard=None):
         self.google_sheet_as_list = google_sheet_as_list
         self.programs_table = programs_table
         self.engine = engine
-        self.dataframe_of_google_sheet = make_dataframe_with_headers(
-            self.google_sheet_as_list
-        )
+        self.shard = shard
+        self.parsed_sheet = ParsedSheet.from_sheet(self.google_sheet_as_list)
+
+    @property
+    def dataframe_of_google_sheet(self):
+        return self.parsed_sheet.dataframe
+
+    @dataframe_of_google_sheet.setter
+    def dataframe_of_google_sheet(self, dataframe):
+        self.parsed_sheet = ParsedSheet(dataframe)
+
+    def _as_array(self, program_ids):
+        """Send a list of program IDs as one array parameter, e.g., for `id <>
+        ALL(...)`, rather than as one parameter per ID."""
+        return cast(program_ids, ARRAY(self.programs_table.c.id.type))
 
-    def _find_programs_to_delete(self, all_programs_in_database, all_ids_in_sheet):
-        all_ids_in_database = [program.id for program in all_programs_in_database]
+    def _in_shard(self, statement):
+        """Limit a DELETE (or SELECT) to the programs in the shard, if any:
+        the sheet of a sharded run only holds the rows of its shard."""
+        if self.shard is None:
+            return statement
 
-        programs_to_delete = [
+        return statement.where(self.shard.sql_filter(self.programs_table.c.id))
+
+    def _get_ids_in_sheet(self):
+        # A NULL in the array would make `id <> ALL(...)` NULL for every program.
+        return [
             program_id
-            for program_id in all_ids_in_database
-            if program_id not in all_ids_in_sheet
+            for program_id in self.parsed_sheet.row_identifiers
+            if program_id is not None
         ]
 
-        return programs_to_delete
+    def _get_non_pathways_ids(self):
+        non_pathways_programs = self.parsed_sheet.row_identifiers[
+            ~self.parsed_sheet.pathways_mask
+        ].tolist()
+        # It is possible that a local Goodwill will manually (and erroneously) create an entry, i.e., the program does programmatically get a Row Identifier.
+        return [program for program in non_pathways_programs if program is not None]
 
     def remove_deleted_programs(self):
         """Delete programs from the database.
@@ -41,31 +68,36 @@ class OptOut:
         happen when a local Goodwill outright deletes a program from
         their local sheet.
         """
-        # 1. Get all IDs in the Google sheet by filtering a Pandas dataframe.
-        all_ids_in_sheet = self.dataframe_of_google_sheet[
-            "Row Identifier (DO NOT EDIT)"
-        ].tolist()
+        # 1. Get all IDs in the Google sheet.
+        all_ids_in_sheet = self._get_ids_in_sheet()
+
+        # 2. Delete the programs in the Pathways database that the Google sheet does not have, in one statement:
+        # DELETE FROM pathways_program WHERE id <> ALL(<IDs in sheet>) RETURNING id
+        delete_object = self._in_shard(
+            self.programs_table.delete()
+            .where(self.programs_table.c.id != all_(self._as_array(all_ids_in_sheet)))
+            .returning(self.programs_table.c.id)
+        )
 
         with self.engine.connect() as connection:
-            # 2. Get all IDs in the Pathways database
-            select_all = select([self.programs_table])
-            all_programs_in_database = connection.execute(select_all)
+            programs_to_delete = [
+                program.id for program in connection.execute(delete_object)
+            ]
 
-            # 3. Determine if the Pathways database has IDs that the Google Sheet does not have
-            programs_to_delete = self._find_programs_to_delete(
-                all_programs_in_database, all_ids_in_sheet
-            )
+        return programs_to_delete
 
-            # 4. (OPTIONAL) Delete programs from Pathways database
-            if programs_to_delete:
-                delete_object = self.programs_table.delete().where(
-                    self.programs_table.c.id.in_(
-                        program for program in programs_to_delete
-                    )
-                )
-                connection.execute(delete_object)
+    def find_deleted_programs(self):
+        """Return the programs that `remove_deleted_programs` would delete,
+        without deleting them."""
+        select_object = self._in_shard(
+            select([self.programs_table.c.id]).where(
+                self.programs_table.c.id
+                != all_(self._as_array(self._get_ids_in_sheet()))
+            )
+        )
 
-        return programs_to_delete
+        with self.engine.connect() as connection:
+            return [program.id for program in connection.execute(select_object)]
 
     def remove_programs_not_marked_for_pathways(self):
         """Delete programs from the database.
@@ -77,24 +109,29 @@ class OptOut:
         in pathways, and they adjust this preference in their local
         sheet.
         """
-        df = self.dataframe_of_google_sheet
-        filtered_df = df[
-            df["Should this program be available in Google Pathways?"] != "Yes"
-        ]
-
-        non_pathways_programs = filtered_df["Row Identifier (DO NOT EDIT)"].tolist()
-        # It is possible that a local Goodwill will manually (and erroneously) create an entry, i.e., the program does programmatically get a Row Identifier.
-        non_pathways_programs = [
-            program for program in non_pathways_programs if program is not None
-        ]
+        non_pathways_programs = self._get_non_pathways_ids()
 
         if non_pathways_programs:
             with self.engine.connect() as connection:
                 delete_object = self.programs_table.delete().where(
-                    self.programs_table.c.id.in_(
-                        program for program in non_pathways_programs
-                    )
+                    self.programs_table.c.id
+                    == any_(self._as_array(non_pathways_programs))
                 )
                 connection.execute(delete_object)
 
         return non_pathways_programs
+
+    def find_programs_not_marked_for_pathways(self):
+        """Return the programs in the database that
+        `remove_programs_not_marked_for_pathways` would delete, without
+        deleting them."""
+        non_pathways_programs = self._get_non_pathways_ids()
+        if not non_pathways_programs:
+            return []
+
+        select_object = select([self.programs_table.c.id]).where(
+            self.programs_table.c.id == any_(self._as_array(non_pathways_programs))
+        )
+
+        with self.engine.connect() as connection:
+            return [program.id for program in connection.execute(select_object)]
@@ -0,0 +1,262 @@
+import asyncio
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from etl.change_detector import ChangeDetector
+from etl.etl_state import EtlState, WatermarkBounds
+from etl.loader import Loader
+from etl.parsed_sheet import PATHWAYS_OPT_IN_HEADER, ROW_IDENTIFIER_HEADER, ParsedSheet
+from etl.pathways_opt_out import OptOut
+from etl.transformers.dataframe_transformer import DataframeTransformer
+from etl.transformers.pathways_transformer import PathwaysTransformer
+from etl.utils.logger import logger
+from etl.utils.utils import format_id_sample
+
+
+class _ChunkTransformer(DataframeTransformer):
+    """A DataframeTransformer that filters a chunk of the sheet against the
+    watermarks read at the start of the run.
+
+    Earlier chunks get loaded while later chunks are being transformed, so
+    reading the watermarks (or the latest `updated_at`) once per chunk
+    would filter out rows that have yet to be loaded. Likewise, the run
+    itself is running by the time the chunks get transformed.
+    """
+
+    def __init__(
+        self, sheet, engine, state, watermarks, last_updated, has_interrupted_run
+    ):
+        super().__init__(sheet=sheet, engine=engine, state=state)
+        self._watermarks = watermarks
+        self._last_updated = last_updated
+        self._run_was_interrupted = has_interrupted_run
+
+    def _get_watermarks(self):
+        return self._watermarks
+
+    def _has_interrupted_run(self):
+        return self._run_was_interrupted
+
+    def _get_last_updated(self):
+        return self._last_updated
+
+
+class Pipeline:
+    """Runs the ETL as concurrent stages, which are connected by bounded
+    queues: rows stream from the Extractor in chunks, each chunk gets
+    transformed while the previous one loads, and the opt-out deletes run
+    as soon as the whole sheet has been read.
+
+    Blocking calls (the Sheets API, the database, and the transformations)
+    run on a thread pool, with one thread per stage, so the total run time
+    approaches the time of the slowest stage.
+
+    The opt-out deletes never touch the programs being loaded: they delete
+    programs that are missing from the sheet, or that opt out of Pathways,
+    and neither get loaded.
+
+    Attributes:
+        extractor: an Extractor
+        engine: a SQLAlchemy engine
+        programs_table: a SQLAlchemy Table object that reflects the `pathways_program` table in the API database
+        address_cache: an AddressCache that is shared by all chunks (optional)
+        member_mappings_sheet_id: read the local Goodwill sheets listed in this sheet, instead of the master sheet (optional)
+        chunk_size: the number of rows per chunk
+        queue_size: the number of chunks that can wait between two stages
+        pool: a ConversionPool, whose processes convert programs to Pathways JSON-LD (optional)
+    """
+
+    def __init__(
+        self,
+        extractor,
+        engine,
+        programs_table,
+        address_cache=None,
+        member_mappings_sheet_id=None,
+        chunk_size=5000,
+        queue_size=2,
+        pool=None,
+    ):
+        self.extractor = extractor
+        self.engine = engine
+        self.programs_table = programs_table
+        self.address_cache = address_cache
+        self.member_mappings_sheet_id = member_mappings_sheet_id
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size
+        self.pool = pool
+
+    async def _in_thread(self, function, *args):
+        return await asyncio.get_event_loop().run_in_executor(
+            self._executor, function, *args
+        )
+
+    def _get_rows(self):
+        if self.member_mappings_sheet_id:
+            return iter(
+                self.extractor.get_member_sheets_as_list(
+                    member_mappings_sheet_id=self.member_mappings_sheet_id,
+                    page_size=self.chunk_size,
+                )
+            )
+
+        return self.extractor.iter_rows(page_size=self.chunk_size)
+
+    async def _extract(self, chunks):
+        """Put chunks of `[headers, row, row...]` on the queue, and return the
+        columns of the whole sheet that the opt-out needs (the Row
+        Identifier and the Pathways opt-in), as a list of lists.
+
+        The other columns only live as long as their chunk.
+        """
+        rows = await self._in_thread(self._get_rows)
+        headers = await self._in_thread(next, rows, None)
+        if not headers:
+            await chunks.put(None)
+            return []
+
+        opt_out_headers = [ROW_IDENTIFIER_HEADER, PATHWAYS_OPT_IN_HEADER]
+        opt_out_positions = [headers.index(header) for header in opt_out_headers]
+        opt_out_rows = [opt_out_headers]
+
+        while True:
+            chunk = await self._in_thread(list, itertools.islice(rows, self.chunk_size))
+            if not chunk:
+                break
+
+            # The Sheets API leaves out the empty cells at the end of a row.
+            opt_out_rows += [
+                [
+                    row[position] if position < len(row) else None
+                    for position in opt_out_positions
+                ]
+                for row in chunk
+            ]
+            await chunks.put([headers] + chunk)
+
+        await chunks.put(None)
+        return opt_out_rows
+
+    def _transform_chunk(self, chunk):
+        dataframe_transformer = _ChunkTransformer(
+            sheet=chunk,
+            engine=self.engine,
+            state=self.etl_state,
+            watermarks=self._watermarks,
+            last_updated=self._last_updated,
+            has_interrupted_run=self._has_interrupted_run,
+        )
+        dataframe = dataframe_transformer.transform()
+
+        pathways_dataframe = PathwaysTransformer(
+            dataframe=dataframe, address_cache=self.address_cache
+        ).pathways_transform(pool=self.pool)
+
+        return pathways_dataframe, dataframe_transformer
+
+    async def _transform(self, chunks, pathways_chunks):
+        while True:
+            chunk = await chunks.get()
+            if chunk is None:
+                break
+
+            await pathways_chunks.put(
+                await self._in_thread(self._transform_chunk, chunk)
+            )
+
+        await pathways_chunks.put(None)
+
+    def _load_chunk(self, pathways_dataframe, dataframe_transformer):
+        changed_dataframe = self.change_detector.filter_unchanged(pathways_dataframe)
+        loaded_ids = self.loader.load_data(
+            dataframe=changed_dataframe,
+            metadata_table=self.programs_table,
+            primary_key="id",
+        )
+        self.change_detector.record_hashes(loaded_ids)
+
+        unchanged_ids = set(pathways_dataframe["id"]) - set(changed_dataframe["id"])
+        self.watermark_bounds.update(
+            dataframe_transformer.get_watermark_bounds(
+                done_ids=unchanged_ids | set(loaded_ids)
+            )
+        )
+
+        return loaded_ids
+
+    async def _load(self, pathways_chunks):
+        while True:
+            transformed_chunk = await pathways_chunks.get()
+            if transformed_chunk is None:
+                break
+
+            self.loaded_ids += await self._in_thread(
+                self._load_chunk, *transformed_chunk
+            )
+
+    def _opt_out(self, opt_out_rows):
+        opt_out = OptOut(
+            google_sheet_as_list=ParsedSheet.from_list(opt_out_rows),
+            programs_table=self.programs_table,
+            engine=self.engine,
+        )
+        deleted_records = opt_out.remove_deleted_programs()
+        logger.info(
+            f"----Deleted {len(deleted_records)} records from the Pathways database. {format_id_sample(deleted_records)}"
+        )
+        opt_out_records = opt_out.remove_programs_not_marked_for_pathways()
+        logger.info(
+            f"----Found {len(opt_out_records)} records that 'opt-out' of Pathways. {format_id_sample(opt_out_records)}"
+        )
+
+    async def _extract_and_opt_out(self, chunks):
+        opt_out_rows = await self._extract(chunks)
+        if opt_out_rows:
+            await self._in_thread(self._opt_out, opt_out_rows)
+
+    async def run(self):
+        """Run all stages, and return the ids of the programs that were
+        loaded. The watermarks advance only once every stage has
+        succeeded, and only over the rows that were loaded (or unchanged)."""
+        self._executor = ThreadPoolExecutor(max_workers=3)
+        self.etl_state = EtlState(engine=self.engine)
+        self.change_detector = ChangeDetector(
+            engine=self.engine, programs_table=self.programs_table, state=self.etl_state
+        )
+        self.loader = Loader(engine=self.engine)
+        self.watermark_bounds = WatermarkBounds()
+        self.loaded_ids = []
+
+        self._watermarks = self.etl_state.get_watermarks()
+        self._has_interrupted_run = self.etl_state.get_interrupted_run() is not None
+        self._last_updated = (
+            None
+            if self._watermarks or self._has_interrupted_run
+            else DataframeTransformer(
+                sheet=None, engine=self.engine
+            )._get_last_updated()
+        )
+        # Record the run, which replaces the interrupted run (if any); the chunks add their watermark bounds at the end.
+        checkpoint = self.etl_state.start_run(WatermarkBounds())
+
+        chunks = asyncio.Queue(maxsize=self.queue_size)
+        pathways_chunks = asyncio.Queue(maxsize=self.queue_size)
+        stages = [
+            asyncio.ensure_future(self._extract_and_opt_out(chunks)),
+            asyncio.ensure_future(self._transform(chunks, pathways_chunks)),
+            asyncio.ensure_future(self._load(pathways_chunks)),
+        ]
+
+        try:
+            await asyncio.gather(*stages)
+        except Exception:
+            # A failed stage would leave the others waiting on their queues.
+            for stage in stages:
+                stage.cancel()
+            raise
+        finally:
+            self._executor.shutdown(wait=True)
+
+        checkpoint.finish(self.loaded_ids, self.watermark_bounds)
+
+        return self.loaded_ids
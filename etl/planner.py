@@ -0,0 +1,124 @@
+from sqlalchemy import all_, cast, func
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.sql import select
+
+from etl.change_detector import ChangeDetector
+from etl.etl_state import EtlState
+from etl.parsed_sheet import ParsedSheet
+from etl.pathways_opt_out import OptOut
+from etl.transformers.dataframe_transformer import DataframeTransformer
+from etl.transformers.pathways_transformer import PathwaysTransformer
+
+
+class _PlanTransformer(DataframeTransformer):
+    """A DataframeTransformer that, before the first watermarks, filters the
+    sheet against the latest `updated_at` of the programs that a run would
+    keep: a run deletes programs (see OptOut) before it transforms the
+    sheet, and the dry run only finds them.
+    """
+
+    def __init__(self, sheet, engine, state, programs_table, deleted_ids):
+        super().__init__(sheet=sheet, engine=engine, state=state)
+        self.programs_table = programs_table
+        self.deleted_ids = deleted_ids
+
+    def _get_last_updated(self):
+        select_last_updated = select([func.max(self.programs_table.c.updated_at)])
+        if self.deleted_ids:
+            select_last_updated = select_last_updated.where(
+                self.programs_table.c.id
+                != all_(cast(self.deleted_ids, ARRAY(self.programs_table.c.id.type)))
+            )
+
+        with self.engine.connect() as connection:
+            return connection.execute(select_last_updated).scalar()
+
+
+class Planner:
+    """This class computes what a run of the ETL would do to the Pathways
+    database, without writing to it (a dry run): it runs the same filters
+    and transformations as a run, and replaces each write with a SELECT.
+
+    The plan takes a handful of set-based queries: one per OptOut
+    condition, one for the watermarks (or the latest `updated_at`), and
+    one for the content hashes of the programs.
+
+    Attributes:
+        sheet: a list of lists (abstraction of Google sheet), or a ParsedSheet
+        programs_table: a SQLAlchemy Table object that reflects the `pathways_program` table in the API database
+        engine: a SQLAlchemy engine
+        address_cache: an AddressCache (optional)
+        pool: a ConversionPool, whose processes convert programs to Pathways JSON-LD (optional)
+    """
+
+    def __init__(self, sheet, programs_table, engine, address_cache=None, pool=None):
+        self.parsed_sheet = ParsedSheet.from_sheet(sheet)
+        self.programs_table = programs_table
+        self.engine = engine
+        self.address_cache = address_cache
+        self.pool = pool
+
+    def plan(self):
+        """Return a dict of the program ids that a run would:
+
+        - "inserted": add to the database
+        - "updated": write over, since their Pathways JSON-LD changed
+        - "unchanged": skip, since their Pathways JSON-LD did not change
+        - "skipped": skip, since they were not updated after the watermark
+        - "deleted": delete, since they are no longer in the sheet
+        - "opted_out": delete, since they opt out of Pathways
+        """
+        opt_out = OptOut(
+            google_sheet_as_list=self.parsed_sheet,
+            programs_table=self.programs_table,
+            engine=self.engine,
+        )
+        deleted_ids = opt_out.find_deleted_programs()
+        opted_out_ids = opt_out.find_programs_not_marked_for_pathways()
+
+        # A dry run: the state tables may not exist yet, and do not get created.
+        etl_state = EtlState(engine=self.engine, create_tables=False)
+        # Like a run, filter the sheet after the deletes.
+        dataframe = _PlanTransformer(
+            sheet=self.parsed_sheet,
+            engine=self.engine,
+            state=etl_state,
+            programs_table=self.programs_table,
+            deleted_ids=deleted_ids + opted_out_ids,
+        ).transform()
+        updated_row_ids = set(dataframe["Row Identifier (DO NOT EDIT)"])
+        skipped_ids = [
+            program_id
+            for program_id in self.parsed_sheet.row_identifiers[
+                self.parsed_sheet.pathways_mask
+            ]
+            if program_id is not None and program_id not in updated_row_ids
+        ]
+
+        pathways_dataframe = PathwaysTransformer(
+            dataframe=dataframe, address_cache=self.address_cache
+        ).pathways_transform(pool=self.pool)
+
+        change_detector = ChangeDetector(
+            engine=self.engine, programs_table=self.programs_table, state=etl_state
+        )
+        changed_dataframe = change_detector.filter_unchanged(pathways_dataframe)
+        # Like the Loader, write each program once.
+        changed_ids = list(dict.fromkeys(changed_dataframe["id"]))
+
+        return {
+            "inserted": [
+                program_id
+                for program_id in changed_ids
+                if program_id not in change_detector.existing_hashes
+            ],
+            "updated": [
+                program_id
+                for program_id in changed_ids
+                if program_id in change_detector.existing_hashes
+            ],
+            "unchanged": change_detector.unchanged_ids,
+            "skipped": skipped_ids,
+            "deleted": deleted_ids,
+            "opted_out": opted_out_ids,
+        }
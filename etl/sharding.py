@@ -0,0 +1,280 @@
+import hashlib
+from contextlib import contextmanager
+from sqlalchemy import BigInteger, cast, func, literal
+from sqlalchemy.dialects.postgresql import BIT
+from sqlalchemy.sql import select
+
+from etl.change_detector import ChangeDetector
+from etl.etl_state import EtlState, WatermarkBounds
+from etl.loader import Loader
+from etl.parsed_sheet import ParsedSheet
+from etl.pathways_opt_out import OptOut
+from etl.transformers.dataframe_transformer import DataframeTransformer
+from etl.transformers.pathways_transformer import PathwaysTransformer
+from etl.utils.logger import logger
+
+"""A sharded run splits the programs into `shard_count` shards, by a hash of the Row Identifier
+(i.e., the program id), so that several worker processes (e.g., on several nodes) can share the
+transform and load. A worker claims a shard with a PostgreSQL advisory lock, and records it as
+finished in the `etl_shard_run` table before it lets go of the lock: no shard gets processed twice
+in a run. The coordinator (`combine_shard_summaries`) combines the summaries of the shards, and
+advances the watermarks once all shards have finished.
+
+The Row Identifier, rather than the "Goodwill Member Name", decides the shard: the shards stay even
+when one local Goodwill has many more programs than the others, and the `pathways_program` table
+(which has no member name) can be filtered by shard as well.
+"""
+
+
+def get_shard_of_id(program_id, shard_count):
+    """Return the shard of a program id; the same number as the SQL of
+    `Shard.sql_filter`, i.e., the first 32 bits of the MD5 hash of the id,
+    modulo `shard_count`."""
+    if program_id is None:
+        # Rows without a Row Identifier are not loaded, but still need a (single) shard.
+        return 0
+
+    return (
+        int(hashlib.md5(program_id.encode("utf-8")).hexdigest()[:8], 16) % shard_count
+    )
+
+
+def _get_lock_key(run_id):
+    """The first key of the advisory locks of a run: a signed 32-bit integer."""
+    return int(hashlib.md5(run_id.encode("utf-8")).hexdigest()[:8], 16) - 2 ** 31
+
+
+class Shard:
+    """One shard of a sharded run.
+
+    Attributes:
+        index: the number of the shard, from 0 to `count` - 1
+        count: the number of shards
+    """
+
+    def __init__(self, index, count):
+        self.index = index
+        self.count = count
+
+    def select_rows(self, parsed_sheet):
+        """Return a ParsedSheet of the rows of `parsed_sheet` that belong to
+        this shard."""
+        shards = [
+            get_shard_of_id(program_id, self.count)
+            for program_id in parsed_sheet.row_identifiers
+        ]
+        mask = [shard == self.index for shard in shards]
+
+        return ParsedSheet(parsed_sheet.dataframe[mask].reset_index(drop=True))
+
+    def sql_filter(self, id_column):
+        """Return a SQL condition, which is true for the ids in this shard:
+        `('x' || substr(md5(id), 1, 8))::bit(32)::bigint % count = index`."""
+        first_32_bits = cast(
+            cast(literal("x") + func.substr(func.md5(id_column), 1, 8), BIT(32)),
+            BigInteger,
+        )
+
+        return first_32_bits % self.count == self.index
+
+
+class _ShardTransformer(DataframeTransformer):
+    """A DataframeTransformer that, before the first watermarks, filters the
+    rows of a shard against the latest `updated_at` of the programs in the
+    same shard.
+
+    The other shards get loaded while this one waits for its turn, so the
+    latest `updated_at` of all programs would filter out rows that have yet
+    to be loaded; the programs of a shard only change when the shard itself
+    gets loaded.
+    """
+
+    def __init__(self, sheet, engine, state, shard, programs_table):
+        super().__init__(sheet=sheet, engine=engine, state=state)
+        self.shard = shard
+        self.programs_table = programs_table
+
+    def _get_last_updated(self):
+        select_last_updated = select(
+            [func.max(self.programs_table.c.updated_at)]
+        ).where(self.shard.sql_filter(self.programs_table.c.id))
+
+        with self.engine.connect() as connection:
+            return connection.execute(select_last_updated).scalar()
+
+
+class ShardWorker:
+    """This class runs the transform and load of a sharded run, one shard at a
+    time, for as long as it can claim shards that are not finished.
+
+    Attributes:
+        sheet: a list of lists (abstraction of Google sheet), or a ParsedSheet
+        engine: a SQLAlchemy engine
+        programs_table: a SQLAlchemy Table object that reflects the `pathways_program` table in the API database
+        run_id: the id of the sharded run, which all workers of the run share (e.g., the scheduled time of the run)
+        shard_count: the number of shards
+        address_cache: an AddressCache (optional)
+        pool: a ConversionPool, whose processes convert programs to Pathways JSON-LD (optional)
+    """
+
+    def __init__(
+        self,
+        sheet,
+        engine,
+        programs_table,
+        run_id,
+        shard_count,
+        address_cache=None,
+        pool=None,
+    ):
+        self.parsed_sheet = ParsedSheet.from_sheet(sheet)
+        self.engine = engine
+        self.programs_table = programs_table
+        self.run_id = run_id
+        self.shard_count = shard_count
+        self.address_cache = address_cache
+        self.pool = pool
+        self.etl_state = EtlState(engine=engine)
+
+    @contextmanager
+    def _try_claim(self, shard):
+        """Try to take the advisory lock of `shard` (on a connection of its
+        own, for as long as the `with` block runs), and yield whether this
+        worker got it."""
+        lock_keys = (_get_lock_key(self.run_id), shard.index)
+
+        with self.engine.connect() as connection:
+            claimed = connection.execute(
+                select([func.pg_try_advisory_lock(*lock_keys)])
+            ).scalar()
+            try:
+                yield claimed
+            finally:
+                if claimed:
+                    # The lock belongs to the session: release it before the connection goes back to the pool.
+                    connection.execute(select([func.pg_advisory_unlock(*lock_keys)]))
+
+    def process_shard(self, shard):
+        """Run the opt-out, transform and load of the programs in `shard`, and
+        return its summary."""
+        parsed_sheet = shard.select_rows(self.parsed_sheet)
+
+        opt_out = OptOut(
+            google_sheet_as_list=parsed_sheet,
+            programs_table=self.programs_table,
+            engine=self.engine,
+            shard=shard,
+        )
+        deleted_ids = opt_out.remove_deleted_programs()
+        opted_out_ids = opt_out.remove_programs_not_marked_for_pathways()
+
+        dataframe_transformer = _ShardTransformer(
+            sheet=parsed_sheet,
+            engine=self.engine,
+            state=self.etl_state,
+            shard=shard,
+            programs_table=self.programs_table,
+        )
+        dataframe = dataframe_transformer.transform()
+
+        loaded_ids = []
+        unchanged_ids = []
+        change_detector = None
+        if not dataframe.empty:
+            pathways_dataframe = PathwaysTransformer(
+                dataframe=dataframe, address_cache=self.address_cache
+            ).pathways_transform(pool=self.pool)
+
+            change_detector = ChangeDetector(
+                engine=self.engine,
+                programs_table=self.programs_table,
+                state=self.etl_state,
+            )
+            changed_dataframe = change_detector.filter_unchanged(pathways_dataframe)
+            loaded_ids = Loader(engine=self.engine).load_data(
+                dataframe=changed_dataframe,
+                metadata_table=self.programs_table,
+                primary_key="id",
+            )
+            change_detector.record_hashes(loaded_ids)
+            unchanged_ids = change_detector.unchanged_ids
+
+        summary = (
+            change_detector.summarize(loaded_ids)
+            if change_detector is not None
+            else {"inserted": 0, "updated": 0, "unchanged": 0}
+        )
+        summary.update(
+            {
+                "rows": len(parsed_sheet.dataframe),
+                "deleted": len(deleted_ids),
+                "opted_out": len(opted_out_ids),
+                # The watermarks advance once all shards have finished (see `combine_shard_summaries`).
+                "watermark_bounds": dataframe_transformer.get_watermark_bounds(
+                    done_ids=set(unchanged_ids) | set(loaded_ids)
+                ).to_dict(),
+            }
+        )
+
+        return summary
+
+    def run(self):
+        """Claim and process shards, until every shard of the run is finished,
+        or claimed by another worker. Return the numbers of the shards that
+        this worker processed."""
+        processed_shards = []
+
+        for index in range(self.shard_count):
+            shard = Shard(index, self.shard_count)
+
+            with self._try_claim(shard) as claimed:
+                # Check for a finished shard after taking the lock: the worker that finished it has let go of the lock.
+                if not claimed or index in self.etl_state.get_finished_shards(
+                    self.run_id
+                ):
+                    continue
+
+                logger.info(f"----Processing shard {index + 1} of {self.shard_count}.")
+                summary = self.process_shard(shard)
+                self.etl_state.finish_shard(
+                    self.run_id, index, self.shard_count, summary
+                )
+                processed_shards.append(index)
+
+        return processed_shards
+
+
+def combine_shard_summaries(engine, run_id, shard_count):
+    """Combine the summaries of the finished shards of the sharded run
+    `run_id`, and return the totals, along with the numbers of the shards
+    that have not finished.
+
+    Once all shards have finished, this function advances the watermarks
+    (see WatermarkBounds) over the rows of all shards.
+    """
+    etl_state = EtlState(engine=engine)
+    finished_shards = etl_state.get_finished_shards(run_id)
+
+    totals = {
+        "rows": 0,
+        "inserted": 0,
+        "updated": 0,
+        "unchanged": 0,
+        "deleted": 0,
+        "opted_out": 0,
+    }
+    watermark_bounds = WatermarkBounds()
+    for summary in finished_shards.values():
+        for key in totals:
+            totals[key] += summary[key]
+        watermark_bounds.update(WatermarkBounds.from_dict(summary["watermark_bounds"]))
+
+    missing_shards = [
+        shard for shard in range(shard_count) if shard not in finished_shards
+    ]
+    if not missing_shards:
+        etl_state.advance_watermarks(watermark_bounds.get_watermarks())
+
+    totals["missing_shards"] = missing_shards
+
+    return totals
@@ -0,0 +1,156 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+
+class SnapshotDiff:
+    """The difference between the sheet of this run and the snapshot of the
+    last run.
+
+    Attributes:
+        mask: a NumPy array of booleans, which is True for the rows of the sheet that were added or changed
+        added_ids: the Row Identifiers of the rows that are new in the sheet
+        changed_ids: the Row Identifiers of the rows whose values changed
+        removed_ids: the Row Identifiers of the rows that are no longer in the sheet
+    """
+
+    def __init__(self, mask, added_ids, changed_ids, removed_ids):
+        self.mask = mask
+        self.added_ids = added_ids
+        self.changed_ids = changed_ids
+        self.removed_ids = removed_ids
+
+
+class SheetSnapshot:
+    """This class stores a compact snapshot of the sheet: the Row Identifier
+    and a 64-bit hash of the values of every row (`pd.util.hash_pandas_object`),
+    along with the headers, in a compressed NumPy (`.npz`) file.
+
+    The next run compares the sheet to the snapshot, which gives the rows
+    that were added or changed (e.g., edited in a local sheet, which does
+    not update the "Timestamp"), whatever their Timestamp says.
+
+    Attributes:
+        path: the path of the snapshot file (ending in `.npz`)
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @staticmethod
+    def _hash_rows(parsed_sheet):
+        return pd.util.hash_pandas_object(
+            parsed_sheet.dataframe, index=False
+        ).to_numpy()
+
+    def _load(self):
+        try:
+            with np.load(self.path, allow_pickle=False) as snapshot:
+                return (
+                    snapshot["headers"].tolist(),
+                    snapshot["row_ids"],
+                    snapshot["hashes"],
+                )
+        except (OSError, KeyError, ValueError):
+            # No snapshot yet (or an unreadable one).
+            return None
+
+    def diff(self, parsed_sheet):
+        """Compare a ParsedSheet to the snapshot, and return a SnapshotDiff,
+        or None if there is no snapshot.
+
+        A row without a Row Identifier always counts as added. If the
+        headers have changed, every row counts as changed.
+        """
+        snapshot = self._load()
+        if snapshot is None:
+            return None
+
+        previous_headers, previous_ids, previous_hashes = snapshot
+        previous_index = pd.Index(previous_ids)
+        row_identifiers = parsed_sheet.row_identifiers
+        hashes = self._hash_rows(parsed_sheet)
+
+        positions = previous_index.get_indexer(row_identifiers)
+        is_added = positions == -1
+        if previous_headers != parsed_sheet.headers or is_added.all():
+            is_changed = ~is_added
+        else:
+            is_changed = ~is_added & (previous_hashes[positions] != hashes)
+
+        current_ids = set(row_identifiers)
+
+        return SnapshotDiff(
+            mask=is_added | is_changed,
+            added_ids=[
+                program_id
+                for program_id in row_identifiers[is_added]
+                if program_id is not None
+            ],
+            changed_ids=row_identifiers[is_changed].tolist(),
+            removed_ids=[
+                program_id
+                for program_id in previous_ids.tolist()
+                if program_id not in current_ids
+            ],
+        )
+
+    def _keep_previous_hashes(self, row_ids, hashes, failed_ids):
+        """Give the rows of `failed_ids` their hash from the previous snapshot,
+        and leave out the ones that it does not have."""
+        snapshot = self._load()
+        previous_index = pd.Index(snapshot[1] if snapshot is not None else [])
+
+        is_failed = row_ids.isin(failed_ids)
+        failed_positions = np.flatnonzero(is_failed)
+        previous_positions = previous_index.get_indexer(row_ids[is_failed])
+        in_previous = previous_positions != -1
+
+        hashes = hashes.copy()
+        if in_previous.any():
+            hashes[failed_positions[in_previous]] = snapshot[2][
+                previous_positions[in_previous]
+            ]
+        keep = ~is_failed
+        keep[failed_positions[in_previous]] = True
+
+        return row_ids[keep], hashes[keep]
+
+    def save(self, parsed_sheet, failed_ids=()):
+        """Store the snapshot of a ParsedSheet, e.g., after a successful load.
+
+        The rows of `failed_ids` (e.g., rejected by the converters, or not
+        loaded) keep their hash from the previous snapshot, or get left out
+        if they are new, so that the next diff picks them up again.
+
+        The file gets written to a temporary file and then renamed, so that
+        a failed run never leaves half a snapshot.
+        """
+        has_id = np.array(
+            [program_id is not None for program_id in parsed_sheet.row_identifiers],
+            dtype=bool,
+        )
+        # Keep the last row of each Row Identifier, so that the snapshot has one hash per id.
+        row_ids = pd.Index(parsed_sheet.row_identifiers[has_id])
+        is_last = ~row_ids.duplicated(keep="last")
+        row_ids = row_ids[is_last]
+        hashes = self._hash_rows(parsed_sheet)[has_id][is_last]
+        if failed_ids:
+            row_ids, hashes = self._keep_previous_hashes(row_ids, hashes, failed_ids)
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "wb") as temporary_file:
+                np.savez_compressed(
+                    temporary_file,
+                    headers=np.array(parsed_sheet.headers, dtype=str),
+                    row_ids=np.array(row_ids, dtype=str),
+                    hashes=hashes,
+                )
+            os.replace(temporary_path, self.path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
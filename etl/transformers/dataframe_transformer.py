@@ -2,7 +2,9 @@ from datetime import datetime
 
 import pandas as pd
 
-from etl.utils.utils import make_dataframe_with_headers
+from etl.etl_state import GLOBAL_WATERMARK, WatermarkBounds
+from etl.parsed_sheet import ParsedSheet
+from etl.utils.utils import object_column
 
 
 class DataframeTransformer:
@@ -11,13 +13,19 @@ class DataframeTransformer:
     recently updated data.
 
     Attributes:
-        sheet: a list of lists (abstraction of Google sheet)
+        sheet: a list of lists (abstraction of Google sheet), or a ParsedSheet
         engine: a sqlalchemy engine
+        state: an EtlState, which stores the watermarks that filter the sheet (optional)
+        snapshot_diff: a SnapshotDiff, whose added and changed rows replace the filter by "Timestamp" (optional)
+        watermark_rows: the "Row Identifier", "Goodwill Member Name", "Timestamp" and Pathways opt-in of the transformed rows, set by `transform` when there is a `state` (see `get_watermark_bounds` and `get_failed_ids`)
     """
 
-    def __init__(self, sheet, engine):
+    def __init__(self, sheet, engine, state=None, snapshot_diff=None):
         self.sheet = sheet
         self.engine = engine
+        self.state = state
+        self.snapshot_diff = snapshot_diff
+        self.watermark_rows = None
 
     def _format_date(self, date: str):
         try:
@@ -56,20 +64,82 @@ class DataframeTransformer:
             formatted_date = self._format_date("09/09/2099")
         return formatted_date
 
-    def _handle_dates(self, df):
-        df["Application Deadline"] = df["Application Deadline"].apply(
-            self._format_date_or_invalid
-        )
-        df["Start date(s)"] = df["Start date(s)"].apply(
-            self._format_startdates_and_enddates
+    def _format_dates(self, dates):
+        """This function is a vectorized version of `_format_date`: it
+        converts a Series of dates to isoformat, and returns NaN for values
+        that do not match either date format.
+
+        `pd.to_datetime` parses whole columns at a time, first with
+        "%m/%d/%Y" and then with "%m/%d/%Y %H:%M:%S" for the values the
+        first format could not parse. The few date-like values outside
+        the range of a pandas Timestamp (e.g., "01/01/3000") go through
+        `_format_date`.
+        """
+        # The exploded start and end dates share an index label per program: use positions instead.
+        stripped_dates = dates.str.strip().reset_index(drop=True)
+        parsed_dates = pd.to_datetime(
+            stripped_dates, format="%m/%d/%Y", errors="coerce"
         )
-        df["End Date(s)"] = df["End Date(s)"].apply(
-            self._format_startdates_and_enddates
+
+        unparsed = parsed_dates.isna() & stripped_dates.notna()
+        if unparsed.any():
+            parsed_dates[unparsed] = pd.to_datetime(
+                stripped_dates[unparsed], format="%m/%d/%Y %H:%M:%S", errors="coerce"
+            )
+
+        formatted_dates = parsed_dates.dt.strftime("%Y-%m-%d").copy()
+
+        out_of_bounds = formatted_dates.isna() & stripped_dates.str.match(
+            r"\d{1,2}/\d{1,2}/\d{4}"
+        ).fillna(False)
+        for index, date in stripped_dates[out_of_bounds].items():
+            try:
+                formatted_dates[index] = self._format_date(date)
+            except ValueError:
+                pass
+
+        formatted_dates.index = dates.index
+        return formatted_dates
+
+    def _handle_dates(self, df):
+        """This function formats "Application Deadline" like
+        `_format_date_or_invalid`, and "Start date(s)" and "End Date(s)" like
+        `_format_startdates_and_enddates`, a column at a time.
+
+        The semicolon-separated start and end dates get exploded into one
+        row per date, formatted, and then regrouped into a list per program.
+        Empty cells are treated as empty strings.
+        """
+        application_deadlines = self._format_dates(df["Application Deadline"])
+        df["Application Deadline"] = application_deadlines.fillna(
+            self._format_date("09/09/2099")
         )
 
+        for column_name in ["Start date(s)", "End Date(s)"]:
+            split_dates = df[column_name].fillna("").str.split(";")
+            dates = split_dates.explode()
+            formatted_dates = self._format_dates(dates)
+            formatted_dates = formatted_dates.where(formatted_dates.notna(), dates)
+
+            # `explode` keeps the dates of each program together, and in order.
+            formatted_dates = formatted_dates.tolist()
+            regrouped_dates = []
+            start = 0
+            for date_count in split_dates.str.len():
+                regrouped_dates.append(formatted_dates[start : start + date_count])
+                start += date_count
+
+            df[column_name] = pd.Series(regrouped_dates, index=df.index, dtype=object)
+
         return df
 
-    def _filter_last_updated(self, dataframe):
+    def _parse_timestamps(self, timestamps):
+        try:
+            return pd.to_datetime(timestamps, format="%m/%d/%Y %H:%M:%S")
+        except ValueError:
+            return pd.to_datetime(timestamps, format="%Y-%m-%d %H:%M:%S")
+
+    def _get_last_updated(self):
         query = """
             SELECT updated_at
             FROM pathways_program
@@ -79,25 +149,166 @@ class DataframeTransformer:
         with self.engine.connect() as connection:
             results = connection.execute(query)
             try:
-                last_updated = results.fetchone()["updated_at"]
+                return results.fetchone()["updated_at"]
             except TypeError:
                 # An empty programs table return zero results, i.e., the first time running this script.
+                return None
+
+    def _filter_last_updated(self, dataframe):
+        last_updated = self._get_last_updated()
+        if last_updated is None:
+            return dataframe
+
+        timestamps = self._parse_timestamps(dataframe["Timestamp"])
+        is_updated = timestamps > last_updated
+
+        return dataframe[is_updated].assign(Timestamp=timestamps[is_updated])
+
+    def _get_watermarks(self):
+        return self.state.get_watermarks()
+
+    def _has_interrupted_run(self):
+        return self.state.get_interrupted_run() is not None
+
+    def _filter_watermarks(self, dataframe):
+        """This function keeps the rows updated after the watermark of their
+        local Goodwill. It only parses the "Timestamp" column, so that
+        `transform` formats the dates of the rows that survive, and no
+        others.
+
+        A local Goodwill without a watermark (e.g., a new member) keeps all
+        of its rows. A row without a "Goodwill Member Name" is compared to
+        the global watermark. Before the first watermark is stored, this
+        function falls back to `_filter_last_updated`, unless a run was
+        interrupted: its partial load has advanced the latest `updated_at`
+        over rows that it did not load, so all rows are kept.
+        """
+        watermarks = self._get_watermarks()
+        if not watermarks:
+            if self._has_interrupted_run():
                 return dataframe
-            else:
-                try:
-                    dataframe["Timestamp"] = pd.to_datetime(
-                        dataframe["Timestamp"], format="%m/%d/%Y %H:%M:%S"
-                    )
-                except ValueError:
-                    dataframe["Timestamp"] = pd.to_datetime(
-                        dataframe["Timestamp"], format="%Y-%m-%d %H:%M:%S"
-                    )
-
-                return dataframe[dataframe["Timestamp"] > last_updated]
+            return self._filter_last_updated(dataframe)
+
+        global_watermark = watermarks.get(GLOBAL_WATERMARK)
+        member_watermarks = pd.to_datetime(
+            [
+                watermarks.get(member_name, None)
+                if member_name is not None
+                else global_watermark
+                for member_name in object_column(dataframe["Goodwill Member Name"])
+            ]
+        )
+
+        timestamps = self._parse_timestamps(dataframe["Timestamp"])
+        is_updated = (
+            member_watermarks.isna() | (timestamps > member_watermarks)
+        ).values
+
+        return dataframe[is_updated].assign(Timestamp=timestamps[is_updated])
+
+    def _filter_snapshot_diff(self, dataframe):
+        """This function keeps the rows that were added or changed since the
+        snapshot of the last run, whatever their "Timestamp" says."""
+        filtered = dataframe[self.snapshot_diff.mask]
+
+        return filtered.assign(Timestamp=self._parse_timestamps(filtered["Timestamp"]))
+
+    def _get_watermark_rows(self, dataframe):
+        return pd.DataFrame(
+            {
+                "id": object_column(dataframe["Row Identifier (DO NOT EDIT)"]),
+                "member_name": object_column(dataframe["Goodwill Member Name"]),
+                "timestamp": self._parse_timestamps(dataframe["Timestamp"]).values,
+                "for_pathways": (
+                    dataframe["Should this program be available in Google Pathways?"]
+                    == "Yes"
+                ).values,
+            }
+        )
+
+    def _group_timestamps(self, rows, aggregate):
+        """Return the latest (or earliest) "Timestamp" of `rows` for each
+        local Goodwill, and for all of them (the GLOBAL_WATERMARK)."""
+        if rows.empty:
+            return {}
+
+        timestamps = rows["timestamp"]
+        grouped = {
+            member_name: timestamp.to_pydatetime()
+            for member_name, timestamp in timestamps.groupby(rows["member_name"])
+            .agg(aggregate)
+            .items()
+        }
+        grouped[GLOBAL_WATERMARK] = timestamps.agg(aggregate).to_pydatetime()
+
+        return grouped
+
+    def get_watermark_bounds(self, done_ids, pending_ids=()):
+        """Return the WatermarkBounds of the transformed rows, given the ids
+        of the programs that are done (i.e., loaded or unchanged), and of
+        the programs that are yet to be loaded.
+
+        A row that is not marked for Pathways is done. Any other row (e.g.,
+        rejected by the converters, or without a Row Identifier) failed,
+        so that the watermarks do not move past it.
+        """
+        # A row without a "Timestamp" gets transformed, but cannot bound the watermarks.
+        rows = self.watermark_rows.dropna(subset=["timestamp"])
+        is_pending = rows["for_pathways"] & rows["id"].isin(pending_ids)
+        is_done = ~is_pending & (~rows["for_pathways"] | rows["id"].isin(done_ids))
+        is_failed = ~is_pending & ~is_done
+
+        return WatermarkBounds(
+            latest_done=self._group_timestamps(rows[is_done], "max"),
+            earliest_failed=self._group_timestamps(rows[is_failed], "min"),
+            pending=[
+                [program_id, member_name, timestamp.to_pydatetime()]
+                for program_id, member_name, timestamp in zip(
+                    rows["id"][is_pending],
+                    rows["member_name"][is_pending],
+                    rows["timestamp"][is_pending],
+                )
+            ],
+        )
+
+    def get_failed_ids(self, done_ids):
+        """Return the Row Identifiers of the transformed rows that are marked
+        for Pathways, but not done (i.e., loaded or unchanged): e.g., rows
+        that were rejected by the converters, or could not be loaded."""
+        rows = self.watermark_rows
+        is_failed = (
+            rows["for_pathways"] & rows["id"].notna() & ~rows["id"].isin(done_ids)
+        )
+
+        return set(rows["id"][is_failed])
 
     def transform(self):
-        df = make_dataframe_with_headers(self.sheet)
-        df_with_valid_dates = self._handle_dates(df)
-        clean_df = self._filter_last_updated(df_with_valid_dates)
+        """This function filters the sheet before it transforms anything: the
+        date columns get formatted only for rows that were updated since
+        the last load.
+
+        With a SnapshotDiff, the rows that were added or changed since the
+        last run survive. Otherwise, the rows updated after the watermarks
+        (or the latest `updated_at`) do.
+
+        With an EtlState, what the watermarks need of the surviving rows is
+        kept in `self.watermark_rows`: after the load, the caller advances
+        the watermarks to `get_watermark_bounds`.
+        """
+        sheet_df = ParsedSheet.from_sheet(self.sheet).dataframe
+
+        if self.snapshot_diff is not None:
+            df = self._filter_snapshot_diff(sheet_df)
+        elif self.state is None:
+            df = self._filter_last_updated(sheet_df)
+        else:
+            df = self._filter_watermarks(sheet_df)
+
+        if self.state is not None:
+            self.watermark_rows = self._get_watermark_rows(df)
+
+        if df is sheet_df:
+            # Nothing was filtered out: copy the (shared) dataframe of the ParsedSheet, since `_handle_dates` changes its columns in place.
+            df = df.copy()
 
-        return clean_df
+        return self._handle_dates(df)
@@ -1,5 +1,8 @@
+import logging
 import re
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 import pandas as pd
 import usaddress
 
@@ -7,55 +10,219 @@ from converter import (
     educational_occupational_programs_converter,
     work_based_programs_converter,
 )
+from etl.utils.address_cache import AddressCache
 from etl.utils.errors import InvalidPathwaysData
-from etl.utils.logger import logger
+from etl.utils.logger import log_row_error, logger
+from etl.utils.utils import object_column
+
+INVALID_DURATION_MESSAGE = 'The program does not have parseable input in "Duration / Time to complete" – needed for "TimeToComplete."'
+
+# These dicts map the keyword arguments of the converters to the Google sheet headers, which hold their values.
+# `provider_address`, `time_to_complete`, and `program_prerequisites` are derived from several fields.
+WORK_BASED_PROGRAM_FIELDS = {
+    "program_description": "Program description",
+    "program_name": "Program Name",
+    "program_url": "URL of Program",
+    "provider_name": "Goodwill Member Name",
+    "provider_url": "Organization URL",
+    "provider_telephone": "Contact phone number for program",
+    "start_date": "Start date(s)",
+    "end_date": "End Date(s)",
+    "maximum_enrollment": "Maximum Enrollment",
+    "occupational_credential_awarded": "What certification (exam), license, or certificate (if any) does this program prepare you for or give you?",
+    "time_of_day": "Timing",
+    "offers_price": "Total cost of the program (in dollars)",
+    "training_salary": "If yes, average hourly wage paid to student",
+    "salary_upon_completion": "Average ANNUAL salary post-graduation",
+}
+
+EDUCATIONAL_PROGRAM_FIELDS = {
+    "application_deadline": "Application Deadline",
+    "program_name": "Program Name",
+    "program_description": "Program description",
+    "offers_price": "Total cost of the program (in dollars)",
+    "program_url": "URL of Program",
+    "provider_name": "Goodwill Member Name",
+    "provider_url": "Organization URL",
+    "provider_telephone": "Contact phone number for program",
+    "identifier_cip": "CIP Code",
+    "identifier_program_id": "Program ID",
+    "start_date": "Start date(s)",
+    "end_date": "End Date(s)",
+    "occupational_credential_awarded": "What certification (exam), license, or certificate (if any) does this program prepare you for or give you?",
+    "educational_program_mode": "Format",
+    "maximum_enrollment": "Maximum Enrollment",
+    "time_of_day": "Timing",
+}
+
+# The fields, which `_convert_to_pathways_json` reads directly.
+ROW_FIELDS = {
+    "gs_row_identifier": "Row Identifier (DO NOT EDIT)",
+    "timestamp": "Timestamp",
+    "provider_address": "Organization Address",
+    "program_address": "Program Address (if different from organization address)",
+    "eligible_groups": "Eligible groups",
+}
+
+
+def compile_field_positions(columns, fields):
+    """This function compiles a dict of {name: Google sheet header} into a
+    list of (name, position) tuples, which can read values from rows (i.e.,
+    tuples) that have one value per header in `columns`."""
+    columns = list(columns)
+
+    return [(name, columns.index(header)) for name, header in fields.items()]
+
+
+class _LogRecordCollector(logging.Handler):
+    """Keeps log records in a list, so a worker process can send them back to
+    the parent process, which emits them with its own handlers."""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        # Format the message now: the arguments (e.g., exceptions) may not survive pickling.
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        self.records.append(record)
+
+
+_worker_address_cache = None
+_worker_log_collector = None
+
+
+def _initialize_worker(address_cache_path):
+    global _worker_address_cache, _worker_log_collector
+
+    _worker_address_cache = AddressCache(path=address_cache_path)
+    _worker_address_cache.warm()
+
+    _worker_log_collector = _LogRecordCollector()
+    logger.handlers = [_worker_log_collector]
+
+
+def _convert_chunk(dataframe):
+    """Convert a chunk of the dataframe in a worker process, and return the
+    converted rows, the log records, and the address cache counters."""
+    hits, disk_hits, misses = (
+        _worker_address_cache.hits,
+        _worker_address_cache.disk_hits,
+        _worker_address_cache.misses,
+    )
+
+    transformer = PathwaysTransformer(
+        dataframe=dataframe, address_cache=_worker_address_cache
+    )
+    rows = list(transformer._convert_to_pathways_json())
+    _worker_address_cache.flush()
+
+    records = _worker_log_collector.records
+    _worker_log_collector.records = []
+
+    return (
+        rows,
+        records,
+        (
+            _worker_address_cache.hits - hits,
+            _worker_address_cache.disk_hits - disk_hits,
+            _worker_address_cache.misses - misses,
+        ),
+    )
+
+
+class ConversionPool:
+    """A pool of worker processes that convert programs to Pathways JSON-LD
+    (see `PathwaysTransformer.pathways_transform`).
+
+    Starting the processes, and warming their address caches, takes a
+    while: start the pool once, and pass it to every PathwaysTransformer
+    of the process, e.g., one per chunk in the pipelined mode, or one per
+    run in the watch mode. Each worker has its own address cache, which
+    starts with the addresses in the SQLite database (if any).
+
+    Attributes:
+        workers: the number of processes
+        executor: the ProcessPoolExecutor of the processes
+    """
+
+    def __init__(self, workers, address_cache_path=None):
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_initialize_worker,
+            initargs=(address_cache_path,),
+        )
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.close()
 
 
 class PathwaysTransformer:
-    def __init__(self, dataframe):
+    def __init__(self, dataframe, address_cache=None):
         self.dataframe = dataframe
+        self.address_cache = AddressCache() if address_cache is None else address_cache
+        # The number of Pathways programs that could not be converted, set by `pathways_transform`.
+        self.rejected_count = 0
 
-    def _make_prereq_blob(self, row):
+    def _build_prereq_blob(self, hs_diploma_required, eligible_groups):
         prereq_blob = {}
 
-        if getattr(row, "HS diploma required?") == "Yes":
+        if hs_diploma_required:
             prereq_blob["credential_category"] = "HighSchool"
 
-        if getattr(row, "Eligible groups"):
-            competency_description = f"Must belong to one or more of the following group(s): {getattr(row, 'Eligible groups')}"
+        if eligible_groups:
+            competency_description = f"Must belong to one or more of the following group(s): {eligible_groups}"
             prereq_blob["competency_required"] = competency_description
 
         return prereq_blob
 
-    def _make_address_blob(self, row):
+    def _make_prereq_blob(self, row):
+        return self._build_prereq_blob(
+            getattr(row, "HS diploma required?") == "Yes",
+            getattr(row, "Eligible groups"),
+        )
+
+    def _parse_address(self, address):
+        parsed_address = usaddress.tag(address)[0]
+        street_address = f"{parsed_address.get('AddressNumber', '')} {parsed_address.get('StreetNamePreDirectional', '')} {parsed_address.get('StreetName', '')} {parsed_address.get('StreetNamePostType', '')}"
+        street_address = re.sub(
+            " +", " ", street_address
+        )  # Replace double spaces with single space
+
+        if street_address and street_address is not " ":
+            return {
+                "street_address": street_address,
+                "address_locality": parsed_address.get("PlaceName"),
+                "address_region": parsed_address.get("StateName"),
+                "postal_code": parsed_address.get("ZipCode"),
+                "address_country": "US",
+            }
+
+    def _build_address_blob(self, provider_address, program_address, row_id=None):
         def parse_address(address):
-            parsed_address = usaddress.tag(address)[0]
-            street_address = f"{parsed_address.get('AddressNumber', '')} {parsed_address.get('StreetNamePreDirectional', '')} {parsed_address.get('StreetName', '')} {parsed_address.get('StreetNamePostType', '')}"
-            street_address = re.sub(
-                " +", " ", street_address
-            )  # Replace double spaces with single space
-
-            if street_address and street_address is not " ":
-                return {
-                    "street_address": street_address,
-                    "address_locality": parsed_address.get("PlaceName"),
-                    "address_region": parsed_address.get("StateName"),
-                    "postal_code": parsed_address.get("ZipCode"),
-                    "address_country": "US",
-                }
+            return self.address_cache.get_or_parse(address, self._parse_address)
 
         provider_address_list = []
-        provider_address = getattr(row, "Organization Address")
-        program_address = getattr(
-            row, "Program Address (if different from organization address)"
-        )
 
         try:
             parsed_provider_address = parse_address(provider_address)
             if parsed_provider_address:
                 provider_address_list.append(parsed_provider_address)
         except Exception as err:
-            logger.error(err)
+            log_row_error(
+                f"Could not parse an address for Google Sheet Row: {row_id}.",
+                row_id,
+                err,
+            )
 
         if program_address:
             # The `Program Address` question in the Google form asks Goodwills to delimit multiple programs with a pipe character ("|").
@@ -67,10 +234,21 @@ class PathwaysTransformer:
                     if parsed_program_address:
                         provider_address_list.append(parsed_program_address)
                 except Exception as err:
-                    logger.error(err)
+                    log_row_error(
+                        f"Could not parse an address for Google Sheet Row: {row_id}.",
+                        row_id,
+                        err,
+                    )
 
         return provider_address_list
 
+    def _make_address_blob(self, row):
+        return self._build_address_blob(
+            getattr(row, "Organization Address"),
+            getattr(row, "Program Address (if different from organization address)"),
+            getattr(row, "Row Identifier (DO NOT EDIT)", None),
+        )
+
     def _convert_duration_to_isoformat(self, duration):
         duration_count = duration.split(" ")[0]
 
@@ -81,12 +259,60 @@ class PathwaysTransformer:
         elif "months" in duration:
             duration_in_isoformat = f"P{duration_count}M"
         else:
-            raise InvalidPathwaysData(
-                'The program does not have parseable input in "Duration / Time to complete" – needed for "TimeToComplete."'
-            )
+            raise InvalidPathwaysData(INVALID_DURATION_MESSAGE)
 
         return duration_in_isoformat
 
+    def _normalize_fields(self, df):
+        """This function normalizes the fields that the converters need, a
+        column at a time (rather than a row at a time), and returns them in
+        a new dataframe with the same index as `df`:
+
+        - "time_to_complete": the ISO 8601 duration, like `_convert_duration_to_isoformat`
+        - "hs_diploma_required" and "paid_training_available": booleans for the yes/no questions
+        - "rejection_reason": why the row cannot be converted, or None
+
+        The other fields go to the converters as the sheet has them. The
+        rejection reason covers the checks of this ETL (i.e., the
+        duration); a row that fails the validation of a converter still
+        gets rejected (and logged) in the row-by-row conversion.
+        """
+        durations = df["Duration / Time to complete"]
+        duration_counts = durations.str.extract(r"^([^ ]*)", expand=False)
+        duration_units = pd.Series(
+            np.select(
+                [
+                    durations.str.contains(unit, regex=False, na=False)
+                    for unit in ["days", "weeks", "months"]
+                ],
+                ["D", "W", "M"],
+                default="",
+            ),
+            index=df.index,
+        )
+        time_to_complete = ("P" + duration_counts + duration_units).where(
+            duration_units != ""
+        )
+
+        normalized = pd.DataFrame(
+            {
+                "time_to_complete": time_to_complete,
+                "hs_diploma_required": df["HS diploma required?"] == "Yes",
+                "paid_training_available": df[
+                    "Apprenticeship or Paid Training Available"
+                ]
+                == "Yes",
+            },
+            index=df.index,
+        )
+
+        normalized["rejection_reason"] = None
+        normalized.loc[
+            normalized["time_to_complete"].isna(), "rejection_reason"
+        ] = INVALID_DURATION_MESSAGE
+
+        return normalized
+
     def _filter_non_pathways_programs(self):
         return self.dataframe[
             self.dataframe["Should this program be available in Google Pathways?"]
@@ -95,123 +321,138 @@ class PathwaysTransformer:
 
     def _convert_to_pathways_json(self):
         df = self._filter_non_pathways_programs()
+        normalized = self._normalize_fields(df)
+
+        # Drop the rows that cannot be converted in bulk, before the row-by-row conversion.
+        rejected = normalized["rejection_reason"].notna()
+        for gs_row_identifier, rejection_reason in zip(
+            df.loc[rejected, "Row Identifier (DO NOT EDIT)"],
+            normalized.loc[rejected, "rejection_reason"],
+        ):
+            log_row_error(
+                f"Could not transform data for Google Sheet Row: {gs_row_identifier}.",
+                gs_row_identifier,
+                InvalidPathwaysData(rejection_reason),
+            )
 
-        for index, row in df.iterrows():
-            gs_row_identifier = getattr(row, "Row Identifier (DO NOT EDIT)")
-            provider_address = self._make_address_blob(row)
+        df = df[~rejected]
+        normalized = normalized[~rejected]
+
+        # Compile the field mappings into positions once, instead of looking up headers in every row.
+        headers = list(
+            dict.fromkeys(
+                [
+                    *ROW_FIELDS.values(),
+                    *WORK_BASED_PROGRAM_FIELDS.values(),
+                    *EDUCATIONAL_PROGRAM_FIELDS.values(),
+                ]
+            )
+        )
+        row_fields = compile_field_positions(headers, ROW_FIELDS)
+        converters = {
+            True: (
+                work_based_programs_converter,
+                compile_field_positions(headers, WORK_BASED_PROGRAM_FIELDS),
+            ),
+            False: (
+                educational_occupational_programs_converter,
+                compile_field_positions(headers, EDUCATIONAL_PROGRAM_FIELDS),
+            ),
+        }
+        columns = [object_column(df[header]) for header in headers]
+
+        for values, fields in zip(zip(*columns), normalized.itertuples(index=False)):
+            row = {name: values[position] for name, position in row_fields}
+            converter, converter_fields = converters[
+                bool(fields.paid_training_available)
+            ]
+
+            input_kwargs = {
+                name: values[position] for name, position in converter_fields
+            }
+            input_kwargs["provider_address"] = self._build_address_blob(
+                row["provider_address"],
+                row["program_address"],
+                row["gs_row_identifier"],
+            )
+            input_kwargs["time_to_complete"] = fields.time_to_complete
+
+            prereq_blob = self._build_prereq_blob(
+                fields.hs_diploma_required, row["eligible_groups"]
+            )
+            if prereq_blob:
+                input_kwargs["program_prerequisites"] = prereq_blob
 
             try:
-                time_to_complete = self._convert_duration_to_isoformat(
-                    getattr(row, "Duration / Time to complete")
-                )
-            except InvalidPathwaysData as err:
-                logger.error(
-                    f"Could not transform data for Google Sheet Row: {gs_row_identifier}. See below error."
+                pathways_json_ld = converter(**input_kwargs)
+            except ValueError as err:
+                log_row_error(
+                    f"Could not transform data for Google Sheet Row: {row['gs_row_identifier']}.",
+                    row["gs_row_identifier"],
+                    err,
                 )
-                logger.error(err)
                 continue
 
-            if getattr(row, "Apprenticeship or Paid Training Available") == "Yes":
-                input_kwargs = {
-                    "program_description": getattr(row, "Program description"),
-                    "program_name": getattr(row, "Program Name"),
-                    "program_url": getattr(row, "URL of Program"),
-                    "provider_name": getattr(row, "Goodwill Member Name"),
-                    "provider_url": getattr(row, "Organization URL"),
-                    "provider_telephone": getattr(
-                        row, "Contact phone number for program"
-                    ),
-                    "provider_address": provider_address,
-                    "start_date": getattr(row, "Start date(s)"),
-                    "end_date": getattr(row, "End Date(s)"),
-                    "maximum_enrollment": getattr(row, "Maximum Enrollment"),
-                    "occupational_credential_awarded": getattr(
-                        row,
-                        "What certification (exam), license, or certificate (if any) does this program prepare you for or give you?",
-                    ),
-                    "time_of_day": getattr(row, "Timing"),
-                    "time_to_complete": time_to_complete,
-                    "offers_price": getattr(
-                        row, "Total cost of the program (in dollars)"
-                    ),
-                    "training_salary": getattr(
-                        row, "If yes, average hourly wage paid to student"
-                    ),
-                    "salary_upon_completion": getattr(
-                        row, "Average ANNUAL salary post-graduation"
-                    ),
-                }
-
-                prereq_blob = self._make_prereq_blob(row)
-                if prereq_blob:
-                    input_kwargs["program_prerequisites"] = prereq_blob
+            yield [row["gs_row_identifier"], row["timestamp"], pathways_json_ld]
 
-                try:
-                    pathways_json_ld = work_based_programs_converter(**input_kwargs)
-                except ValueError as err:
-                    logger.error(
-                        f"Could not transform data for Google Sheet Row: {gs_row_identifier}. See below error."
-                    )
-                    logger.error(err)
-                    continue
-
-            else:
-                input_kwargs = {
-                    "application_deadline": getattr(row, "Application Deadline"),
-                    "program_name": getattr(row, "Program Name"),
-                    "program_description": getattr(row, "Program description"),
-                    "offers_price": getattr(
-                        row, "Total cost of the program (in dollars)"
-                    ),
-                    "program_url": getattr(row, "URL of Program"),
-                    "provider_name": getattr(row, "Goodwill Member Name"),
-                    "provider_url": getattr(row, "Organization URL"),
-                    "provider_telephone": getattr(
-                        row, "Contact phone number for program"
-                    ),
-                    "provider_address": provider_address,
-                    "time_to_complete": time_to_complete,
-                    "identifier_cip": getattr(row, "CIP Code"),
-                    "identifier_program_id": getattr(row, "Program ID"),
-                    "start_date": getattr(
-                        row, "Start date(s)"
-                    ),  # I think this is a list?
-                    "end_date": getattr(row, "End Date(s)"),  # I think this is a list?
-                    "occupational_credential_awarded": getattr(
-                        row,
-                        "What certification (exam), license, or certificate (if any) does this program prepare you for or give you?",
-                    ),
-                    "educational_program_mode": getattr(row, "Format"),
-                    "maximum_enrollment": getattr(row, "Maximum Enrollment"),
-                    "time_of_day": getattr(row, "Timing"),
-                }
-
-                prereq_blob = self._make_prereq_blob(row)
-                if prereq_blob:
-                    input_kwargs["program_prerequisites"] = prereq_blob
+    def _convert_to_pathways_json_in_parallel(self, pool):
+        """This function splits the dataframe into chunks, and converts the
+        chunks in the processes of a ConversionPool.
 
-                try:
-                    pathways_json_ld = educational_occupational_programs_converter(
-                        **input_kwargs
-                    )
-                except ValueError as err:
-                    logger.error(
-                        f"Could not transform data for Google Sheet Row: {gs_row_identifier}. See below error."
-                    )
-                    logger.error(err)
-                    continue
+        The rows come back in the same order as `_convert_to_pathways_json`
+        yields them. The log records of the workers get emitted in the
+        parent process, chunk by chunk.
+        """
+        df = self._filter_non_pathways_programs()
+        # Use several chunks per worker, so a slow chunk does not leave the other workers idle.
+        chunk_count = min(len(df), pool.workers * 4)
+        chunk_bounds = np.linspace(0, len(df), chunk_count + 1, dtype=int)
+        chunks = [
+            df.iloc[start:end] for start, end in zip(chunk_bounds, chunk_bounds[1:])
+        ]
+
+        for rows, records, address_cache_counts in pool.executor.map(
+            _convert_chunk, chunks
+        ):
+            for record in records:
+                logger.handle(record)
+
+            hits, disk_hits, misses = address_cache_counts
+            self.address_cache.hits += hits
+            self.address_cache.disk_hits += disk_hits
+            self.address_cache.misses += misses
 
-            yield [gs_row_identifier, getattr(row, "Timestamp"), pathways_json_ld]
+            yield from rows
 
-    def pathways_transform(self):
+    def pathways_transform(self, workers=None, pool=None):
         """This function consolidates the programs data into a "list of lists"
-        (i.e., the same data type the Google API resource returns)."""
+        (i.e., the same data type the Google API resource returns).
+
+        With a `pool` (a ConversionPool), the programs get converted in its
+        processes. Without one, `workers` greater than 1 starts a pool of
+        that many processes for this call only.
+        """
+        if pool is None and workers and workers > 1:
+            with ConversionPool(workers, self.address_cache.path) as pool:
+                return self.pathways_transform(pool=pool)
+
+        if pool is not None:
+            pathways_programs = self._convert_to_pathways_json_in_parallel(pool)
+        else:
+            pathways_programs = self._convert_to_pathways_json()
+
         list_of_lists = []
 
-        for list_with_pathways_program in self._convert_to_pathways_json():
+        for list_with_pathways_program in pathways_programs:
             list_of_lists.append(list_with_pathways_program)
 
         headers = ["id", "updated_at", "pathways_program"]
         dataframe_obj = pd.DataFrame(list_of_lists, columns=headers)
 
+        pathways_count = (
+            self.dataframe["Should this program be available in Google Pathways?"]
+            == "Yes"
+        ).sum()
+        self.rejected_count = int(pathways_count) - len(dataframe_obj)
+
         return dataframe_obj
@@ -0,0 +1,123 @@
+import re
+import sqlite3
+from collections import OrderedDict
+
+from etl.utils import json_codec
+
+
+class AddressCache:
+    """Caches parsed addresses, so the same address text only runs through
+    `usaddress` (a CRF model) once.
+
+    Most programs of a local Goodwill share the same organization address,
+    so the ETL sees the same few addresses over and over. Parsed addresses
+    are kept in a bounded, in-process LRU cache and, optionally, in a SQLite
+    database on disk, which lets later runs skip the CRF model for any
+    address seen before.
+
+    Attributes:
+        maxsize: the maximum number of addresses kept in memory
+        path: (optional) the path of the SQLite database
+        hits: the number of addresses found in memory
+        disk_hits: the number of addresses found in the SQLite database
+        misses: the number of addresses that had to be parsed
+    """
+
+    def __init__(self, maxsize=4096, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._parsed_addresses = OrderedDict()
+        self._connection = None
+
+        if path:
+            # The pipelined runner uses the cache from a worker thread (one at a time).
+            self._connection = sqlite3.connect(
+                path, timeout=30, check_same_thread=False
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS parsed_address "
+                "(address TEXT PRIMARY KEY, parsed_address TEXT)"
+            )
+
+    @staticmethod
+    def normalize(address):
+        """Collapse runs of whitespace, and strip leading and trailing
+        whitespace."""
+        return re.sub(r"\s+", " ", address).strip()
+
+    def _read_from_disk(self, address):
+        if self._connection is None:
+            return False, None
+
+        result = self._connection.execute(
+            "SELECT parsed_address FROM parsed_address WHERE address = ?", (address,)
+        ).fetchone()
+        if result is None:
+            return False, None
+
+        return True, json_codec.loads(result[0])
+
+    def _write_to_disk(self, address, parsed_address):
+        if self._connection is not None:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO parsed_address VALUES (?, ?)",
+                (address, json_codec.dumps(parsed_address)),
+            )
+
+    def _remember(self, address, parsed_address):
+        self._parsed_addresses[address] = parsed_address
+        if len(self._parsed_addresses) > self.maxsize:
+            self._parsed_addresses.popitem(last=False)
+
+    def get_or_parse(self, address, parse):
+        """Return the parsed version of `address`, and only call `parse` (with
+        the normalized address) when the address is not cached.
+
+        Exceptions raised by `parse` propagate, and nothing gets cached.
+        """
+        address = self.normalize(address)
+
+        if address in self._parsed_addresses:
+            self._parsed_addresses.move_to_end(address)
+            self.hits += 1
+            parsed_address = self._parsed_addresses[address]
+        else:
+            found, parsed_address = self._read_from_disk(address)
+            if found:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+                parsed_address = parse(address)
+                self._write_to_disk(address, parsed_address)
+
+            self._remember(address, parsed_address)
+
+        # Callers get their own copy, which they can change without changing the cache.
+        return dict(parsed_address) if parsed_address else parsed_address
+
+    def warm(self):
+        """Load up to `maxsize` addresses from the SQLite database into
+        memory, e.g., before a worker process starts converting rows."""
+        if self._connection is None:
+            return
+
+        results = self._connection.execute(
+            "SELECT address, parsed_address FROM parsed_address LIMIT ?",
+            (self.maxsize,),
+        )
+        for address, parsed_address in results:
+            self._remember(address, json_codec.loads(parsed_address))
+
+    def flush(self):
+        """Commit newly parsed addresses to the SQLite database."""
+        if self._connection is not None:
+            self._connection.commit()
+
+    def close(self):
+        self.flush()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
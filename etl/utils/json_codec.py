@@ -0,0 +1,125 @@
+import json
+import math
+import re
+
+"""The JSON codec of the ETL: it serializes the Pathways JSON-LD documents for the database (the
+`json_serializer` and `json_deserializer` of the engine), for COPY, for the content hashes, and for
+the ETL state tables.
+
+It uses orjson, if it is installed (`pip install orjson`), which serializes several times faster
+than the standard library, and falls back to the standard library otherwise. Both backends write
+the same canonical JSON (sorted keys, no whitespace, UTF-8 rather than escapes, floats as written by
+`repr`, and null for NaN and Infinity, which JSON does not have), so that a content hash does not
+depend on the backend.
+"""
+
+# The JSON of orjson may write a float unlike `repr` (e.g., `1e-5`, or `0.00001`, for `1e-05`,
+# depending on the version), only if it has an exponent, or many digits. The pattern only matches a
+# number (i.e., first, or right after `:`, `,` or `[`, in JSON without whitespace), so that digits
+# in strings (e.g., a Row Identifier, or "Suite 1E") do not count; a string like "a,1e5" still
+# matches, which only costs a second serialization.
+ORJSON_FLOAT_PATTERN = re.compile(
+    r"(?:^|[:,\[])-?(?:[0-9][0-9.]*[eE]|0\.0000|[0-9]{17})"
+)
+
+
+def _replace_non_finite_floats(value):
+    """Return a copy of `value`, in which NaN and Infinity are None."""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _replace_non_finite_floats(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_replace_non_finite_floats(item) for item in value]
+
+    return value
+
+
+class StdlibCodec:
+    """A JSON codec on top of the `json` module of the standard library."""
+
+    name = "json"
+
+    def dumps(self, value, canonical=False):
+        """Serialize `value` to a str of compact JSON. Values that JSON does
+        not support (e.g., a datetime) get serialized with `str`.
+
+        A canonical document has sorted keys, which makes its text (and its
+        hash) the same, regardless of key order.
+
+        NaN and Infinity become null, like in orjson (and PostgreSQL does not
+        accept them in a JSON document either).
+        """
+        text = self._dumps(value, canonical)
+        if "NaN" in text or "Infinity" in text:
+            # Most likely a non-finite float, but maybe a string: serialize again, without them.
+            text = self._dumps(_replace_non_finite_floats(value), canonical)
+
+        return text
+
+    def _dumps(self, value, canonical):
+        return json.dumps(
+            value,
+            sort_keys=canonical,
+            separators=(",", ":"),
+            ensure_ascii=False,
+            default=str,
+        )
+
+    def loads(self, text):
+        return json.loads(text)
+
+
+class OrjsonCodec:
+    """A JSON codec on top of orjson, which writes the same JSON as the
+    StdlibCodec: a document that may have a float that orjson writes
+    unlike `repr` (see ORJSON_FLOAT_PATTERN) goes through the StdlibCodec."""
+
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+
+        self.orjson = orjson
+        # Datetimes go to `default` (i.e., `str`), like in the StdlibCodec, rather than to the RFC 3339 format of orjson.
+        self.options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        self.stdlib_codec = StdlibCodec()
+
+    def dumps(self, value, canonical=False):
+        options = self.options
+        if canonical:
+            options |= self.orjson.OPT_SORT_KEYS
+
+        text = self.orjson.dumps(value, default=str, option=options).decode("utf-8")
+        if ORJSON_FLOAT_PATTERN.search(text):
+            return self.stdlib_codec.dumps(value, canonical=canonical)
+
+        return text
+
+    def loads(self, text):
+        return self.orjson.loads(text)
+
+
+def get_codec(name=None):
+    """Return the codec called `name` ("orjson" or "json"), or, by default,
+    the fastest one installed."""
+    if name == StdlibCodec.name:
+        return StdlibCodec()
+
+    try:
+        return OrjsonCodec()
+    except ImportError:
+        if name == OrjsonCodec.name:
+            raise
+        return StdlibCodec()
+
+
+codec = get_codec()
+
+
+def dumps(value, canonical=False):
+    return codec.dumps(value, canonical=canonical)
+
+
+def loads(text):
+    return codec.loads(text)
@@ -0,0 +1,133 @@
+import logging
+import threading
+from collections import OrderedDict
+
+
+class BatchingHandler(logging.Handler):
+    """This handler collects log records, and passes them on to a `target`
+    handler (e.g., the SlackHandler) as one record, so that a burst of
+    records costs one HTTP request rather than one per record.
+
+    The batch goes out when it holds `capacity` records, when its oldest
+    record is `flush_interval` seconds old (on a timer, even if no other
+    record arrives), and at `flush` or `close`. It runs behind a QueueListener, i.e., off the
+    thread that logs.
+    """
+
+    def __init__(self, target, capacity=50, flush_interval=5.0):
+        super().__init__()
+        self.target = target
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self._flush_timer = None
+
+    def emit(self, record):
+        if not self.buffer:
+            self._flush_timer = threading.Timer(self.flush_interval, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+        self.buffer.append(record)
+
+        if len(self.buffer) >= self.capacity:
+            self.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self.buffer:
+                return
+
+            records, self.buffer = self.buffer, []
+            batch = logging.makeLogRecord(records[-1].__dict__)
+            batch.levelno = max(record.levelno for record in records)
+            batch.levelname = logging.getLevelName(batch.levelno)
+            # `format` keeps the traceback of a record with `exc_info` (e.g., from `logger.exception`).
+            batch.msg = "\n".join(self.format(record) for record in records)
+            batch.args = None
+            batch.exc_info = None
+            batch.exc_text = None
+
+            self.target.handle(batch)
+        finally:
+            self.release()
+
+    def close(self):
+        self.flush()
+        self.target.close()
+        super().close()
+
+
+class DeferredHandler(logging.Handler):
+    """This handler passes records on to a handler that it makes (with
+    `make_handler`, a function that takes no arguments) when the first
+    record arrives, e.g., so that the module of that handler gets imported
+    off the startup path.
+    """
+
+    def __init__(self, make_handler):
+        super().__init__()
+        self.make_handler = make_handler
+        self.handler = None
+
+    def emit(self, record):
+        if self.handler is None:
+            self.handler = self.make_handler()
+        self.handler.handle(record)
+
+    def close(self):
+        if self.handler is not None:
+            self.handler.close()
+        super().close()
+
+
+class RowErrorSummary(logging.Filter):
+    """This filter holds back the errors about single rows (i.e., records
+    with an `error_type`, and a `row_id`: see `log_row_error`), and counts
+    them instead. `summarize` returns one message for all of them, with
+    the count per error type and up to `sample_size` row ids per type.
+
+    Attach it to a handler that should not get one record per row, e.g.,
+    the Slack handler.
+    """
+
+    def __init__(self, sample_size=10):
+        super().__init__()
+        self.sample_size = sample_size
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = OrderedDict()
+            self.samples = {}
+
+    def filter(self, record):
+        error_type = getattr(record, "error_type", None)
+        if error_type is None:
+            return True
+
+        with self._lock:
+            self.counts[error_type] = self.counts.get(error_type, 0) + 1
+            sample = self.samples.setdefault(error_type, [])
+            if len(sample) < self.sample_size:
+                sample.append(str(getattr(record, "row_id", None)))
+
+        return False
+
+    def summarize(self):
+        """Return a message that summarizes the row errors, or None if there
+        were none."""
+        with self._lock:
+            if not self.counts:
+                return None
+
+            lines = [f"Could not process {sum(self.counts.values())} rows:"] + [
+                f"{count} x {error_type} (e.g., rows {', '.join(self.samples[error_type])})"
+                for error_type, count in self.counts.items()
+            ]
+
+        return "\n".join(lines)
@@ -1,32 +1,100 @@
+import atexit
 import logging
 import logging.config
+import logging.handlers
+import queue
 
 from config.config import SLACK_WEBHOOK_URL
-from webhook_logger.slack import SlackHandler
-from webhook_logger.slack import SlackFormatter
+
+from etl.utils.log_handlers import BatchingHandler, DeferredHandler, RowErrorSummary
 
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
     "formatters": {
-        "verbose": {"format": "%(asctime)s [%(levelname)s] %(name)s: %(message)s"},
-        "slack_format": {"()": "webhook_logger.slack.SlackFormatter"},
+        "verbose": {"format": "%(asctime)s [%(levelname)s] %(name)s: %(message)s"}
     },
     "handlers": {
         "console": {
             "level": "INFO",
             "class": "logging.StreamHandler",
             "formatter": "verbose",
-        },
-        "slack": {
-            "level": "INFO",
-            "class": "webhook_logger.slack.SlackHandler",
-            "hook_url": SLACK_WEBHOOK_URL,
-            "formatter": "slack_format",
-        },
+        }
     },
-    "loggers": {"logger": {"handlers": ["console", "slack"], "level": "INFO"}},
+    "loggers": {"logger": {"handlers": ["console"], "level": "INFO"}},
 }
 
 logging.config.dictConfig(LOGGING)
 logger = logging.getLogger("logger")
+
+"""Slack gets its records through a queue: the QueueHandler only puts records on the queue, and a
+QueueListener thread posts them to Slack in batches. Errors about single rows never reach Slack
+one by one: they get counted, and `log_row_error_summary` posts one summary per run.
+"""
+
+
+def make_slack_handler():
+    # webhook_logger imports requests: the DeferredHandler imports it with the first record, on the QueueListener thread, rather than at startup.
+    from webhook_logger.slack import SlackFormatter, SlackHandler
+
+    slack_handler = SlackHandler(hook_url=SLACK_WEBHOOK_URL)
+    slack_handler.setFormatter(SlackFormatter())
+
+    return slack_handler
+
+
+slack_batching_handler = BatchingHandler(DeferredHandler(make_slack_handler))
+
+row_error_summary = RowErrorSummary()
+slack_queue = queue.Queue(-1)
+slack_queue_handler = logging.handlers.QueueHandler(slack_queue)
+slack_queue_handler.setLevel(logging.INFO)
+slack_queue_handler.addFilter(row_error_summary)
+logger.addHandler(slack_queue_handler)
+
+slack_listener = logging.handlers.QueueListener(slack_queue, slack_batching_handler)
+slack_listener.start()
+
+
+def log_row_error(message, row_id, error):
+    """Log an error about one row of the sheet, e.g., a program that cannot
+    be converted to Pathways JSON-LD, or loaded."""
+    logger.error(
+        f"{message} {error}",
+        extra={"row_id": row_id, "error_type": type(error).__name__},
+    )
+
+
+def log_row_error_summary():
+    """Log one message that counts the row errors since the last summary."""
+    summary = row_error_summary.summarize()
+    row_error_summary.reset()
+
+    if summary:
+        logger.error(summary)
+
+
+_slack_listener_running = True
+
+
+def flush_slack_logging():
+    """Post the records that wait in the queue and in the current batch,
+    e.g., at the end of a run of the watch mode, which then sits idle
+    until the sheet changes."""
+    if _slack_listener_running:
+        # The QueueListener marks each record done, once it is handled.
+        slack_queue.join()
+    slack_batching_handler.flush()
+
+
+@atexit.register
+def shutdown_slack_logging():
+    """Post the row error summary and the last batch, and stop the
+    QueueListener (once, even if called again at exit)."""
+    global _slack_listener_running
+
+    log_row_error_summary()
+    if _slack_listener_running:
+        _slack_listener_running = False
+        slack_listener.stop()
+    slack_batching_handler.flush()
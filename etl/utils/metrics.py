@@ -0,0 +1,301 @@
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+METRIC_PREFIX = "goodwill_etl"
+
+# (metric name, attribute) of the StageMetrics, and of the LatencyMetrics
+STAGE_METRICS = [
+    ("stage_wall_seconds", "wall_seconds"),
+    ("stage_cpu_seconds", "cpu_seconds"),
+    ("stage_peak_rss_bytes", "peak_rss_bytes"),
+    ("stage_rows_in", "rows_in"),
+    ("stage_rows_out", "rows_out"),
+    ("stage_rows_rejected", "rows_rejected"),
+]
+LATENCY_METRICS = [
+    ("calls", "count"),
+    ("seconds_total", "total_seconds"),
+    ("max_seconds", "max_seconds"),
+]
+
+
+def _get_peak_rss_bytes():
+    """The high-water mark of the memory of this process, since it started."""
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, and macOS reports bytes.
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+def _get_rss_bytes():
+    """The current memory (resident set size) of this process, or None where
+    there is no /proc (e.g., macOS)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return None
+
+
+class _RssSampler(threading.Thread):
+    """A thread that samples the memory of this process every `interval`
+    seconds, until `stop`, and keeps the peak."""
+
+    def __init__(self, interval=0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_rss_bytes = 0
+        self._stopped = threading.Event()
+        self._sample()
+
+    def _sample(self):
+        self.peak_rss_bytes = max(self.peak_rss_bytes, _get_rss_bytes() or 0)
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self._sample()
+
+    def stop(self):
+        """Stop sampling, and return the peak."""
+        self._stopped.set()
+        self.join()
+        self._sample()
+
+        return self.peak_rss_bytes
+
+
+def _get_cpu_seconds():
+    """CPU time of this process and of its (finished) child processes, e.g.,
+    the workers that convert programs to Pathways JSON-LD."""
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+def _escape_label_value(label_value):
+    """Escape a label value for the Prometheus text format: a backslash, a
+    double quote, and a line feed."""
+    return (
+        str(label_value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    )
+
+
+class StageMetrics:
+    """The metrics of one stage of the ETL (e.g., "extract" or "load").
+
+    The `stage` context manager of RunMetrics measures the times and
+    memory; the caller sets the row counts. The peak memory is sampled
+    while the stage runs, so it is the peak of the stage itself, rather
+    than of the whole process (except where there is no /proc, e.g.,
+    macOS).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_rss_bytes = 0
+        self.rows_in = 0
+        self.rows_out = 0
+        self.rows_rejected = 0
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+class LatencyMetrics:
+    """The count, total, and maximum of a series of latencies (in seconds)."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+class RunMetrics:
+    """This class collects the metrics of one ETL run: the wall time, CPU
+    time, peak memory, and row counts of each stage, the latencies of the
+    Google Sheets API calls, and the count and latencies of the database
+    statements (by statement type, e.g., "SELECT" or "INSERT").
+
+    It writes the metrics as a node-exporter textfile (Prometheus text
+    format), and as a JSON run record.
+
+    Attributes:
+        stages: an OrderedDict of {stage name: StageMetrics}
+        sheets_api_calls: a LatencyMetrics of the Google Sheets API calls
+        db_statements: a dict of {statement type: LatencyMetrics}
+    """
+
+    def __init__(self):
+        # The Extractor and the database calls may run in several threads at once.
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Start over, e.g., for the next run of the watch mode; an engine
+        instrumented with `instrument_engine` stays instrumented."""
+        with self._lock:
+            self.started_at = time.time()
+            self.stages = OrderedDict()
+            self.sheets_api_calls = LatencyMetrics()
+            self.db_statements = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Measure the code in the `with` block as the stage `name`, e.g.:
+
+        ```
+        with metrics.stage("load") as stage:
+            loaded_ids = loader.load_data(...)
+            stage.rows_out = len(loaded_ids)
+        ```
+        """
+        stage = self.stages.setdefault(name, StageMetrics(name))
+        rss_sampler = None
+        if _get_rss_bytes() is not None:
+            rss_sampler = _RssSampler()
+            rss_sampler.start()
+        start_wall = time.perf_counter()
+        start_cpu = _get_cpu_seconds()
+
+        try:
+            yield stage
+        finally:
+            stage.wall_seconds += time.perf_counter() - start_wall
+            stage.cpu_seconds += _get_cpu_seconds() - start_cpu
+            stage.peak_rss_bytes = max(
+                stage.peak_rss_bytes,
+                rss_sampler.stop()
+                if rss_sampler is not None
+                else _get_peak_rss_bytes(),
+            )
+
+    def record_sheets_api_call(self, seconds):
+        with self._lock:
+            self.sheets_api_calls.observe(seconds)
+
+    def record_db_statement(self, statement, seconds):
+        statement_type = statement.lstrip().split(None, 1)[0].upper()
+
+        with self._lock:
+            self.db_statements.setdefault(statement_type, LatencyMetrics()).observe(
+                seconds
+            )
+
+    def instrument_engine(self, engine):
+        """Time every statement that `engine` executes, with the
+        `before_cursor_execute` and `after_cursor_execute` events of
+        SQLAlchemy."""
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(
+            connection, cursor, statement, parameters, context, executemany
+        ):
+            connection.info.setdefault("query_start_times", []).append(
+                time.perf_counter()
+            )
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(
+            connection, cursor, statement, parameters, context, executemany
+        ):
+            start = connection.info["query_start_times"].pop()
+            self.record_db_statement(statement, time.perf_counter() - start)
+
+    def _make_samples(self):
+        """Return the metrics as a list of (name, labels, value)."""
+        samples = []
+
+        # The samples of a metric have to be next to each other in the textfile.
+        for name, attribute in STAGE_METRICS:
+            for stage in self.stages.values():
+                samples.append((name, {"stage": stage.name}, getattr(stage, attribute)))
+
+        for name, attribute in LATENCY_METRICS:
+            samples.append(
+                (f"sheets_api_{name}", {}, getattr(self.sheets_api_calls, attribute))
+            )
+
+        for name, attribute in LATENCY_METRICS:
+            for statement_type, latencies in sorted(self.db_statements.items()):
+                samples.append(
+                    (
+                        f"db_statement_{name}",
+                        {"statement": statement_type},
+                        getattr(latencies, attribute),
+                    )
+                )
+
+        samples.append(("last_success_timestamp_seconds", {}, time.time()))
+
+        return samples
+
+    def to_prometheus_text(self):
+        lines = []
+        described = set()
+
+        for name, labels, value in self._make_samples():
+            metric_name = f"{METRIC_PREFIX}_{name}"
+            if metric_name not in described:
+                described.add(metric_name)
+                lines.append(f"# TYPE {metric_name} gauge")
+
+            label_text = ",".join(
+                f'{label}="{_escape_label_value(label_value)}"'
+                for label, label_value in labels.items()
+            )
+            if label_text:
+                metric_name = f"{metric_name}{{{label_text}}}"
+            lines.append(f"{metric_name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self):
+        return {
+            "started_at": self.started_at,
+            "finished_at": time.time(),
+            "stages": [stage.as_dict() for stage in self.stages.values()],
+            "sheets_api_calls": self.sheets_api_calls.as_dict(),
+            "db_statements": {
+                statement_type: latencies.as_dict()
+                for statement_type, latencies in self.db_statements.items()
+            },
+        }
+
+    def _write_atomically(self, path, text):
+        """Write to a temporary file in the same directory, and then rename
+        it, so that node-exporter never reads half a file."""
+        directory = os.path.dirname(os.path.abspath(path))
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+
+        try:
+            with os.fdopen(file_descriptor, "w") as temporary_file:
+                temporary_file.write(text)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+    def write_textfile(self, path):
+        """Write the metrics for the node-exporter textfile collector (the
+        file name has to end in `.prom`)."""
+        self._write_atomically(path, self.to_prometheus_text())
+
+    def write_json(self, path):
+        self._write_atomically(path, json.dumps(self.to_dict(), indent=2))
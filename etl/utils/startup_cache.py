@@ -0,0 +1,135 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+
+from sqlalchemy import MetaData, Table
+from sqlalchemy.sql import text
+
+"""These caches make a short, incremental run start faster: they save the reflection of the
+`pathways_program` table (several catalog queries), and the download of the Google Sheets
+discovery document, on every run. Both caches live in a local directory, which only the ETL
+should be able to write to, since the cached table is a pickle.
+"""
+
+# A hash of the columns, constraints and indexes of a table: any change in its schema changes the fingerprint.
+TABLE_FINGERPRINT_QUERY = text(
+    """
+    SELECT md5(
+        coalesce((
+            SELECT string_agg(
+                attname || ' ' || format_type(atttypid, atttypmod) || ' ' || attnotnull::text,
+                ', ' ORDER BY attnum
+            )
+            FROM pg_attribute
+            WHERE attrelid = to_regclass(:table_name) AND attnum > 0 AND NOT attisdropped
+        ), '')
+        || coalesce((
+            SELECT string_agg(pg_get_constraintdef(oid), ', ' ORDER BY conname)
+            FROM pg_constraint
+            WHERE conrelid = to_regclass(:table_name)
+        ), '')
+        || coalesce((
+            SELECT string_agg(indexdef, ', ' ORDER BY indexname)
+            FROM pg_indexes
+            WHERE tablename = :table_name
+        ), '')
+    )
+    """
+)
+
+
+def _write_atomically(path, content):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+
+    try:
+        with os.fdopen(file_descriptor, "wb") as temporary_file:
+            temporary_file.write(content)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+
+def reflect_table(engine, table_name, cache_path=None):
+    """This function returns a SQLAlchemy Table object that reflects
+    `table_name`, like `Table(table_name, MetaData(bind=engine), autoload=True)`.
+
+    With a `cache_path`, the reflected MetaData gets pickled to that file,
+    along with a fingerprint of the table schema (one cheap catalog
+    query). The next call reuses the pickle, unless the fingerprint has
+    changed, e.g., after a migration of the Google Pathways API.
+    """
+    if cache_path is None:
+        return Table(table_name, MetaData(bind=engine), autoload=True)
+
+    with engine.connect() as connection:
+        fingerprint = connection.execute(
+            TABLE_FINGERPRINT_QUERY, table_name=table_name
+        ).scalar()
+
+    try:
+        with open(cache_path, "rb") as cache_file:
+            cached_schema = pickle.load(cache_file)
+
+        if cached_schema["fingerprint"] == fingerprint:
+            metadata = cached_schema["metadata"]
+            metadata.bind = engine
+            return metadata.tables[table_name]
+    except (
+        OSError,
+        EOFError,
+        KeyError,
+        AttributeError,
+        ImportError,
+        pickle.PickleError,
+    ):
+        # A missing, stale, or unreadable cache: reflect the table again.
+        pass
+
+    metadata = MetaData(bind=engine)
+    table = Table(table_name, metadata, autoload=True)
+    _write_atomically(
+        cache_path, pickle.dumps({"fingerprint": fingerprint, "metadata": metadata})
+    )
+
+    return table
+
+
+class FileDiscoveryCache:
+    """A cache of Google API discovery documents on disk, which
+    `googleapiclient.discovery.build` takes as its `cache` argument: it
+    calls `get(url)`, and `set(url, content)` after a download.
+
+    A document older than `max_age` seconds gets downloaded again, so the
+    client picks up changes to the API.
+    """
+
+    def __init__(self, directory, max_age=24 * 3600):
+        self.directory = directory
+        self.max_age = max_age
+
+    def _get_path(self, url):
+        url_hash = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"discovery-{url_hash}.json")
+
+    def get(self, url):
+        path = self._get_path(url)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                return None
+
+            with open(path, encoding="utf-8") as cache_file:
+                return cache_file.read()
+        except OSError:
+            return None
+
+    def set(self, url, content):
+        try:
+            _write_atomically(self._get_path(url), content.encode("utf-8"))
+        except OSError:
+            # The cache only saves a download: a read-only directory should not stop the ETL.
+            pass
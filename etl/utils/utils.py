@@ -1,12 +1,92 @@
+import hashlib
+import itertools
+
+import numpy as np
 import pandas as pd
 
+from etl.utils import json_codec
+
+
+# Columns with a handful of distinct values, which take less memory as categoricals.
+CATEGORICAL_HEADERS = [
+    "Should this program be available in Google Pathways?",
+    "Goodwill Member Name",
+    "Format",
+    "Timing",
+]
 
-def make_dataframe_with_headers(list_of_lists):
+
+def make_dataframe_with_headers(list_of_lists, compact=False):
     """This function converts the list of lists into a Pandas dataframe with
-    headers (and without a zeroeth row that contains header names)."""
+    headers (and without a zeroeth row that contains header names).
+
+    The header row is skipped (rather than dropped from the dataframe,
+    which copies it), and rows with fewer values than headers are padded
+    with None. The index starts at 1, i.e., the position of the row in
+    `list_of_lists`.
+
+    With `compact` (and unique headers), the columns in CATEGORICAL_HEADERS become categoricals,
+    and the other columns keep a single copy of each distinct string,
+    which shrinks the dataframe when the sheet has thousands of rows.
+    """
     headers = list_of_lists[0]
+    header_count = len(headers)
+
+    rows = [
+        row + [None] * (header_count - len(row)) if len(row) < header_count else row
+        for row in itertools.islice(list_of_lists, 1, None)
+    ]
+    df = pd.DataFrame(
+        rows, columns=headers, index=pd.RangeIndex(1, len(rows) + 1), dtype=object
+    )
 
-    df = pd.DataFrame(list_of_lists, columns=headers)
-    df.drop(df.index[0], inplace=True)
+    if compact and df.columns.is_unique:
+        for header in df.columns:
+            if header in CATEGORICAL_HEADERS:
+                df[header] = df[header].astype("category")
+            else:
+                df[header] = deduplicate_strings(df[header])
 
     return df
+
+
+def deduplicate_strings(series):
+    """This function returns a copy of a Series, in which equal values are
+    the same Python object (e.g., the organization address that repeats in
+    every row of a local Goodwill), so each distinct string is stored once.
+    Missing values stay None."""
+    codes, uniques = pd.factorize(series)
+    values = np.asarray(uniques, dtype=object).take(codes)
+    values[codes == -1] = None
+
+    return pd.Series(values, index=series.index, name=series.name, dtype=object)
+
+
+def object_column(series):
+    """This function returns the values of a Series as a NumPy array of Python
+    objects, with None for missing values (e.g., in categorical columns,
+    which represent missing values as NaN)."""
+    values = series.to_numpy(dtype=object)
+    values[pd.isna(values)] = None
+
+    return values
+
+
+def hash_pathways_program(pathways_program):
+    """This function returns a stable content hash (SHA-256) of a Pathways
+    JSON-LD document: two documents with the same content have the same hash,
+    regardless of key order."""
+    canonical_json = json_codec.dumps(pathways_program, canonical=True)
+
+    return hashlib.sha256(canonical_json.encode("utf-8")).hexdigest()
+
+
+def format_id_sample(ids, sample_size=20):
+    """This function joins up to `sample_size` ids for a log message, and
+    notes how many more there are, so that a large run does not send a
+    message with thousands of ids."""
+    sample = " ".join(str(identifier) for identifier in ids[:sample_size])
+    if len(ids) > sample_size:
+        sample += f" (and {len(ids) - sample_size} more)"
+
+    return sample
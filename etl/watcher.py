@@ -0,0 +1,126 @@
+import hashlib
+import time
+
+from etl.parsed_sheet import PATHWAYS_OPT_IN_HEADER, ROW_IDENTIFIER_HEADER
+from etl.utils import json_codec
+from etl.utils.logger import logger
+
+"""The watch mode runs the ETL in a long-running process, which polls the master sheet for a change,
+and only runs the ETL when there is one. Between runs, the process keeps its warm state: the Sheets
+API client (and its discovery document), the database connection pool, the reflected programs
+table, and the address cache.
+
+The modifiedTime of the master sheet (in Google Drive) is no use as a change signal, since
+`rewriteMasterSheet` clears and rewrites the sheet on a timer, whether or not a local sheet changed.
+"""
+
+# The columns that the change signal reads: a new, edited (i.e., resubmitted), deleted, or opted-out program changes one of them.
+SIGNAL_HEADERS = ["Timestamp", ROW_IDENTIFIER_HEADER, PATHWAYS_OPT_IN_HEADER]
+
+
+def get_column_letter(position):
+    """Return the A1 notation letter(s) of the column at `position`
+    (counting from 0), e.g., "A", "Z", or "AA"."""
+    letters = ""
+    position += 1
+    while position:
+        position, remainder = divmod(position - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+
+    return letters
+
+
+class SheetWatcher:
+    """This class polls the master sheet, and runs the ETL when the sheet has
+    changed.
+
+    The change signal is a hash of the header row and of the SIGNAL_HEADERS
+    columns, which one `batchGet` call reads: a few columns, rather than
+    the whole sheet.
+
+    Attributes:
+        extractor: the Extractor of the master sheet
+        poll_interval: the number of seconds between polls
+        last_signature: the change signal of the sheet at the last successful run (None before the first run)
+    """
+
+    def __init__(self, extractor, poll_interval=60, sleep=time.sleep):
+        self.extractor = extractor
+        self.poll_interval = poll_interval
+        self.sleep = sleep
+        self.last_signature = None
+        self._headers = None
+        self._column_ranges = []
+
+    def _get_column_ranges(self, headers):
+        """Return the A1 ranges of the SIGNAL_HEADERS columns, without the
+        header row, e.g., "C2:C"."""
+        column_letters = [
+            get_column_letter(headers.index(header))
+            for header in SIGNAL_HEADERS
+            if header in headers
+        ]
+
+        return [f"{letter}2:{letter}" for letter in column_letters]
+
+    def get_signature(self):
+        """Return the change signal of the sheet, i.e., a SHA-256 hash of the
+        header row and the SIGNAL_HEADERS columns.
+
+        The columns get read along with the header row, at their positions
+        in the previous poll. If the headers have changed (e.g., at the
+        first poll), the columns get read again, at their new positions.
+        """
+        headers, *columns = self.extractor.get_ranges(["1:1"] + self._column_ranges)
+        headers = headers[0] if headers else []
+
+        if headers != self._headers:
+            self._headers = headers
+            self._column_ranges = self._get_column_ranges(headers)
+            columns = (
+                self.extractor.get_ranges(self._column_ranges)
+                if self._column_ranges
+                else []
+            )
+
+        return hashlib.sha256(
+            json_codec.dumps([headers, columns]).encode("utf-8")
+        ).hexdigest()
+
+    def run_if_changed(self, run):
+        """Run the ETL (i.e., call `run`) if the sheet has changed since the
+        last successful run, and return whether it ran.
+
+        The change signal gets read before the run, so that a change made
+        during the run triggers the next one.
+        """
+        signature = self.get_signature()
+        if signature == self.last_signature:
+            logger.debug("----The sheet has not changed: skipping this run.")
+            return False
+
+        run()
+        self.last_signature = signature
+
+        return True
+
+    def watch(self, run, max_polls=None):
+        """Poll the sheet every `poll_interval` seconds (`max_polls` times, or
+        for ever), and run the ETL when the sheet has changed.
+
+        A failed poll or run gets logged, and does not stop the watch: since
+        the change signal only gets saved after a successful run, the next
+        poll runs the ETL again.
+        """
+        polls = 0
+        while max_polls is None or polls < max_polls:
+            polls += 1
+            try:
+                self.run_if_changed(run)
+            except Exception:
+                logger.exception(
+                    "----The ETL run failed: trying again at the next poll."
+                )
+
+            if max_polls is None or polls < max_polls:
+                self.sleep(self.poll_interval)
@@ -1,4 +1,7 @@
-from sqlalchemy import MetaData, Table, create_engine
+import argparse
+import os
+
+from sqlalchemy import create_engine
 from sqlalchemy.exc import OperationalError
 
 from config.config import (
@@ -6,59 +9,521 @@ from config.config import (
     MASTER_SHEET_ID,
     SQLALCHEMY_DATABASE_URI,
 )
+from etl.etl_state import EtlState, WatermarkBounds
 from etl.extractor import Extractor
-from etl.loader import Loader
-from etl.pathways_opt_out import OptOut
-from etl.transformers.dataframe_transformer import DataframeTransformer
-from etl.transformers.pathways_transformer import PathwaysTransformer
-from etl.utils.logger import logger
+from etl.utils import json_codec
+from etl.utils.logger import log_row_error_summary, logger
+from etl.utils.metrics import RunMetrics
+from etl.utils.startup_cache import FileDiscoveryCache, reflect_table
 
 """This ETL process accesses the Pathways database via a SQLAlchemy MetaData object, which describes the
 database schema and this makes available a Table object.
 
 Read more about database reflection: https://docs.sqlalchemy.org/en/13/core/reflection.html
+
+The modules that only some runs need (e.g., the converter and usaddress, which only run when there
+are updated programs) get imported where they are used, to keep startup short. So do the modules
+that import pandas (e.g., ParsedSheet), which a run only needs once the sheet has been extracted.
+To see where the startup time goes: `python -X importtime runner.py 2> importtime.log`.
 """
 
-engine = create_engine(SQLALCHEMY_DATABASE_URI)
-metadata = MetaData(bind=engine)
+parser = argparse.ArgumentParser(description="Run the Goodwill programs ETL.")
+parser.add_argument(
+    "--member-mappings-sheet-id",
+    help="read the local Goodwill sheets listed in this member mappings sheet, instead of the data in the master sheet",
+)
+parser.add_argument(
+    "--address-cache",
+    help="the path of a SQLite database that stores parsed addresses between runs",
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    help="the number of processes that convert programs to Pathways JSON-LD",
+)
+parser.add_argument(
+    "--pipelined",
+    action="store_true",
+    help="extract, transform and load the sheet in chunks, with the stages running concurrently",
+)
+parser.add_argument(
+    "--chunk-size",
+    type=int,
+    default=5000,
+    help="the number of rows per chunk, with --pipelined",
+)
+parser.add_argument(
+    "--metrics-textfile",
+    help="write the metrics of the run to this file (ending in .prom), for the node-exporter textfile collector",
+)
+parser.add_argument(
+    "--metrics-json", help="write the metrics of the run to this JSON file"
+)
+parser.add_argument(
+    "--cache-dir",
+    help="a directory that caches the reflected `pathways_program` table and the Google Sheets discovery document between runs",
+)
+parser.add_argument(
+    "--plan",
+    action="store_true",
+    help="report what the run would insert, update, skip and delete, without writing to the database",
+)
+parser.add_argument(
+    "--plan-output",
+    help="with --plan, write the program ids of the plan to this JSON file",
+)
+parser.add_argument(
+    "--checkpoint",
+    action="store_true",
+    help="save a copy of the programs that the run is about to load, so that --resume can finish the load if the run gets interrupted",
+)
+parser.add_argument(
+    "--resume",
+    action="store_true",
+    help="finish loading the interrupted run from its checkpoint (see --checkpoint), instead of extracting the sheet again",
+)
+parser.add_argument(
+    "--shards",
+    type=int,
+    help="run as one of several workers that share the run in this many shards (by Row Identifier)",
+)
+parser.add_argument(
+    "--shard-run-id",
+    help="with --shards, the id of the sharded run, which all of its workers share (e.g., the scheduled time)",
+)
+parser.add_argument(
+    "--combine-shards",
+    action="store_true",
+    help="with --shards, combine the summaries of the shards, and advance the watermarks once all shards have finished",
+)
+parser.add_argument(
+    "--watch",
+    action="store_true",
+    help="keep running, and run the ETL whenever the master sheet changes",
+)
+parser.add_argument(
+    "--poll-interval",
+    type=int,
+    default=60,
+    help="with --watch, the number of seconds between checks for a change",
+)
+parser.add_argument(
+    "--snapshot",
+    help="the path of a snapshot of the sheet (a .npz file): transform and load the rows that were added or changed since the last run, whatever their Timestamp",
+)
+args = parser.parse_args()
+if args.shards and not args.shard_run_id:
+    parser.error("--shards requires --shard-run-id")
+if args.pipelined and (args.checkpoint or args.resume or args.snapshot):
+    parser.error(
+        "--pipelined does not save a checkpoint or a snapshot, so it cannot run with --checkpoint, --resume or --snapshot"
+    )
+if args.snapshot and (args.shards or args.resume):
+    parser.error(
+        "--snapshot diffs the whole sheet of a run, so it cannot run with --shards or --resume"
+    )
+if args.shards and args.checkpoint:
+    parser.error("--shards does not save a checkpoint")
+if args.watch and (args.pipelined or args.resume or args.shards):
+    parser.error(
+        "--watch runs the whole ETL whenever the sheet changes, so it cannot run with --pipelined, --resume or --shards"
+    )
+if args.plan and (
+    args.watch
+    or args.resume
+    or args.shards
+    or args.combine_shards
+    or args.pipelined
+    or args.checkpoint
+    or args.snapshot
+):
+    parser.error(
+        "--plan only reports what a single run would do, so it cannot run with --watch, --resume, --shards, --combine-shards, --pipelined, --checkpoint or --snapshot"
+    )
+if args.watch and args.member_mappings_sheet_id:
+    parser.error(
+        "--watch checks the master sheet for changes, so it cannot read the member sheets"
+    )
+
+metrics = RunMetrics()
+# The JSONB documents go through the JSON codec of the ETL (orjson, if it is installed).
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URI,
+    json_serializer=json_codec.dumps,
+    json_deserializer=json_codec.loads,
+)
+metrics.instrument_engine(engine)
 try:
-    programs_table = Table("pathways_program", metadata, autoload=True)
+    programs_table = reflect_table(
+        engine,
+        "pathways_program",
+        cache_path=os.path.join(args.cache_dir, "pathways_program.pickle")
+        if args.cache_dir
+        else None,
+    )
 except OperationalError as error:
     logger.error(error)
     raise
 
 logger.info("----Running ETL")
 
-sheet_as_list = Extractor(
-    google_account_info=GOOGLE_DRIVE_CREDENTIALS, spreadsheet_id=MASTER_SHEET_ID
-).get_sheet_as_list()
+if not args.plan:
+    # Once per process, before any run (or shard worker) uses the state tables; a dry run does not create them.
+    EtlState(engine=engine).setup_tables()
+
+extractor = Extractor(
+    google_account_info=GOOGLE_DRIVE_CREDENTIALS,
+    spreadsheet_id=MASTER_SHEET_ID,
+    metrics=metrics,
+    discovery_cache=FileDiscoveryCache(args.cache_dir) if args.cache_dir else None,
+)
+
+
+conversion_pool = None
+
+
+def get_conversion_pool():
+    """Return the pool of processes that convert programs to Pathways JSON-LD
+    (with --workers), which starts on first use and then serves every run
+    of the process, e.g., each run of the watch mode."""
+    global conversion_pool
+
+    if conversion_pool is None and args.workers and args.workers > 1:
+        from etl.transformers.pathways_transformer import ConversionPool
+
+        conversion_pool = ConversionPool(
+            args.workers, address_cache_path=args.address_cache
+        )
+
+    return conversion_pool
 
-if sheet_as_list:
-    opt_out = OptOut(
-        google_sheet_as_list=sheet_as_list, programs_table=programs_table, engine=engine
+
+def extract_sheet():
+    with metrics.stage("extract") as stage:
+        if args.member_mappings_sheet_id:
+            sheet_as_list = extractor.get_member_sheets_as_list(
+                member_mappings_sheet_id=args.member_mappings_sheet_id
+            )
+        else:
+            sheet_as_list = extractor.get_sheet_as_list()
+        stage.rows_out = max(len(sheet_as_list) - 1, 0)
+
+    return sheet_as_list
+
+
+def run_etl(address_cache=None):
+    """Run the ETL once: extract the sheet, delete the programs that were
+    deleted or opted out, and transform and load the updated programs.
+
+    The watch mode passes an `address_cache` that stays open between runs.
+    """
+    sheet_as_list = extract_sheet()
+    if not sheet_as_list:
+        return
+
+    from etl.parsed_sheet import ParsedSheet
+    from etl.pathways_opt_out import OptOut
+    from etl.snapshot import SheetSnapshot
+    from etl.transformers.dataframe_transformer import DataframeTransformer
+    from etl.utils.utils import format_id_sample
+
+    snapshot = SheetSnapshot(args.snapshot) if args.snapshot else None
+
+    with metrics.stage("opt_out") as stage:
+        parsed_sheet = ParsedSheet.from_list(sheet_as_list)
+
+        opt_out = OptOut(
+            google_sheet_as_list=parsed_sheet,
+            programs_table=programs_table,
+            engine=engine,
+        )
+        deleted_records = opt_out.remove_deleted_programs()
+        logger.info(
+            f"----Deleted {len(deleted_records)} records from the Pathways database. {format_id_sample(deleted_records)}"
+        )
+        opt_out_records = opt_out.remove_programs_not_marked_for_pathways()
+
+        logger.info(
+            f"----Found {len(opt_out_records)} records that 'opt-out' of Pathways. {format_id_sample(opt_out_records)}"
+        )
+        stage.rows_in = len(parsed_sheet.dataframe)
+        stage.rows_out = len(deleted_records) + len(opt_out_records)
+
+    with metrics.stage("dataframe_transform") as stage:
+        etl_state = EtlState(engine=engine)
+        interrupted_run = etl_state.get_interrupted_run()
+        if interrupted_run is not None:
+            logger.info(
+                f"----Run {interrupted_run.run_id} did not finish: this run replaces it (run with --resume to finish it instead)."
+            )
+        snapshot_diff = None
+        if snapshot is not None:
+            snapshot_diff = snapshot.diff(parsed_sheet)
+        if snapshot_diff is not None:
+            logger.info(
+                f"----Since the last snapshot: {len(snapshot_diff.added_ids)} records added, {len(snapshot_diff.changed_ids)} changed, {len(snapshot_diff.removed_ids)} removed."
+            )
+        dataframe_transformer = DataframeTransformer(
+            sheet=parsed_sheet,
+            engine=engine,
+            state=etl_state,
+            snapshot_diff=snapshot_diff,
+        )
+        dataframe = dataframe_transformer.transform()
+        logger.info(
+            f"----Initial transformation complete: {len(dataframe)} records prepped for PathwaysTransformer."
+        )
+        stage.rows_in = len(parsed_sheet.dataframe)
+        stage.rows_out = len(dataframe)
+
+    if dataframe.empty:
+        # The fast path of an incremental run: no program was updated, so there is nothing to convert or load.
+        logger.info("----No updated records: nothing to load.")
+        failed_ids = set()
+        # Still record the run: it replaces the interrupted run, if any.
+        etl_state.start_run(WatermarkBounds()).finish(loaded_ids=[])
+    else:
+        from etl.change_detector import ChangeDetector
+        from etl.loader import Loader
+        from etl.transformers.pathways_transformer import PathwaysTransformer
+        from etl.utils.address_cache import AddressCache
+
+        with metrics.stage("pathways_transform") as stage:
+            keep_address_cache = address_cache is not None
+            if not keep_address_cache:
+                address_cache = AddressCache(path=args.address_cache)
+            pathways_transformer = PathwaysTransformer(
+                dataframe=dataframe, address_cache=address_cache
+            )
+            pathways_dataframe = pathways_transformer.pathways_transform(
+                pool=get_conversion_pool()
+            )
+            if keep_address_cache:
+                address_cache.flush()
+            else:
+                address_cache.close()
+            logger.info(
+                f"----Pathways transformation complete: {len(pathways_dataframe)} records prepped for loading. Address cache: {address_cache.hits + address_cache.disk_hits} hits, {address_cache.misses} misses."
+            )
+            stage.rows_in = len(dataframe)
+            stage.rows_out = len(pathways_dataframe)
+            stage.rows_rejected = pathways_transformer.rejected_count
+
+        with metrics.stage("load") as stage:
+            change_detector = ChangeDetector(
+                engine=engine, programs_table=programs_table, state=etl_state
+            )
+            changed_dataframe = change_detector.filter_unchanged(pathways_dataframe)
+
+            loader = Loader(engine=engine)
+            batches = dict(enumerate(loader.make_batches(changed_dataframe)))
+            watermark_bounds = dataframe_transformer.get_watermark_bounds(
+                done_ids=change_detector.unchanged_ids,
+                pending_ids=changed_dataframe["id"],
+            )
+            # With --checkpoint, save a copy of the batches first: if the load gets interrupted, `--resume` loads the rest.
+            checkpoint = etl_state.start_run(
+                watermark_bounds, batches=batches if args.checkpoint else None
+            )
+            loaded_ids = loader.load_batches(
+                batches,
+                metadata_table=programs_table,
+                primary_key="id",
+                checkpoint=checkpoint if args.checkpoint else None,
+            )
+            change_detector.record_hashes(loaded_ids)
+            # Advance the watermarks only after the load, and only over the rows that were loaded: the next run picks up the others.
+            checkpoint.finish(loaded_ids)
+            stage.rows_in = len(changed_dataframe)
+            stage.rows_out = len(loaded_ids)
+            stage.rows_rejected = len(changed_dataframe) - len(loaded_ids)
+
+        failed_ids = dataframe_transformer.get_failed_ids(
+            done_ids=set(loaded_ids) | set(change_detector.unchanged_ids)
+        )
+        summary = change_detector.summarize(loaded_ids)
+        logger.info(
+            f"----Data loaded into Google Pathways API: {summary['inserted']} inserted, {summary['updated']} updated, {summary['unchanged']} unchanged."
+        )
+
+    if snapshot is not None:
+        # Only after a successful load: if the run fails, the next run diffs against the same snapshot.
+        snapshot.save(parsed_sheet, failed_ids=failed_ids)
+
+
+if args.plan:
+    import json
+
+    from etl.parsed_sheet import ParsedSheet
+    from etl.planner import Planner
+    from etl.utils.address_cache import AddressCache
+    from etl.utils.utils import format_id_sample
+
+    sheet_as_list = extract_sheet()
+    if sheet_as_list:
+        address_cache = AddressCache(path=args.address_cache)
+        with metrics.stage("plan"):
+            plan = Planner(
+                sheet=ParsedSheet.from_list(sheet_as_list),
+                programs_table=programs_table,
+                engine=engine,
+                address_cache=address_cache,
+                pool=get_conversion_pool(),
+            ).plan()
+        address_cache.close()
+
+        for action, program_ids in plan.items():
+            logger.info(
+                f"----Plan: {len(program_ids)} records {action}. {format_id_sample(program_ids)}"
+            )
+        if args.plan_output:
+            with open(args.plan_output, "w") as plan_file:
+                json.dump(plan, plan_file, indent=2)
+elif args.resume:
+    import pandas as pd
+
+    from etl.change_detector import ChangeDetector
+    from etl.loader import Loader
+
+    etl_state = EtlState(engine=engine)
+    checkpoint = etl_state.get_interrupted_run()
+    run_batches = checkpoint.get_batches() if checkpoint is not None else {}
+
+    if checkpoint is None:
+        logger.info("----No interrupted run to resume.")
+    elif not run_batches:
+        logger.info(
+            f"----Run {checkpoint.run_id} did not save a checkpoint (see --checkpoint): the next run replaces it."
+        )
+    else:
+        with metrics.stage("load") as stage:
+            # The interrupted run had not recorded any content hashes: they get recorded at the end of a run.
+            change_detector = ChangeDetector(
+                engine=engine, programs_table=programs_table, state=etl_state
+            )
+            run_rows = [row for rows in run_batches.values() for row in rows]
+            if run_rows:
+                change_detector.filter_unchanged(pd.DataFrame(run_rows))
+
+            batches = checkpoint.get_batches(committed=False)
+            logger.info(
+                f"----Resuming run {checkpoint.run_id}: {len(batches)} batches left to load."
+            )
+            loader = Loader(engine=engine)
+            resumed_ids = loader.load_batches(
+                batches,
+                metadata_table=programs_table,
+                primary_key="id",
+                checkpoint=checkpoint,
+            )
+            loaded_ids = checkpoint.get_loaded_ids()
+            change_detector.record_hashes(loaded_ids)
+            checkpoint.finish(loaded_ids)
+            stage.rows_in = sum(len(rows) for rows in batches.values())
+            stage.rows_out = len(resumed_ids)
+            stage.rows_rejected = stage.rows_in - len(resumed_ids)
+
+        logger.info(
+            f"----Data loaded into Google Pathways API: {len(resumed_ids)} records loaded on resume, {len(loaded_ids)} records loaded by the run."
+        )
+elif args.shards and args.combine_shards:
+    from etl.sharding import combine_shard_summaries
+
+    totals = combine_shard_summaries(
+        engine=engine, run_id=args.shard_run_id, shard_count=args.shards
     )
-    deleted_records = opt_out.remove_deleted_programs()
+    if totals["missing_shards"]:
+        logger.error(
+            f"----Sharded run {args.shard_run_id}: shards {totals['missing_shards']} have not finished."
+        )
     logger.info(
-        f"----Deleted {len(deleted_records)} records from the Pathways database. {' '.join(deleted_records)}"
+        f"----Data loaded into Google Pathways API: {totals['inserted']} inserted, {totals['updated']} updated, {totals['unchanged']} unchanged, {totals['deleted']} deleted, {totals['opted_out']} opted out ({totals['rows']} rows in {args.shards - len(totals['missing_shards'])} of {args.shards} shards)."
     )
-    opt_out_records = opt_out.remove_programs_not_marked_for_pathways()
+elif args.shards:
+    from etl.parsed_sheet import ParsedSheet
+    from etl.sharding import ShardWorker
+    from etl.utils.address_cache import AddressCache
 
-    logger.info(
-        f"----Found {len(opt_out_records)} records that 'opt-out' of Pathways. {' '.join(opt_out_records)}"
+    sheet_as_list = extract_sheet()
+    if sheet_as_list:
+        address_cache = AddressCache(path=args.address_cache)
+        with metrics.stage("shards") as stage:
+            shard_worker = ShardWorker(
+                sheet=ParsedSheet.from_list(sheet_as_list),
+                engine=engine,
+                programs_table=programs_table,
+                run_id=args.shard_run_id,
+                shard_count=args.shards,
+                address_cache=address_cache,
+                pool=get_conversion_pool(),
+            )
+            processed_shards = shard_worker.run()
+            stage.rows_in = len(shard_worker.parsed_sheet.dataframe)
+        address_cache.close()
+
+        logger.info(
+            f"----Processed shards {processed_shards} of sharded run {args.shard_run_id}."
+        )
+elif args.pipelined:
+    import asyncio
+
+    from etl.pipeline import Pipeline
+    from etl.utils.address_cache import AddressCache
+
+    address_cache = AddressCache(path=args.address_cache)
+    pipeline = Pipeline(
+        extractor=extractor,
+        engine=engine,
+        programs_table=programs_table,
+        address_cache=address_cache,
+        member_mappings_sheet_id=args.member_mappings_sheet_id,
+        chunk_size=args.chunk_size,
+        pool=get_conversion_pool(),
     )
+    # The stages overlap, so the pipeline gets measured as one stage.
+    with metrics.stage("pipeline") as stage:
+        loaded_ids = asyncio.run(pipeline.run())
+        stage.rows_out = len(loaded_ids)
+    address_cache.close()
 
-    dataframe = DataframeTransformer(sheet=sheet_as_list, engine=engine).transform()
+    summary = pipeline.change_detector.summarize(loaded_ids)
     logger.info(
-        f"----Initial transformation complete: {len(dataframe)} records prepped for PathwaysTransformer."
+        f"----Data loaded into Google Pathways API: {summary['inserted']} inserted, {summary['updated']} updated, {summary['unchanged']} unchanged."
     )
+elif args.watch:
+    from etl.utils.address_cache import AddressCache
+    from etl.utils.logger import flush_slack_logging
+    from etl.watcher import SheetWatcher
+
+    # The address cache, like the engine, the reflected table and the Sheets API client, stays warm between runs.
+    address_cache = AddressCache(path=args.address_cache)
+
+    def run_and_report():
+        run_etl(address_cache=address_cache)
+        log_row_error_summary()
+        if args.metrics_textfile:
+            metrics.write_textfile(args.metrics_textfile)
+        if args.metrics_json:
+            metrics.write_json(args.metrics_json)
+        metrics.reset()
+        flush_slack_logging()
 
-    pathways_dataframe = PathwaysTransformer(dataframe=dataframe).pathways_transform()
     logger.info(
-        f"----Pathways transformation complete: {len(pathways_dataframe)} records prepped for loading."
+        f"----Watching the master sheet for changes, every {args.poll_interval} seconds."
     )
+    try:
+        SheetWatcher(extractor, poll_interval=args.poll_interval).watch(run_and_report)
+    finally:
+        address_cache.close()
+else:
+    run_etl()
 
-    loader = Loader(engine=engine)
-    loader.load_data(
-        dataframe=pathways_dataframe, metadata_table=programs_table, primary_key="id"
-    )
-    logger.info("----Data loaded into Google Pathways API")
+if conversion_pool is not None:
+    conversion_pool.close()
+
+log_row_error_summary()
+
+if args.metrics_textfile:
+    metrics.write_textfile(args.metrics_textfile)
+if args.metrics_json:
+    metrics.write_json(args.metrics_json)
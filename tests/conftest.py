@@ -17,12 +17,20 @@ from config.config_test import (
     POSTGRES_USER,
     SQLALCHEMY_DATABASE_URI,
 )
+from etl.change_detector import ChangeDetector
+from etl.etl_state import EtlState
+from etl.loader import Loader
 from etl.pathways_opt_out import OptOut
 from etl.transformers.dataframe_transformer import DataframeTransformer
+from etl.utils import json_codec
 from etl.utils.logger import logger
 
 
-ENGINE = create_engine(SQLALCHEMY_DATABASE_URI)
+ENGINE = create_engine(
+    SQLALCHEMY_DATABASE_URI,
+    json_serializer=json_codec.dumps,
+    json_deserializer=json_codec.loads,
+)
 # Create a MetaData object, which stores the components of the database being described or reflected
 METADATA_OBJECT = MetaData(bind=ENGINE)
 
@@ -148,6 +156,13 @@ def database():
     postgres.stop_if_running()
 
 
+@pytest.fixture(scope="session", autouse=True)
+def etl_state_tables(database):
+    """A fixture that creates the ETL state tables once, like `runner.py`
+    does at startup."""
+    EtlState(engine=ENGINE).setup_tables()
+
+
 @pytest.fixture(autouse=True)
 def database_session():
     Session = sessionmaker()
@@ -277,6 +292,40 @@ def opt_out(pathways_program_table, google_sheet_data):
     return opt_out
 
 
+@pytest.fixture
+def loader():
+    return Loader(engine=ENGINE)
+
+
+@pytest.fixture
+def change_detector_factory(pathways_program_table):
+    """A fixture that returns a function, which instantiates a ChangeDetector,
+    i.e., reads the current content hashes from the database."""
+
+    def make_change_detector():
+        return ChangeDetector(
+            engine=ENGINE,
+            programs_table=pathways_program_table,
+            state=EtlState(engine=ENGINE),
+        )
+
+    return make_change_detector
+
+
+@pytest.fixture
+def etl_state(pathways_program_table):
+    """A fixture that returns an EtlState, and empties its tables after the test."""
+    state = EtlState(engine=ENGINE)
+
+    yield state
+
+    with ENGINE.begin() as connection:
+        connection.execute(delete(state.watermarks_table))
+        connection.execute(delete(state.batches_table))
+        connection.execute(delete(state.runs_table))
+        connection.execute(delete(state.shards_table))
+
+
 @pytest.fixture
 def pathways_programs(pathways_program_table, database_session):
     """A fixture that adds two programs to the database transaction (i.e.,
@@ -0,0 +1,104 @@
+import re
+
+A1_RANGE = re.compile(r"^([A-Z]*)(\d*):([A-Z]*)(\d*)$")
+
+
+def _get_column_position(letters):
+    position = 0
+    for letter in letters:
+        position = position * 26 + ord(letter) - ord("A") + 1
+
+    return position - 1
+
+
+class FakeRequest:
+    def __init__(self, resource, response):
+        self.resource = resource
+        self.response = response
+
+    def execute(self):
+        self.resource.execute_count += 1
+        return self.response
+
+
+class FakeSheetsResource:
+    """A stand-in for the googleapi Resource of the Sheets API, which reads
+    spreadsheets from memory, e.g.:
+
+    ```
+    resource = FakeSheetsResource({"sheet-id": [headers, row, ...]})
+    mocker.patch.object(Extractor, "_build_googleapi_resource", return_value=resource)
+    ```
+
+    It supports `spreadsheets().get(...)` (for the row count of the grid),
+    and `spreadsheets().values().get(...)` and `batchGet(...)`, with
+    ranges such as "1:1", "2:5001" and "C2:C", and, like the service, drops
+    empty cells at the end of rows, and empty rows at the end of a range.
+
+    Attributes:
+        sheets: a dict of {spreadsheet id: list of lists}, which a test may change between calls
+        execute_count: the number of requests executed
+    """
+
+    def __init__(self, sheets):
+        self.sheets = sheets
+        self.execute_count = 0
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def _get_value_range(self, spreadsheet_id, row_range):
+        start_column, start_row, end_column, end_row = A1_RANGE.match(
+            row_range
+        ).groups()
+        rows = self.sheets[spreadsheet_id][
+            int(start_row or 1) - 1 : int(end_row) if end_row else None
+        ]
+        column_slice = slice(
+            _get_column_position(start_column) if start_column else None,
+            _get_column_position(end_column) + 1 if end_column else None,
+        )
+
+        values = []
+        for row in rows:
+            cells = list(row[column_slice])
+            while cells and cells[-1] == "":
+                cells.pop()
+            values.append(cells)
+        while values and not values[-1]:
+            values.pop()
+
+        value_range = {"range": row_range}
+        if values:
+            value_range["values"] = values
+
+        return value_range
+
+    def get(self, spreadsheetId, range=None, fields=None):
+        if range is None:
+            # spreadsheets().get(...): the grid of the sheet ends at its last row.
+            row_count = len(self.sheets[spreadsheetId])
+            return FakeRequest(
+                self,
+                {
+                    "sheets": [
+                        {"properties": {"gridProperties": {"rowCount": row_count}}}
+                    ]
+                },
+            )
+
+        return FakeRequest(self, self._get_value_range(spreadsheetId, range))
+
+    def batchGet(self, spreadsheetId, ranges):
+        return FakeRequest(
+            self,
+            {
+                "valueRanges": [
+                    self._get_value_range(spreadsheetId, row_range)
+                    for row_range in ranges
+                ]
+            },
+        )
@@ -0,0 +1,50 @@
+from etl.utils.address_cache import AddressCache
+
+
+def parse_address(address):
+    return {"street_address": address.upper()}
+
+
+def test_get_or_parse_hits_and_misses():
+    address_cache = AddressCache()
+
+    first = address_cache.get_or_parse("1 Grickle Grass Lane", parse_address)
+    second = address_cache.get_or_parse("  1 Grickle  Grass Lane ", parse_address)
+
+    assert first == second == {"street_address": "1 GRICKLE GRASS LANE"}
+    assert address_cache.misses == 1
+    assert address_cache.hits == 1
+
+
+def test_get_or_parse_evicts_least_recently_used():
+    address_cache = AddressCache(maxsize=2)
+
+    for address in ["1 Main St", "2 Main St", "1 Main St", "3 Main St", "1 Main St"]:
+        address_cache.get_or_parse(address, parse_address)
+
+    assert address_cache.misses == 3
+    assert address_cache.hits == 2
+
+    address_cache.get_or_parse("2 Main St", parse_address)
+
+    assert address_cache.misses == 4
+
+
+def test_get_or_parse_from_disk(tmp_path):
+    path = str(tmp_path / "addresses.sqlite")
+    address_cache = AddressCache(path=path)
+    address_cache.get_or_parse("1 Grickle Grass Lane", parse_address)
+    address_cache.get_or_parse("Open Enrollment", lambda address: None)
+    address_cache.close()
+
+    def fail_to_parse(address):
+        raise AssertionError("The address should have been read from disk")
+
+    warm_address_cache = AddressCache(path=path)
+
+    assert warm_address_cache.get_or_parse("1 Grickle Grass Lane", fail_to_parse) == {
+        "street_address": "1 GRICKLE GRASS LANE"
+    }
+    assert warm_address_cache.get_or_parse("Open Enrollment", fail_to_parse) is None
+    assert warm_address_cache.disk_hits == 2
+    assert warm_address_cache.misses == 0
@@ -0,0 +1,80 @@
+import pandas as pd
+
+from etl.utils.utils import hash_pathways_program
+
+
+def test_hash_pathways_program_ignores_key_order():
+    json_ld_one = {"@type": "WorkBasedProgram", "name": "Customer Service"}
+    json_ld_two = {"name": "Customer Service", "@type": "WorkBasedProgram"}
+
+    assert hash_pathways_program(json_ld_one) == hash_pathways_program(json_ld_two)
+    assert hash_pathways_program(json_ld_one) != hash_pathways_program(
+        {"@type": "WorkBasedProgram", "name": "Sales Training"}
+    )
+
+
+def make_pathways_dataframe(programs):
+    return pd.DataFrame(
+        [
+            [identifier, "2020-03-18 07:25:37", {"name": name}]
+            for identifier, name in programs
+        ],
+        columns=["id", "updated_at", "pathways_program"],
+    )
+
+
+def test_filter_unchanged(change_detector_factory, loader, pathways_program_table):
+    dataframe = make_pathways_dataframe([("e-1", "Sales"), ("e-2", "Welding")])
+
+    change_detector = change_detector_factory()
+    changed_dataframe = change_detector.filter_unchanged(dataframe)
+    loaded_ids = loader.load_data(
+        dataframe=changed_dataframe,
+        metadata_table=pathways_program_table,
+        primary_key="id",
+    )
+    change_detector.record_hashes(loaded_ids)
+
+    assert len(changed_dataframe) == 2
+    assert change_detector.summarize(loaded_ids) == {
+        "inserted": 2,
+        "updated": 0,
+        "unchanged": 0,
+    }
+
+    dataframe = make_pathways_dataframe([("e-1", "Sales"), ("e-2", "Forklift")])
+
+    change_detector = change_detector_factory()
+    changed_dataframe = change_detector.filter_unchanged(dataframe)
+
+    assert changed_dataframe["id"].tolist() == ["e-2"]
+    assert change_detector.unchanged_ids == ["e-1"]
+    assert change_detector.summarize(["e-2"]) == {
+        "inserted": 0,
+        "updated": 1,
+        "unchanged": 1,
+    }
+
+
+def test_filter_unchanged_after_deletion(
+    change_detector_factory, loader, database_session, pathways_program_table
+):
+    """Test that a program, which was deleted from the database (e.g., by
+    OptOut), gets loaded again even though its hash was recorded."""
+    dataframe = make_pathways_dataframe([("f-1", "Sales")])
+
+    change_detector = change_detector_factory()
+    loaded_ids = loader.load_data(
+        dataframe=change_detector.filter_unchanged(dataframe),
+        metadata_table=pathways_program_table,
+        primary_key="id",
+    )
+    change_detector.record_hashes(loaded_ids)
+
+    database_session.execute(pathways_program_table.delete())
+    database_session.commit()
+
+    change_detector = change_detector_factory()
+    changed_dataframe = change_detector.filter_unchanged(dataframe)
+
+    assert changed_dataframe["id"].tolist() == ["f-1"]
@@ -0,0 +1,104 @@
+from datetime import datetime
+
+from etl.etl_state import WatermarkBounds
+
+
+def test_get_watermarks_is_empty_before_the_first_load(etl_state):
+    assert etl_state.get_watermarks() == {}
+
+
+def test_advance_watermarks(etl_state):
+    etl_state.advance_watermarks(
+        {"Goodwill of Springfield": datetime(2020, 3, 18), "*": datetime(2020, 3, 18)}
+    )
+    etl_state.advance_watermarks(
+        {"Goodwill of Springfield": datetime(2020, 3, 17), "*": datetime(2020, 3, 19)}
+    )
+
+    assert etl_state.get_watermarks() == {
+        "Goodwill of Springfield": datetime(2020, 3, 18),
+        "*": datetime(2020, 3, 19),
+    }
+
+
+def test_get_interrupted_run(etl_state):
+    checkpoint = etl_state.start_run(
+        WatermarkBounds(latest_done={"*": datetime(2020, 3, 18)}),
+        batches={0: [{"id": "a-1"}, {"id": "a-2"}], 1: [{"id": "a-3"}]},
+    )
+
+    with etl_state.engine.begin() as connection:
+        checkpoint.mark_committed(connection, 0, ["a-1", "a-2"])
+
+    interrupted_run = etl_state.get_interrupted_run()
+
+    assert interrupted_run.run_id == checkpoint.run_id
+    assert interrupted_run.get_batches(committed=False) == {1: [{"id": "a-3"}]}
+    assert interrupted_run.get_loaded_ids() == ["a-1", "a-2"]
+    assert interrupted_run.get_watermark_bounds().latest_done == {
+        "*": datetime(2020, 3, 18)
+    }
+
+
+def test_finish_run(etl_state):
+    checkpoint = etl_state.start_run(
+        WatermarkBounds(
+            pending=[
+                ["a-1", "Goodwill of Springfield", datetime(2020, 3, 18)],
+                ["a-2", "Goodwill of Springfield", datetime(2020, 3, 19)],
+            ]
+        ),
+        batches={0: [{"id": "a-1"}, {"id": "a-2"}]},
+    )
+
+    checkpoint.finish(["a-1"])
+
+    assert etl_state.get_interrupted_run() is None
+    assert checkpoint.get_batches() == {}
+    # The row that was not loaded holds the watermarks back.
+    assert etl_state.get_watermarks() == {
+        "Goodwill of Springfield": datetime(2020, 3, 18),
+        "*": datetime(2020, 3, 18),
+    }
+
+
+def test_start_run_abandons_interrupted_run(etl_state):
+    etl_state.start_run(WatermarkBounds(), batches={0: [{"id": "a-1"}]})
+
+    checkpoint = etl_state.start_run(WatermarkBounds())
+
+    assert etl_state.get_interrupted_run().run_id == checkpoint.run_id
+    # Without batches, the run saves no copy of them.
+    assert checkpoint.get_batches() == {}
+
+
+def test_watermark_bounds_stop_before_the_earliest_failed_row():
+    watermark_bounds = WatermarkBounds()
+    watermark_bounds.add("Goodwill of Springfield", datetime(2020, 3, 17), done=True)
+    watermark_bounds.add("Goodwill of Springfield", datetime(2020, 3, 18), done=False)
+    watermark_bounds.add("Goodwill of Springfield", datetime(2020, 3, 19), done=True)
+    watermark_bounds.add("Goodwill of Shelbyville", datetime(2020, 3, 20), done=True)
+
+    assert watermark_bounds.get_watermarks() == {
+        "Goodwill of Springfield": datetime(2020, 3, 17, 23, 59, 59, 999999),
+        "Goodwill of Shelbyville": datetime(2020, 3, 20),
+        "*": datetime(2020, 3, 17, 23, 59, 59, 999999),
+    }
+
+
+def test_watermark_bounds_combine():
+    """A shard that failed a row holds back the watermarks of the others."""
+    first_shard = WatermarkBounds()
+    first_shard.add("Goodwill of Springfield", datetime(2020, 3, 18), done=False)
+    second_shard = WatermarkBounds(
+        pending=[["a-1", "Goodwill of Springfield", datetime(2020, 3, 19)]]
+    )
+    second_shard.resolve(["a-1"])
+
+    watermark_bounds = WatermarkBounds.from_dict(first_shard.to_dict())
+    watermark_bounds.update(WatermarkBounds.from_dict(second_shard.to_dict()))
+
+    assert watermark_bounds.get_watermarks() == {
+        "Goodwill of Springfield": datetime(2020, 3, 17, 23, 59, 59, 999999),
+        "*": datetime(2020, 3, 17, 23, 59, 59, 999999),
+    }
@@ -0,0 +1,128 @@
+from etl.extractor import Extractor
+from etl.utils.metrics import RunMetrics
+
+
+def test_iter_rows_reads_pages(mocker):
+    sheet = {
+        "1:1": [["Program Name", "Row Identifier (DO NOT EDIT)"]],
+        "2:3": [["Youth Employment", "3f109a01"], ["Sales Training", "663dfe"]],
+        "4:5": [["Welding"]],
+    }
+    get_values = mocker.patch.object(
+        Extractor,
+        "_get_values",
+        side_effect=lambda row_range, spreadsheet_id=None: sheet[row_range],
+    )
+    mocker.patch.object(Extractor, "_get_row_count", return_value=5)
+    extractor = Extractor(google_account_info={}, spreadsheet_id="sheet-id")
+
+    rows = list(extractor.iter_rows(page_size=2))
+
+    assert rows == [
+        ["Program Name", "Row Identifier (DO NOT EDIT)"],
+        ["Youth Employment", "3f109a01"],
+        ["Sales Training", "663dfe"],
+        ["Welding"],
+    ]
+    # No call after the last page of the grid.
+    assert get_values.call_count == 3
+
+
+def test_iter_rows_reads_past_blank_pages(mocker):
+    """The service returns nothing for a page of blank rows, which does not
+    end the sheet."""
+    sheet = {
+        "1:1": [["Program Name", "Row Identifier (DO NOT EDIT)"]],
+        "2:3": [["Youth Employment", "3f109a01"]],
+        "4:5": [],
+        "6:7": [[], ["Welding", "5f109a01"]],
+        "8:8": [["Sales Training", "663dfe"]],
+    }
+    mocker.patch.object(
+        Extractor,
+        "_get_values",
+        side_effect=lambda row_range, spreadsheet_id=None: sheet[row_range],
+    )
+    mocker.patch.object(Extractor, "_get_row_count", return_value=8)
+    extractor = Extractor(google_account_info={}, spreadsheet_id="sheet-id")
+
+    rows = list(extractor.iter_rows(page_size=2))
+
+    assert rows == [
+        ["Program Name", "Row Identifier (DO NOT EDIT)"],
+        ["Youth Employment", "3f109a01"],
+        [],
+        ["Welding", "5f109a01"],
+        ["Sales Training", "663dfe"],
+    ]
+
+
+def test_get_sheet_as_list_empty_sheet(mocker):
+    mocker.patch.object(Extractor, "_get_values", return_value=[])
+    extractor = Extractor(google_account_info={}, spreadsheet_id="sheet-id")
+
+    assert extractor.get_sheet_as_list() == []
+
+
+def test_get_member_sheets_as_list(mocker):
+    master_headers = [["Program Name", "Format", "Row Identifier (DO NOT EDIT)"]]
+    mappings = [
+        ["Location", "Spreadsheet ID", "Short Name"],
+        ["Goodwill of Springfield", "springfield-sheet", "GWSP"],
+        ["Goodwill of Shelbyville", "shelbyville-sheet", "GWSH"],
+    ]
+    member_sheets = {
+        "springfield-sheet": [
+            master_headers,
+            [["Youth Employment", "In person", "3f109a01"]],
+        ],
+        # The columns of this local sheet are in a different order.
+        "shelbyville-sheet": [
+            [["Row Identifier (DO NOT EDIT)", "Program Name", "Format"]],
+            [["663dfe", "Sales Training"], ["5f109a01", "Welding", "Online"]],
+        ],
+    }
+    mocker.patch.object(
+        Extractor,
+        "_get_values",
+        side_effect=lambda row_range, spreadsheet_id=None: (
+            master_headers
+            if spreadsheet_id is None
+            else mappings
+            if row_range == "1:3"
+            else []
+        ),
+    )
+    mocker.patch.object(
+        Extractor,
+        "_batch_get_values",
+        side_effect=lambda row_ranges, spreadsheet_id: member_sheets[spreadsheet_id],
+    )
+    mocker.patch.object(Extractor, "_get_row_count", return_value=3)
+    extractor = Extractor(google_account_info={}, spreadsheet_id="sheet-id")
+
+    sheet_as_list = extractor.get_member_sheets_as_list(
+        member_mappings_sheet_id="mappings-sheet-id"
+    )
+
+    assert sheet_as_list == [
+        ["Program Name", "Format", "Row Identifier (DO NOT EDIT)"],
+        ["Youth Employment", "In person", "3f109a01"],
+        ["Sales Training", "", "663dfe"],
+        ["Welding", "Online", "5f109a01"],
+    ]
+
+
+def test_get_values_records_api_call(mocker):
+    metrics = RunMetrics()
+    resource = mocker.Mock()
+    resource.spreadsheets().values().get().execute.return_value = {
+        "values": [["Program Name"]]
+    }
+    mocker.patch.object(Extractor, "_get_googleapi_resource", return_value=resource)
+    extractor = Extractor(
+        google_account_info={}, spreadsheet_id="sheet-id", metrics=metrics
+    )
+
+    assert extractor._get_values("1:1") == [["Program Name"]]
+    assert metrics.sheets_api_calls.count == 1
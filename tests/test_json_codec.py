@@ -0,0 +1,85 @@
+from datetime import datetime
+
+import pytest
+
+from etl.utils.json_codec import StdlibCodec, get_codec
+from etl.utils.utils import hash_pathways_program
+
+DOCUMENT = {
+    "@context": "http://schema.org/",
+    "@type": "EducationalOccupationalProgram",
+    "name": "Formación en Soldadura",
+    "offers": [{"price": 1200.5, "priceCurrency": "USD"}],
+    "applicationDeadline": None,
+}
+
+
+def test_stdlib_dumps():
+    codec = StdlibCodec()
+
+    assert codec.dumps({"b": 1, "a": "é"}, canonical=True) == '{"a":"é","b":1}'
+    assert codec.dumps({"b": 1, "a": "é"}) == '{"b":1,"a":"é"}'
+
+
+def test_stdlib_dumps_datetime():
+    codec = StdlibCodec()
+
+    assert codec.dumps([datetime(2020, 3, 18, 7, 25, 37)]) == '["2020-03-18 07:25:37"]'
+
+
+def test_stdlib_dumps_non_finite_floats():
+    codec = StdlibCodec()
+
+    assert (
+        codec.dumps([float("nan"), float("inf"), -float("inf"), "NaN"])
+        == '[null,null,null,"NaN"]'
+    )
+
+
+def test_loads_round_trip():
+    codec = get_codec()
+
+    assert codec.loads(codec.dumps(DOCUMENT)) == DOCUMENT
+
+
+def test_hash_pathways_program_ignores_key_order():
+    reordered_document = dict(reversed(list(DOCUMENT.items())))
+
+    assert hash_pathways_program(reordered_document) == hash_pathways_program(DOCUMENT)
+
+
+def test_orjson_matches_stdlib():
+    pytest.importorskip("orjson")
+    orjson_codec = get_codec("orjson")
+    stdlib_codec = get_codec("json")
+    value = dict(
+        DOCUMENT,
+        updated_at=datetime(2020, 3, 18, 7, 25, 37),
+        # Floats with an exponent, or many digits, and the floats that JSON does not have.
+        floats=[1e16, 1e22, 1.2345678901234568e17, 1e15, 1e-05, 1.5e-07, -2.5e-06],
+        non_finite=[float("nan"), float("inf"), -float("inf")],
+    )
+
+    assert orjson_codec.name == "orjson"
+    for canonical in (False, True):
+        assert orjson_codec.dumps(value, canonical=canonical) == stdlib_codec.dumps(
+            value, canonical=canonical
+        )
+
+
+def test_orjson_keeps_its_output_for_digits_in_strings(mocker):
+    pytest.importorskip("orjson")
+    orjson_codec = get_codec("orjson")
+    stdlib_dumps = mocker.spy(orjson_codec.stdlib_codec, "dumps")
+    value = dict(
+        DOCUMENT,
+        id="3f109a01-87c6-4899-bfd0-63db86acae11",
+        hash="1e3b5d7f9a0c2e4f6a8c0e2d4f6b8d0e",
+        address="1200 Main Street, Suite 1E",
+        ids=["1e5", "0.00001", "12345678901234567"],
+    )
+
+    assert orjson_codec.dumps(value, canonical=True) == get_codec("json").dumps(
+        value, canonical=True
+    )
+    assert stdlib_dumps.call_count == 0
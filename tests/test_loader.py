@@ -0,0 +1,168 @@
+import pandas as pd
+from sqlalchemy import select
+
+import etl.loader
+from etl.etl_state import WatermarkBounds
+
+
+def make_pathways_dataframe(ids):
+    return pd.DataFrame(
+        [
+            [
+                identifier,
+                "2020-03-18 07:25:37",
+                {"@type": "WorkBasedProgram", "name": f"Program {identifier}"},
+            ]
+            for identifier in ids
+        ],
+        columns=["id", "updated_at", "pathways_program"],
+    )
+
+
+def test_load_data_in_batches(loader, database_session, pathways_program_table):
+    loader.batch_size = 2
+    dataframe = make_pathways_dataframe(["a-1", "a-2", "a-3"])
+
+    loaded_ids = loader.load_data(
+        dataframe=dataframe, metadata_table=pathways_program_table, primary_key="id"
+    )
+
+    query_results = database_session.execute(
+        select([pathways_program_table])
+    ).fetchall()
+
+    assert loaded_ids == ["a-1", "a-2", "a-3"]
+    assert len(query_results) == 3
+
+
+def test_load_data_updates_existing_rows(
+    loader, database_session, pathways_program_table, pathways_programs
+):
+    dataframe = make_pathways_dataframe(["5f109a01-87c6"])
+
+    loader.load_data(
+        dataframe=dataframe, metadata_table=pathways_program_table, primary_key="id"
+    )
+
+    select_stmt = select([pathways_program_table]).where(
+        pathways_program_table.c.id == "5f109a01-87c6"
+    )
+    program = database_session.execute(select_stmt).fetchone()
+
+    assert program.pathways_program["name"] == "Program 5f109a01-87c6"
+
+
+def test_load_data_skips_bad_row(
+    mocker, loader, database_session, pathways_program_table
+):
+    """Test that a row that violates the table constraints (here, a missing
+    `updated_at`) does not prevent the other rows in its batch from
+    loading."""
+    log_row_error = mocker.spy(etl.loader, "log_row_error")
+    loader.batch_size = 4
+    dataframe = make_pathways_dataframe(["b-1", "b-2", "b-3", "b-4"])
+    dataframe.loc[2, "updated_at"] = None
+
+    loaded_ids = loader.load_data(
+        dataframe=dataframe, metadata_table=pathways_program_table, primary_key="id"
+    )
+
+    query_results = database_session.execute(
+        select([pathways_program_table])
+    ).fetchall()
+
+    assert loaded_ids == ["b-1", "b-2", "b-4"]
+    assert sorted(program.id for program in query_results) == ["b-1", "b-2", "b-4"]
+    assert log_row_error.call_count == 1
+    assert log_row_error.call_args[0][1] == "b-3"
+
+
+def test_load_data_with_copy(loader, database_session, pathways_program_table):
+    loader.copy_threshold = 2
+    dataframe = make_pathways_dataframe(["c-1", "c-2", "c-2"])
+
+    loaded_ids = loader.load_data(
+        dataframe=dataframe, metadata_table=pathways_program_table, primary_key="id"
+    )
+
+    query_results = database_session.execute(
+        select([pathways_program_table])
+    ).fetchall()
+
+    assert loaded_ids == ["c-1", "c-2"]
+    assert sorted(program.id for program in query_results) == ["c-1", "c-2"]
+
+
+def test_load_data_with_copy_falls_back_to_batches(
+    mocker, loader, database_session, pathways_program_table
+):
+    loader.copy_threshold = 2
+    load_batch = mocker.spy(loader, "_load_batch")
+    dataframe = make_pathways_dataframe(["d-1", "d-2", "d-3"])
+    # A missing `updated_at` violates NOT NULL, which fails the whole COPY.
+    dataframe.loc[0, "updated_at"] = None
+
+    loaded_ids = loader.load_data(
+        dataframe=dataframe, metadata_table=pathways_program_table, primary_key="id"
+    )
+
+    query_results = database_session.execute(
+        select([pathways_program_table])
+    ).fetchall()
+
+    assert loaded_ids == ["d-2", "d-3"]
+    assert sorted(program.id for program in query_results) == ["d-2", "d-3"]
+    # The COPY failed, i.e., fell back to batches.
+    assert load_batch.call_count > 0
+
+
+def test_load_data_with_copy_skips_rows_without_key(
+    mocker, loader, database_session, pathways_program_table
+):
+    loader.copy_threshold = 2
+    load_batch = mocker.spy(loader, "_load_batch")
+    dataframe = make_pathways_dataframe(["g-1", None, "g-2", ""])
+
+    loaded_ids = loader.load_data(
+        dataframe=dataframe, metadata_table=pathways_program_table, primary_key="id"
+    )
+
+    query_results = database_session.execute(
+        select([pathways_program_table])
+    ).fetchall()
+
+    assert loaded_ids == ["g-1", "g-2"]
+    assert sorted(program.id for program in query_results) == ["g-1", "g-2"]
+    # The COPY did not fail, i.e., did not fall back to batches.
+    assert load_batch.call_count == 0
+
+
+def test_load_batches_marks_batches_committed(
+    loader, database_session, pathways_program_table, etl_state
+):
+    loader.batch_size = 2
+    dataframe = make_pathways_dataframe(["e-1", "e-2", "e-3"])
+    dataframe.loc[2, "updated_at"] = None
+    batches = dict(enumerate(loader.make_batches(dataframe)))
+    checkpoint = etl_state.start_run(WatermarkBounds(), batches=batches)
+
+    loaded_ids = loader.load_batches(
+        {0: batches[0]},
+        metadata_table=pathways_program_table,
+        primary_key="id",
+        checkpoint=checkpoint,
+    )
+
+    assert loaded_ids == ["e-1", "e-2"]
+    assert list(checkpoint.get_batches(committed=False)) == [1]
+
+    loaded_ids = loader.load_batches(
+        checkpoint.get_batches(committed=False),
+        metadata_table=pathways_program_table,
+        primary_key="id",
+        checkpoint=checkpoint,
+    )
+
+    assert loaded_ids == []
+    assert checkpoint.get_batches(committed=False) == {}
+    assert checkpoint.get_loaded_ids() == ["e-1", "e-2"]
@@ -0,0 +1,111 @@
+import logging
+import time
+
+from etl.utils.log_handlers import BatchingHandler, DeferredHandler, RowErrorSummary
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def make_logger(name, handler):
+    test_logger = logging.getLogger(name)
+    test_logger.propagate = False
+    test_logger.handlers = [handler]
+    test_logger.setLevel(logging.INFO)
+
+    return test_logger
+
+
+def test_batching_handler():
+    target = RecordingHandler()
+    batching_handler = BatchingHandler(target, capacity=3, flush_interval=60)
+    test_logger = make_logger("test_batching_handler", batching_handler)
+
+    test_logger.info("one")
+    test_logger.error("two")
+    test_logger.info("three")
+    test_logger.info("four")
+
+    assert len(target.records) == 1
+    assert target.records[0].getMessage() == "one\ntwo\nthree"
+    assert target.records[0].levelno == logging.ERROR
+
+    batching_handler.flush()
+
+    assert target.records[1].getMessage() == "four"
+
+
+def test_batching_handler_flushes_after_interval():
+    """The batch goes out after `flush_interval`, without another record."""
+    target = RecordingHandler()
+    batching_handler = BatchingHandler(target, capacity=3, flush_interval=0.05)
+    test_logger = make_logger("test_batching_handler_interval", batching_handler)
+
+    test_logger.info("one")
+    deadline = time.monotonic() + 5
+    while not target.records and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert [record.getMessage() for record in target.records] == ["one"]
+
+
+def test_batching_handler_keeps_tracebacks():
+    target = RecordingHandler()
+    batching_handler = BatchingHandler(target, capacity=2, flush_interval=60)
+    test_logger = make_logger("test_batching_handler_tracebacks", batching_handler)
+
+    try:
+        raise ValueError("bad row")
+    except ValueError:
+        test_logger.exception("one")
+    test_logger.info("two")
+
+    message = target.records[0].getMessage()
+    assert message.startswith("one\nTraceback (most recent call last):")
+    assert "ValueError: bad row\ntwo" in message
+
+
+def test_deferred_handler(mocker):
+    target = RecordingHandler()
+    make_handler = mocker.Mock(return_value=target)
+    deferred_handler = DeferredHandler(make_handler)
+    test_logger = make_logger("test_deferred_handler", deferred_handler)
+
+    assert not make_handler.called
+
+    test_logger.info("one")
+    test_logger.info("two")
+
+    make_handler.assert_called_once_with()
+    assert [record.getMessage() for record in target.records] == ["one", "two"]
+
+
+def test_row_error_summary():
+    target = RecordingHandler()
+    row_error_summary = RowErrorSummary(sample_size=2)
+    target.addFilter(row_error_summary)
+    test_logger = make_logger("test_row_error_summary", target)
+
+    test_logger.info("----Running ETL")
+    for row_id in ["a", "b", "c"]:
+        test_logger.error(
+            "Bad row", extra={"row_id": row_id, "error_type": "InvalidPathwaysData"}
+        )
+    test_logger.error("Bad row", extra={"row_id": "d", "error_type": "ValueError"})
+
+    assert [record.getMessage() for record in target.records] == ["----Running ETL"]
+    assert row_error_summary.summarize() == (
+        "Could not process 4 rows:\n"
+        "3 x InvalidPathwaysData (e.g., rows a, b)\n"
+        "1 x ValueError (e.g., rows d)"
+    )
+
+    row_error_summary.reset()
+
+    assert row_error_summary.summarize() is None
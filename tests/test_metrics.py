@@ -0,0 +1,120 @@
+import json
+import os
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from etl.utils.metrics import RunMetrics
+
+
+def test_stage():
+    metrics = RunMetrics()
+
+    with metrics.stage("load") as stage:
+        stage.rows_in = 3
+        stage.rows_out = 2
+        stage.rows_rejected = 1
+
+    stage = metrics.stages["load"]
+    assert stage.wall_seconds > 0
+    assert stage.peak_rss_bytes > 0
+    assert (stage.rows_in, stage.rows_out, stage.rows_rejected) == (3, 2, 1)
+
+
+@pytest.mark.skipif(
+    not os.path.exists("/proc/self/statm"), reason="samples the memory from /proc"
+)
+def test_stage_peak_rss_is_per_stage():
+    """The memory of an earlier stage (that has been freed since) does not
+    count toward the peak of the next one."""
+    metrics = RunMetrics()
+
+    with metrics.stage("extract"):
+        sheet = bytearray(200 * 1024 * 1024)
+    del sheet
+    with metrics.stage("load"):
+        pass
+
+    assert (
+        metrics.stages["load"].peak_rss_bytes
+        < metrics.stages["extract"].peak_rss_bytes - 100 * 1024 * 1024
+    )
+
+
+def test_instrument_engine():
+    metrics = RunMetrics()
+    engine = create_engine("sqlite://")
+    metrics.instrument_engine(engine)
+
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        connection.execute(text("select 2"))
+
+    assert metrics.db_statements["SELECT"].count == 2
+
+
+def test_reset_keeps_engine_instrumented():
+    metrics = RunMetrics()
+    engine = create_engine("sqlite://")
+    metrics.instrument_engine(engine)
+
+    with metrics.stage("load"):
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+    metrics.reset()
+
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+    assert metrics.stages == {}
+    assert metrics.db_statements["SELECT"].count == 1
+
+
+def test_write_textfile(tmp_path):
+    metrics = RunMetrics()
+    with metrics.stage("extract"):
+        pass
+    with metrics.stage("load"):
+        pass
+    metrics.record_sheets_api_call(0.25)
+    metrics.record_sheets_api_call(0.5)
+
+    path = tmp_path / "goodwill_etl.prom"
+    metrics.write_textfile(str(path))
+    lines = path.read_text().splitlines()
+
+    assert "goodwill_etl_sheets_api_calls 2" in lines
+    assert "goodwill_etl_sheets_api_max_seconds 0.5" in lines
+    # The samples of each metric are next to each other.
+    wall_time_lines = [
+        line for line in lines if line.startswith("goodwill_etl_stage_wall_seconds")
+    ]
+    assert wall_time_lines[0].startswith(
+        'goodwill_etl_stage_wall_seconds{stage="extract"}'
+    )
+    assert lines.index(wall_time_lines[1]) == lines.index(wall_time_lines[0]) + 1
+    assert [file_path.name for file_path in tmp_path.iterdir()] == ["goodwill_etl.prom"]
+
+
+def test_to_prometheus_text_escapes_label_values():
+    metrics = RunMetrics()
+    with metrics.stage('load "a\\b"\nc'):
+        pass
+
+    assert (
+        'goodwill_etl_stage_rows_in{stage="load \\"a\\\\b\\"\\nc"} 0'
+        in metrics.to_prometheus_text().splitlines()
+    )
+
+
+def test_write_json(tmp_path):
+    metrics = RunMetrics()
+    with metrics.stage("extract") as stage:
+        stage.rows_out = 10
+
+    path = tmp_path / "run.json"
+    metrics.write_json(str(path))
+    run_record = json.loads(path.read_text())
+
+    assert run_record["stages"][0]["name"] == "extract"
+    assert run_record["stages"][0]["rows_out"] == 10
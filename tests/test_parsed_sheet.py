@@ -0,0 +1,30 @@
+from etl.parsed_sheet import ParsedSheet
+
+
+def test_from_sheet(google_sheet_data):
+    parsed_sheet = ParsedSheet.from_sheet(google_sheet_data)
+
+    assert parsed_sheet.headers == google_sheet_data[0]
+    assert parsed_sheet.header_index["Timestamp"] == 0
+    assert ParsedSheet.from_sheet(parsed_sheet) is parsed_sheet
+
+
+def test_row_identifiers_and_pathways_mask():
+    parsed_sheet = ParsedSheet.from_list(
+        [
+            [
+                "Should this program be available in Google Pathways?",
+                "Row Identifier (DO NOT EDIT)",
+            ],
+            ["Yes", "5f109a01-87c6"],
+            ["No", "663dfe-4aca"],
+            ["No"],
+        ]
+    )
+
+    assert parsed_sheet.row_identifiers.tolist() == [
+        "5f109a01-87c6",
+        "663dfe-4aca",
+        None,
+    ]
+    assert parsed_sheet.pathways_mask.tolist() == [True, False, False]
@@ -1,8 +1,13 @@
 import pandas as pd
 import pytest
 
-from etl.transformers.pathways_transformer import PathwaysTransformer
+from etl.transformers.pathways_transformer import (
+    ConversionPool,
+    PathwaysTransformer,
+    compile_field_positions,
+)
 from etl.utils.errors import InvalidPathwaysData
+from etl.utils.utils import make_dataframe_with_headers
 
 
 def test_filter_non_pathways_programs():
@@ -183,3 +188,89 @@ def test_convert_duration_to_isoformat_error(input):
             'The program does not have parseable input in "Duration / Time to complete"'
             in str(exceptionMsg.value)
         )
+
+
+def test_normalize_fields():
+    durations = ["14 days", "5 weeks", "6 months", "1 week", "Full Time", ""]
+    df = pd.DataFrame(
+        {
+            "Duration / Time to complete": durations,
+            "HS diploma required?": ["Yes", "No", "", "Yes", "No", "No"],
+            "Apprenticeship or Paid Training Available": ["Yes", "No"] * 3,
+        }
+    )
+    transformer = PathwaysTransformer(dataframe=df)
+
+    normalized = transformer._normalize_fields(df)
+
+    assert normalized["time_to_complete"].tolist()[:3] == ["P14D", "P5W", "P6M"]
+    assert normalized["time_to_complete"][3:].isna().all()
+    assert normalized["rejection_reason"][:3].isna().all()
+    assert (
+        normalized["rejection_reason"][3:]
+        .str.contains('"Duration / Time to complete"', regex=False)
+        .all()
+    )
+    assert normalized["hs_diploma_required"].tolist() == [
+        True,
+        False,
+        False,
+        True,
+        False,
+        False,
+    ]
+    assert normalized["paid_training_available"].tolist() == [True, False] * 3
+    assert list(normalized) == [
+        "time_to_complete",
+        "hs_diploma_required",
+        "paid_training_available",
+        "rejection_reason",
+    ]
+
+
+def test_compile_field_positions():
+    columns = ["Timestamp", "Program Name", "Goodwill Member Name"]
+    fields = {"provider_name": "Goodwill Member Name", "program_name": "Program Name"}
+
+    assert compile_field_positions(columns, fields) == [
+        ("provider_name", 2),
+        ("program_name", 1),
+    ]
+
+
+def test_pathways_transform_in_parallel(google_sheet_data):
+    """Test that converting programs in a pool of processes gives the same
+    rows, in the same order, as converting them in one process."""
+    headers, row = google_sheet_data
+    duration_position = headers.index("Duration / Time to complete")
+    id_position = headers.index("Row Identifier (DO NOT EDIT)")
+
+    sheet = [headers]
+    for count, duration in enumerate(["5 weeks", "", "6 months", "14 days"]):
+        new_row = list(row)
+        new_row[duration_position] = duration
+        new_row[id_position] = f"row-{count}"
+        sheet.append(new_row)
+
+    df = make_dataframe_with_headers(sheet)
+
+    serial_results = PathwaysTransformer(dataframe=df).pathways_transform()
+    parallel_results = PathwaysTransformer(dataframe=df).pathways_transform(workers=2)
+
+    assert parallel_results["id"].tolist() == ["row-0", "row-2", "row-3"]
+    assert parallel_results.equals(serial_results)
+
+
+def test_pathways_transform_reuses_pool(google_sheet_data):
+    """Test that one ConversionPool serves several transformations, e.g., one
+    per chunk of the pipelined mode."""
+    df = make_dataframe_with_headers(google_sheet_data)
+    serial_results = PathwaysTransformer(dataframe=df).pathways_transform()
+
+    with ConversionPool(2) as pool:
+        for _ in range(2):
+            parallel_results = PathwaysTransformer(dataframe=df).pathways_transform(
+                pool=pool
+            )
+
+            assert parallel_results.equals(serial_results)
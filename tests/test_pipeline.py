@@ -0,0 +1,79 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select
+
+from etl.pipeline import Pipeline
+
+
+def test_pipeline_run(
+    mocker, google_sheet_data, etl_state, database_session, pathways_program_table
+):
+    headers, row = google_sheet_data
+    duration_position = headers.index("Duration / Time to complete")
+    id_position = headers.index("Row Identifier (DO NOT EDIT)")
+
+    sheet = [headers]
+    for count in range(5):
+        new_row = list(row)
+        new_row[duration_position] = "5 weeks"
+        new_row[id_position] = f"row-{count}"
+        sheet.append(new_row)
+
+    extractor = mocker.Mock()
+    extractor.iter_rows.return_value = iter(sheet)
+
+    pipeline = Pipeline(
+        extractor=extractor,
+        engine=etl_state.engine,
+        programs_table=pathways_program_table,
+        chunk_size=2,
+    )
+    loaded_ids = asyncio.run(pipeline.run())
+
+    query_results = database_session.execute(
+        select([pathways_program_table])
+    ).fetchall()
+
+    assert loaded_ids == ["row-0", "row-1", "row-2", "row-3", "row-4"]
+    assert sorted(program.id for program in query_results) == loaded_ids
+    assert "Goodwill of Springfield" in etl_state.get_watermarks()
+
+
+def test_extract_keeps_only_the_opt_out_columns(mocker):
+    sheet = [
+        [
+            "Program Name",
+            "Row Identifier (DO NOT EDIT)",
+            "Should this program be available in Google Pathways?",
+        ],
+        ["Youth Employment", "3f109a01", "Yes"],
+        ["Sales Training", "663dfe"],
+        ["Welding", "5f109a01", "No"],
+    ]
+    extractor = mocker.Mock()
+    extractor.iter_rows.return_value = iter(sheet)
+    pipeline = Pipeline(
+        extractor=extractor, engine=None, programs_table=None, chunk_size=2
+    )
+
+    async def extract():
+        pipeline._executor = ThreadPoolExecutor(max_workers=1)
+        chunks = asyncio.Queue()
+        opt_out_rows = await pipeline._extract(chunks)
+        chunk_count = chunks.qsize() - 1
+        pipeline._executor.shutdown()
+        return opt_out_rows, chunk_count
+
+    opt_out_rows, chunk_count = asyncio.run(extract())
+
+    assert opt_out_rows == [
+        [
+            "Row Identifier (DO NOT EDIT)",
+            "Should this program be available in Google Pathways?",
+        ],
+        ["3f109a01", "Yes"],
+        ["663dfe", None],
+        ["5f109a01", "No"],
+    ]
+    assert chunk_count == 2
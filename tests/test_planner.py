@@ -0,0 +1,88 @@
+from sqlalchemy import select
+
+from etl.planner import Planner
+
+
+def test_plan(
+    google_sheet_data,
+    database_session,
+    pathways_program_table,
+    pathways_programs,
+    loader,
+):
+    """The database has two programs (see the `pathways_programs` fixture),
+    which a run deletes before it filters the sheet: no row is skipped."""
+    headers, row = google_sheet_data
+    timestamp_position = headers.index("Timestamp")
+    duration_position = headers.index("Duration / Time to complete")
+    pathways_position = headers.index(
+        "Should this program be available in Google Pathways?"
+    )
+    id_position = headers.index("Row Identifier (DO NOT EDIT)")
+
+    new_row = list(row)
+    new_row[timestamp_position] = "03/25/2020 07:25:37"
+    new_row[duration_position] = "5 weeks"
+
+    opted_out_row = list(new_row)
+    opted_out_row[pathways_position] = "No"
+    opted_out_row[id_position] = "663dfe-4aca"
+
+    old_row = list(new_row)
+    old_row[timestamp_position] = "03/01/2020 07:25:37"
+    old_row[id_position] = "aa01-old"
+
+    plan = Planner(
+        sheet=[headers, new_row, opted_out_row, old_row],
+        programs_table=pathways_program_table,
+        engine=loader.engine,
+    ).plan()
+
+    assert plan == {
+        "inserted": ["3f109a01-87c6-4899-bfd0-63db86acae11", "aa01-old"],
+        "updated": [],
+        "unchanged": [],
+        "skipped": [],
+        "deleted": ["5f109a01-87c6"],
+        "opted_out": ["663dfe-4aca"],
+    }
+
+    query_results = database_session.execute(
+        select([pathways_program_table])
+    ).fetchall()
+
+    assert sorted(program.id for program in query_results) == [
+        "5f109a01-87c6",
+        "663dfe-4aca",
+    ]
+
+
+def test_plan_filters_after_the_deletes(
+    google_sheet_data, pathways_program_table, pathways_programs, loader
+):
+    """The latest `updated_at` ("2020-03-23 15:10:50") belongs to a program
+    that the run deletes, so the sheet gets filtered against the other one
+    ("2020-02-01 1:31:10")."""
+    headers, row = google_sheet_data
+    timestamp_position = headers.index("Timestamp")
+    duration_position = headers.index("Duration / Time to complete")
+    id_position = headers.index("Row Identifier (DO NOT EDIT)")
+
+    kept_row = list(row)
+    kept_row[timestamp_position] = "01/15/2020 07:25:37"
+    kept_row[duration_position] = "5 weeks"
+    kept_row[id_position] = "663dfe-4aca"
+
+    new_row = list(kept_row)
+    new_row[timestamp_position] = "03/01/2020 07:25:37"
+    new_row[id_position] = "aa01-new"
+
+    plan = Planner(
+        sheet=[headers, kept_row, new_row],
+        programs_table=pathways_program_table,
+        engine=loader.engine,
+    ).plan()
+
+    assert plan["inserted"] == ["aa01-new"]
+    assert plan["skipped"] == ["663dfe-4aca"]
+    assert plan["deleted"] == ["5f109a01-87c6"]
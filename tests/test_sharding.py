@@ -0,0 +1,92 @@
+import pytest
+from sqlalchemy import literal, select
+
+from etl.parsed_sheet import ParsedSheet
+from etl.sharding import Shard, ShardWorker, combine_shard_summaries, get_shard_of_id
+
+PROGRAM_IDS = [f"row-{count}" for count in range(8)]
+
+
+@pytest.fixture
+def sharded_sheet(google_sheet_data):
+    headers, row = google_sheet_data
+    duration_position = headers.index("Duration / Time to complete")
+    id_position = headers.index("Row Identifier (DO NOT EDIT)")
+
+    sheet = [headers]
+    for program_id in PROGRAM_IDS:
+        new_row = list(row)
+        new_row[duration_position] = "5 weeks"
+        new_row[id_position] = program_id
+        sheet.append(new_row)
+
+    return sheet
+
+
+def test_get_shard_of_id_agrees_with_sql(loader):
+    with loader.engine.connect() as connection:
+        for program_id in PROGRAM_IDS:
+            shard = Shard(get_shard_of_id(program_id, 3), 3)
+
+            assert connection.execute(
+                select([shard.sql_filter(literal(program_id))])
+            ).scalar()
+
+
+def test_select_rows(sharded_sheet):
+    parsed_sheet = ParsedSheet.from_list(sharded_sheet)
+
+    shard_ids = [
+        list(Shard(index, 3).select_rows(parsed_sheet).row_identifiers)
+        for index in range(3)
+    ]
+
+    assert sorted(sum(shard_ids, [])) == PROGRAM_IDS
+    for index, program_ids in enumerate(shard_ids):
+        assert all(
+            get_shard_of_id(program_id, 3) == index for program_id in program_ids
+        )
+
+
+def test_shard_workers(
+    sharded_sheet, etl_state, database_session, pathways_program_table
+):
+    def make_worker():
+        return ShardWorker(
+            sheet=sharded_sheet,
+            engine=etl_state.engine,
+            programs_table=pathways_program_table,
+            run_id="run-1",
+            shard_count=3,
+        )
+
+    first_processed = make_worker().run()
+    second_processed = make_worker().run()
+
+    query_results = database_session.execute(
+        select([pathways_program_table])
+    ).fetchall()
+
+    assert first_processed == [0, 1, 2]
+    assert second_processed == []
+    assert sorted(program.id for program in query_results) == PROGRAM_IDS
+
+    totals = combine_shard_summaries(
+        engine=etl_state.engine, run_id="run-1", shard_count=3
+    )
+
+    assert totals["inserted"] == len(PROGRAM_IDS)
+    assert totals["missing_shards"] == []
+    assert "Goodwill of Springfield" in etl_state.get_watermarks()
+
+
+def test_opt_out_in_shard(opt_out, database_session, pathways_programs):
+    """The sheet of the `opt_out` fixture has neither of the programs of the
+    `pathways_programs` fixture, which fall in different shards: only the
+    one in the shard gets deleted."""
+    opt_out.shard = Shard(get_shard_of_id("5f109a01-87c6", 2), 2)
+
+    deleted_ids = opt_out.remove_deleted_programs()
+
+    assert get_shard_of_id("663dfe-4aca", 2) != opt_out.shard.index
+    assert deleted_ids == ["5f109a01-87c6"]
@@ -0,0 +1,18 @@
+from benchmarks.sheet_generator import HEADERS, generate_sheet
+from etl.utils.utils import make_dataframe_with_headers
+
+
+def test_generate_sheet():
+    sheet = generate_sheet(500, seed=1)
+    df = make_dataframe_with_headers(sheet)
+
+    assert sheet == generate_sheet(500, seed=1)
+    assert sheet[0] == HEADERS
+    assert df.shape == (500, len(HEADERS))
+    assert any(len(row) < len(HEADERS) for row in sheet[1:])
+    assert (
+        df["Program Address (if different from organization address)"]
+        .str.contains("|", regex=False)
+        .any()
+    )
+    assert set(df["Apprenticeship or Paid Training Available"]) == {"Yes", "No"}
@@ -0,0 +1,107 @@
+from etl.parsed_sheet import ParsedSheet
+from etl.snapshot import SheetSnapshot
+from etl.transformers.dataframe_transformer import DataframeTransformer
+
+HEADERS = ["Timestamp", "Program Name", "Row Identifier (DO NOT EDIT)"]
+
+
+def make_sheet(rows):
+    return ParsedSheet.from_list([HEADERS] + rows)
+
+
+def test_diff_without_snapshot(tmp_path):
+    snapshot = SheetSnapshot(str(tmp_path / "snapshot.npz"))
+
+    assert (
+        snapshot.diff(make_sheet([["03/18/2020 07:25:37", "Welding", "a-1"]])) is None
+    )
+
+
+def test_diff(tmp_path):
+    snapshot = SheetSnapshot(str(tmp_path / "snapshot.npz"))
+    snapshot.save(
+        make_sheet(
+            [
+                ["03/18/2020 07:25:37", "Welding", "a-1"],
+                ["03/18/2020 07:25:37", "Sales Training", "a-2"],
+                ["03/18/2020 07:25:37", "Youth Employment", "a-3"],
+            ]
+        )
+    )
+
+    snapshot_diff = snapshot.diff(
+        make_sheet(
+            [
+                ["03/18/2020 07:25:37", "Welding", "a-1"],
+                # Edited in a local sheet, without a new Timestamp.
+                ["03/18/2020 07:25:37", "Sales and Marketing Training", "a-2"],
+                ["03/19/2020 10:00:00", "Forklift Certification", "a-4"],
+                ["03/19/2020 10:00:00", "Entered by hand"],
+            ]
+        )
+    )
+
+    assert snapshot_diff.mask.tolist() == [False, True, True, True]
+    assert snapshot_diff.added_ids == ["a-4"]
+    assert snapshot_diff.changed_ids == ["a-2"]
+    assert snapshot_diff.removed_ids == ["a-3"]
+
+
+def test_diff_after_headers_change(tmp_path):
+    snapshot = SheetSnapshot(str(tmp_path / "snapshot.npz"))
+    snapshot.save(make_sheet([["03/18/2020 07:25:37", "Welding", "a-1"]]))
+
+    snapshot_diff = snapshot.diff(
+        ParsedSheet.from_list(
+            [HEADERS + ["Format"], ["03/18/2020 07:25:37", "Welding", "a-1"]]
+        )
+    )
+
+    assert snapshot_diff.changed_ids == ["a-1"]
+
+
+def test_save_keeps_previous_hashes_of_failed_rows(tmp_path):
+    """A row that was not loaded gets picked up again by the next diff."""
+    snapshot = SheetSnapshot(str(tmp_path / "snapshot.npz"))
+    snapshot.save(
+        make_sheet(
+            [
+                ["03/18/2020 07:25:37", "Welding", "a-1"],
+                ["03/18/2020 07:25:37", "Sales Training", "a-2"],
+            ]
+        )
+    )
+    sheet = make_sheet(
+        [
+            ["03/18/2020 07:25:37", "Welding", "a-1"],
+            ["03/18/2020 07:25:37", "Sales and Marketing Training", "a-2"],
+            ["03/19/2020 10:00:00", "Forklift Certification", "a-3"],
+        ]
+    )
+
+    snapshot.save(sheet, failed_ids={"a-2", "a-3"})
+    snapshot_diff = snapshot.diff(sheet)
+
+    assert snapshot_diff.mask.tolist() == [False, True, True]
+    assert snapshot_diff.added_ids == ["a-3"]
+    assert snapshot_diff.changed_ids == ["a-2"]
+
+
+def test_transform_with_snapshot_diff(google_sheet_data, tmp_path):
+    """The Timestamp of the row is older than any watermark, but the row
+    changed since the snapshot."""
+    headers, row = google_sheet_data
+    name_position = headers.index("Program Name")
+    snapshot = SheetSnapshot(str(tmp_path / "snapshot.npz"))
+    snapshot.save(ParsedSheet.from_list([headers, row]))
+
+    edited_row = list(row)
+    edited_row[name_position] = "Youth Employment and Training"
+    parsed_sheet = ParsedSheet.from_list([headers, row, edited_row])
+    transformer = DataframeTransformer(
+        sheet=parsed_sheet, engine=None, snapshot_diff=snapshot.diff(parsed_sheet)
+    )
+
+    dataframe = transformer.transform()
+
+    assert dataframe["Program Name"].tolist() == ["Youth Employment and Training"]
@@ -0,0 +1,44 @@
+import os
+import pickle
+
+from sqlalchemy import MetaData
+
+from etl.utils.startup_cache import FileDiscoveryCache, reflect_table
+
+
+def test_file_discovery_cache(tmp_path):
+    discovery_cache = FileDiscoveryCache(str(tmp_path))
+    url = "https://sheets.googleapis.com/$discovery/rest?version=v4"
+
+    assert discovery_cache.get(url) is None
+
+    discovery_cache.set(url, '{"name": "sheets"}')
+
+    assert discovery_cache.get(url) == '{"name": "sheets"}'
+
+    discovery_cache.max_age = -1
+
+    assert discovery_cache.get(url) is None
+
+
+def test_reflect_table_with_cache(tmp_path, loader):
+    cache_path = str(tmp_path / "pathways_program.pickle")
+
+    reflected_table = reflect_table(loader.engine, "pathways_program", cache_path)
+    cached_table = reflect_table(loader.engine, "pathways_program", cache_path)
+
+    assert os.path.exists(cache_path)
+    assert [column.name for column in cached_table.columns] == [
+        column.name for column in reflected_table.columns
+    ]
+    assert cached_table is not reflected_table
+
+
+def test_reflect_table_with_stale_cache(tmp_path, loader):
+    cache_path = str(tmp_path / "pathways_program.pickle")
+    with open(cache_path, "wb") as cache_file:
+        pickle.dump({"fingerprint": "stale", "metadata": MetaData()}, cache_file)
+
+    table = reflect_table(loader.engine, "pathways_program", cache_path)
+
+    assert "pathways_program" in [column.name for column in table.columns]
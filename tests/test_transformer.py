@@ -1,3 +1,6 @@
+from datetime import datetime
+
+import pandas as pd
 import pytest
 from sqlalchemy.engine import Connection, Engine, ResultProxy, RowProxy
 
@@ -43,6 +46,41 @@ def test_handle_dates(transformer):
     assert transformed_df["End Date(s)"][1] == ["2021-12-15"]
 
 
+def test_handle_dates_matches_formatting_functions(transformer):
+    """Test that the vectorized `_handle_dates` formats dates exactly like
+    `_format_date_or_invalid` and `_format_startdates_and_enddates`."""
+    dates = [
+        "12/15/2019",
+        "12/15/2019 21:00:00",
+        " 7/01/2019 ",
+        "01/15/2019; 12/15/2020; 7/01/2019",
+        "Open Enrollment; 10/05/2020",
+        "13/45/2020",
+        "12/15/19",
+        "01/01/3000",
+        "",
+    ]
+    df = pd.DataFrame(
+        {
+            "Application Deadline": dates,
+            "Start date(s)": dates,
+            "End Date(s)": list(reversed(dates)),
+        }
+    )
+
+    transformed_df = transformer._handle_dates(df.copy())
+
+    assert transformed_df["Application Deadline"].tolist() == [
+        transformer._format_date_or_invalid(date) for date in dates
+    ]
+    assert transformed_df["Start date(s)"].tolist() == [
+        transformer._format_startdates_and_enddates(date) for date in dates
+    ]
+    assert transformed_df["End Date(s)"].tolist() == [
+        transformer._format_startdates_and_enddates(date) for date in reversed(dates)
+    ]
+
+
 @pytest.mark.parametrize(
     "database_last_updated,evaluates_as",
     [("03/19/2020 07:25:00", True), ("03/16/2020 07:25:00", False)],
@@ -72,3 +110,97 @@ def test_filter_last_updated(
     filtered_df_count = df.shape[0]
 
     assert (filtered_df_count < full_df_count) == evaluates_as
+
+
+@pytest.mark.parametrize(
+    "watermarks,expected_count",
+    [
+        (
+            {
+                "Goodwill of Springfield": datetime(2020, 3, 19),
+                "*": datetime(2020, 3, 19),
+            },
+            0,
+        ),
+        (
+            {
+                "Goodwill of Springfield": datetime(2020, 3, 17),
+                "*": datetime(2020, 3, 19),
+            },
+            1,
+        ),
+        (
+            {
+                "Goodwill of Shelbyville": datetime(2020, 3, 19),
+                "*": datetime(2020, 3, 19),
+            },
+            1,
+        ),
+    ],
+)
+def test_filter_watermarks(mocker, transformer, watermarks, expected_count):
+    """The `google_sheet_data` fixture has one row, from "Goodwill of
+    Springfield", updated at "03/18/2020 07:25:37". A local Goodwill
+    without a watermark keeps all of its rows."""
+    transformer.state = mocker.Mock()
+    transformer.state.get_watermarks.return_value = watermarks
+
+    df = make_dataframe_with_headers(transformer.sheet)
+    df = transformer._filter_watermarks(df)
+
+    assert df.shape[0] == expected_count
+
+
+def test_filter_watermarks_after_an_interrupted_run(mocker, transformer):
+    """An interrupted first load has advanced the latest `updated_at`, so
+    no row gets filtered against it."""
+    transformer.state = mocker.Mock()
+    transformer.state.get_watermarks.return_value = {}
+    get_last_updated = mocker.patch.object(transformer, "_get_last_updated")
+
+    df = make_dataframe_with_headers(transformer.sheet)
+
+    assert transformer._filter_watermarks(df).shape[0] == df.shape[0]
+    assert not get_last_updated.called
+
+
+def test_transform_keeps_watermark_rows(mocker, transformer):
+    transformer.state = mocker.Mock()
+    transformer.state.get_watermarks.return_value = {
+        "Goodwill of Springfield": datetime(2020, 3, 17)
+    }
+
+    df = transformer.transform()
+
+    assert df["Start date(s)"].tolist() == [["2021-07-15"]]
+    assert transformer.watermark_rows["timestamp"].tolist() == [
+        datetime(2020, 3, 18, 7, 25, 37)
+    ]
+
+
+@pytest.mark.parametrize(
+    "done_ids,expected_watermarks",
+    [
+        (
+            None,
+            {
+                "Goodwill of Springfield": datetime(2020, 3, 18, 7, 25, 37),
+                "*": datetime(2020, 3, 18, 7, 25, 37),
+            },
+        ),
+        # e.g., the row was rejected, or could not be loaded.
+        ([], {}),
+    ],
+)
+def test_get_watermark_bounds(mocker, transformer, done_ids, expected_watermarks):
+    transformer.state = mocker.Mock()
+    transformer.state.get_watermarks.return_value = {
+        "Goodwill of Springfield": datetime(2020, 3, 17)
+    }
+    df = transformer.transform()
+    if done_ids is None:
+        done_ids = df["Row Identifier (DO NOT EDIT)"].tolist()
+
+    watermark_bounds = transformer.get_watermark_bounds(done_ids=done_ids)
+
+    assert watermark_bounds.get_watermarks() == expected_watermarks
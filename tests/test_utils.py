@@ -1,4 +1,4 @@
-from etl.utils.utils import make_dataframe_with_headers
+from etl.utils.utils import format_id_sample, make_dataframe_with_headers, object_column
 
 
 def test_make_dataframe_with_headers(google_sheet_data):
@@ -7,3 +7,45 @@ def test_make_dataframe_with_headers(google_sheet_data):
 
     for header in headers_in_dataframe:
         assert header in google_sheet_data[0]
+
+
+def test_make_dataframe_with_headers_pads_ragged_rows():
+    df = make_dataframe_with_headers(
+        [["Program Name", "Format", "Row Identifier (DO NOT EDIT)"], ["Welding"]]
+    )
+
+    assert df.index.tolist() == [1]
+    assert df.loc[1].tolist() == ["Welding", None, None]
+
+
+def test_make_dataframe_with_headers_compact():
+    df = make_dataframe_with_headers(
+        [
+            ["Organization Address", "Format"],
+            ["1 Grickle Grass Lane", "In person"],
+            ["1 Grickle Grass Lane", "Online"],
+            [None, "In person"],
+            ["2 Mulberry Street"],
+        ],
+        compact=True,
+    )
+
+    assert df["Format"].dtype.name == "category"
+    assert df["Organization Address"].tolist() == [
+        "1 Grickle Grass Lane",
+        "1 Grickle Grass Lane",
+        None,
+        "2 Mulberry Street",
+    ]
+    assert df["Organization Address"][1] is df["Organization Address"][2]
+    assert object_column(df["Format"]).tolist() == [
+        "In person",
+        "Online",
+        "In person",
+        None,
+    ]
+
+
+def test_format_id_sample():
+    assert format_id_sample(["a", "b"]) == "a b"
+    assert format_id_sample(["a", "b", "c"], sample_size=2) == "a b (and 1 more)"
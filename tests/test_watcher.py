@@ -0,0 +1,91 @@
+import pytest
+
+from etl.extractor import Extractor
+from etl.watcher import SheetWatcher, get_column_letter
+from tests.fake_sheets import FakeSheetsResource
+
+HEADERS = [
+    "Timestamp",
+    "Program Name",
+    "Should this program be available in Google Pathways?",
+    "Row Identifier (DO NOT EDIT)",
+]
+
+
+@pytest.fixture
+def fake_sheets(mocker):
+    resource = FakeSheetsResource(
+        {
+            "sheet-id": [
+                HEADERS,
+                ["3/18/2020 7:25:37", "Youth Employment", "Yes", "3f109a01"],
+                ["3/19/2020 9:02:11", "Sales Training", "Yes", "663dfe"],
+            ]
+        }
+    )
+    mocker.patch.object(Extractor, "_build_googleapi_resource", return_value=resource)
+
+    return resource
+
+
+@pytest.fixture
+def watcher(fake_sheets):
+    extractor = Extractor(google_account_info={}, spreadsheet_id="sheet-id")
+
+    return SheetWatcher(extractor, sleep=lambda seconds: None)
+
+
+@pytest.mark.parametrize(
+    "position,letters", [(0, "A"), (25, "Z"), (26, "AA"), (51, "AZ"), (52, "BA")]
+)
+def test_get_column_letter(position, letters):
+    assert get_column_letter(position) == letters
+
+
+def test_extractor_reads_fake_sheet(fake_sheets):
+    extractor = Extractor(google_account_info={}, spreadsheet_id="sheet-id")
+
+    assert extractor.get_sheet_as_list() == fake_sheets.sheets["sheet-id"]
+
+
+def test_run_if_changed(watcher, fake_sheets, mocker):
+    run = mocker.Mock()
+    sheet = fake_sheets.sheets["sheet-id"]
+
+    assert watcher.run_if_changed(run)
+
+    execute_count = fake_sheets.execute_count
+    assert not watcher.run_if_changed(run)
+    # Once the column positions are known, a poll takes one API call.
+    assert fake_sheets.execute_count == execute_count + 1
+
+    sheet[1][1] = "Youth Employment and Training"
+    assert not watcher.run_if_changed(run)
+
+    sheet[2][2] = "No"
+    assert watcher.run_if_changed(run)
+
+    sheet.append(["3/20/2020 8:00:00", "Welding", "Yes", "5f109a01"])
+    assert watcher.run_if_changed(run)
+
+    assert run.call_count == 3
+
+
+def test_run_if_changed_after_moved_columns(watcher, fake_sheets, mocker):
+    run = mocker.Mock()
+    watcher.run_if_changed(run)
+
+    fake_sheets.sheets["sheet-id"] = [
+        list(reversed(row)) for row in fake_sheets.sheets["sheet-id"]
+    ]
+
+    assert watcher.run_if_changed(run)
+    assert not watcher.run_if_changed(run)
+
+
+def test_watch_runs_again_after_failure(watcher, mocker):
+    run = mocker.Mock(side_effect=[RuntimeError("The database is down."), None])
+
+    watcher.watch(run, max_polls=3)
+
+    assert run.call_count == 2